@@ -0,0 +1,271 @@
+"""
+多维聚合立方体：(区域, 商圈, 户型, 月) 格子上的 条数 / 单价和 / 总价和 / 单价总价的最小值、最大值
+- 格子预先算好：JSON 模式由列式缓存构建，SQLite 模式生成文件时写入，MySQL 模式导入时按月增量合并
+- 查询 = 在格子上上卷：任选维度分组，其余维度合并（条数、和相加，最小 / 最大取最值），
+  代价只与格子数有关，与成交条数无关；下钻 = 多选一个维度，同时用上一级的取值过滤
+- 最小 / 最大值只统计 > 0 的价格（缺失价格按 0 计入均价，与其他统计口径一致，但不作为最小值）
+- 没有成交日期的记录不进入立方体
+"""
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from columnar import encode_categories, month_label
+
+# 可分组的维度；month 输出为 year_month
+CUBE_DIMENSIONS = ("region", "bizcircle", "layout", "month")
+_NAMED_DIMENSIONS = ("region", "bizcircle", "layout")
+
+# 存储格子时的字段顺序（SQLite / MySQL 表结构与之对应）
+CELL_FIELDS = (
+    "region",
+    "bizcircle",
+    "layout",
+    "year_month",
+    "count",
+    "unit_sum",
+    "total_sum",
+    "unit_min",
+    "unit_max",
+    "total_min",
+    "total_max",
+)
+
+# 查询结果中的指标字段（维度字段在前）
+MEASURE_FIELDS = (
+    "count",
+    "avg_unit_price_yuan_sqm",
+    "avg_total_price_wan",
+    "min_unit_price_yuan_sqm",
+    "max_unit_price_yuan_sqm",
+    "min_total_price_wan",
+    "max_total_price_wan",
+    "sum_total_price_wan",
+)
+
+
+def month_index_of(year_month: str) -> int:
+    """"YYYY-MM" -> year * 12 + month - 1"""
+    year, month = year_month.split("-")[:2]
+    return int(year) * 12 + int(month) - 1
+
+
+def _as_array(values, fill=np.nan) -> np.ndarray:
+    """含 None 的数值序列 -> float64 数组（None 为 fill）"""
+    return np.fromiter(
+        (fill if v is None else float(v) for v in values), dtype=np.float64, count=len(values)
+    )
+
+
+def _reduce(key: np.ndarray, measures: Dict[str, np.ndarray]) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """
+    按 key 分组合并：count / *_sum 相加（按数组顺序累加），*_min / *_max 忽略 NaN 取最值
+    返回 (升序的唯一 key, 每组的指标)
+    """
+    keys, inverse = np.unique(key, return_inverse=True)
+    size = len(keys)
+    merged = {
+        "count": np.bincount(inverse, weights=measures["count"], minlength=size).astype(np.int64),
+        "unit_sum": np.bincount(inverse, weights=measures["unit_sum"], minlength=size),
+        "total_sum": np.bincount(inverse, weights=measures["total_sum"], minlength=size),
+    }
+    if size:
+        order = np.argsort(inverse, kind="stable")
+        starts = np.flatnonzero(np.r_[True, np.diff(inverse[order]) != 0])
+        for name in ("unit_min", "total_min"):
+            merged[name] = np.fmin.reduceat(measures[name][order], starts)
+        for name in ("unit_max", "total_max"):
+            merged[name] = np.fmax.reduceat(measures[name][order], starts)
+    else:
+        for name in ("unit_min", "total_min", "unit_max", "total_max"):
+            merged[name] = np.zeros(0)
+    return keys, merged
+
+
+class CubeCells:
+    """单个城市的立方体格子（只读）：维度为分类编码（缺失为 -1）+ 月份序号，指标为数组"""
+
+    def __init__(
+        self,
+        names: Dict[str, List[str]],
+        codes: Dict[str, np.ndarray],
+        months: np.ndarray,
+        measures: Dict[str, np.ndarray],
+    ):
+        self.names = names
+        self.codes = codes
+        self.month = np.asarray(months, dtype=np.int64)
+        self.measures = measures
+        self._code_index = {
+            dim: {name: code for code, name in enumerate(dim_names)} for dim, dim_names in names.items()
+        }
+        self.month_min = int(self.month.min()) if len(self.month) else 0
+        self.month_span = int(self.month.max()) - self.month_min + 1 if len(self.month) else 1
+
+    def __len__(self) -> int:
+        return len(self.month)
+
+    # --- 构建 ---
+    @classmethod
+    def _grouped(cls, names, codes, months, measures) -> "CubeCells":
+        """按 (区域, 商圈, 户型, 月) 合并重复格子"""
+        months = np.asarray(months, dtype=np.int64)
+        month_min = int(months.min()) if len(months) else 0
+        key = np.zeros(len(months), dtype=np.int64)
+        for dim in _NAMED_DIMENSIONS:
+            key = key * (len(names[dim]) + 1) + (codes[dim].astype(np.int64) + 1)
+        span = int(months.max()) - month_min + 1 if len(months) else 1
+        key = key * span + (months - month_min)
+
+        keys, merged = _reduce(key, measures)
+        rest, month_offset = np.divmod(keys, span)
+        cell_codes = {}
+        for dim in reversed(_NAMED_DIMENSIONS):
+            rest, code = np.divmod(rest, len(names[dim]) + 1)
+            cell_codes[dim] = code - 1
+        return cls(names, cell_codes, month_offset + month_min, merged)
+
+    @classmethod
+    def from_codes(
+        cls,
+        names: Dict[str, List[str]],
+        codes: Dict[str, np.ndarray],
+        months: np.ndarray,
+        unit_prices: np.ndarray,
+        total_prices: np.ndarray,
+    ) -> "CubeCells":
+        """逐条记录（已编码，months 为 -1 表示无日期）-> 格子"""
+        dated = np.asarray(months) >= 0
+        unit = np.asarray(unit_prices, dtype=np.float64)[dated]
+        total = np.asarray(total_prices, dtype=np.float64)[dated]
+        unit_positive = np.where(unit > 0, unit, np.nan)
+        total_positive = np.where(total > 0, total, np.nan)
+        measures = {
+            "count": np.ones(len(unit)),
+            "unit_sum": unit,
+            "total_sum": total,
+            "unit_min": unit_positive,
+            "unit_max": unit_positive,
+            "total_min": total_positive,
+            "total_max": total_positive,
+        }
+        return cls._grouped(
+            names,
+            {dim: np.asarray(codes[dim])[dated] for dim in _NAMED_DIMENSIONS},
+            np.asarray(months)[dated],
+            measures,
+        )
+
+    @classmethod
+    def from_records(cls, records: Sequence[Sequence[Any]]) -> "CubeCells":
+        """[(区域, 商圈, 户型, year_month, 单价, 总价), ...] -> 格子（SQLite 生成 / MySQL 导入时使用）"""
+        columns = list(zip(*records)) if records else [()] * 6
+        names, codes = {}, {}
+        for dim, values in zip(_NAMED_DIMENSIONS, columns[:3]):
+            names[dim], codes[dim] = encode_categories(values)
+        months = np.fromiter(
+            (month_index_of(ym) if ym else -1 for ym in columns[3]), dtype=np.int64, count=len(records)
+        )
+        return cls.from_codes(names, codes, months, _as_array(columns[4], 0.0), _as_array(columns[5], 0.0))
+
+    @classmethod
+    def from_cells(cls, rows: Sequence[Sequence[Any]]) -> "CubeCells":
+        """按 CELL_FIELDS 顺序存储的格子 -> CubeCells（重复格子会合并，用于增量更新）"""
+        columns = list(zip(*rows)) if rows else [()] * len(CELL_FIELDS)
+        names, codes = {}, {}
+        for dim, values in zip(_NAMED_DIMENSIONS, columns[:3]):
+            names[dim], codes[dim] = encode_categories(values)
+        months = np.fromiter((month_index_of(ym) for ym in columns[3]), dtype=np.int64, count=len(rows))
+        measures = {
+            name: _as_array(values, 0.0 if name in ("count", "unit_sum", "total_sum") else np.nan)
+            for name, values in zip(CELL_FIELDS[4:], columns[4:])
+        }
+        return cls._grouped(names, codes, months, measures)
+
+    def to_cells(self) -> List[tuple]:
+        """格子 -> CELL_FIELDS 顺序的元组（缺失的维度 / 最值为 None），写入 SQLite / MySQL"""
+        labels = {dim: [None] + self.names[dim] for dim in _NAMED_DIMENSIONS}
+        columns = [
+            [labels[dim][c + 1] for c in self.codes[dim].tolist()] for dim in _NAMED_DIMENSIONS
+        ]
+        columns.append([month_label(m) for m in self.month.tolist()])
+        columns.append(self.measures["count"].tolist())
+        for name in CELL_FIELDS[5:]:
+            values = self.measures[name]
+            columns.append([None if v != v else v for v in values.tolist()])
+        return list(zip(*columns))
+
+    # --- 查询 ---
+    def mask(
+        self,
+        month_lo: Optional[int] = None,
+        month_hi: Optional[int] = None,
+        **equals: Optional[str],
+    ) -> np.ndarray:
+        """落在 [month_lo, month_hi] 内、且各维度等于给定名称的格子；名称不存在时没有格子匹配"""
+        m = np.ones(len(self.month), dtype=bool)
+        if month_lo is not None:
+            m &= self.month >= month_lo
+        if month_hi is not None:
+            m &= self.month <= month_hi
+        for dimension, name in equals.items():
+            if name:
+                code = self._code_index[dimension].get(name, -1)
+                if code < 0:
+                    return np.zeros(len(self.month), dtype=bool)
+                m &= self.codes[dimension] == code
+        return m
+
+    def rollup(self, group_by: Sequence[str], mask: np.ndarray) -> List[tuple]:
+        """
+        掩码内的格子按 group_by 维度上卷
+        返回 [(维度取值..., count, 均单价, 均总价, 最小单价, 最大单价, 最小总价, 最大总价, 总价和), ...]，
+        按维度编码升序（名称排序，缺失值在前；月份升序）；group_by 为空时只有一行全量汇总
+        """
+        key = np.zeros(int(mask.sum()), dtype=np.int64)
+        radix = []
+        for dim in group_by:
+            if dim == "month":
+                values, size = self.month[mask] - self.month_min, self.month_span
+            else:
+                values, size = self.codes[dim][mask].astype(np.int64) + 1, len(self.names[dim]) + 1
+            key = key * size + values
+            radix.append(size)
+
+        keys, merged = _reduce(key, {name: values[mask] for name, values in self.measures.items()})
+
+        rest, labels = keys, []
+        for dim, size in zip(reversed(group_by), reversed(radix)):
+            rest, code = np.divmod(rest, size)
+            if dim == "month":
+                labels.append([month_label(self.month_min + c) for c in code.tolist()])
+            else:
+                names = [None] + self.names[dim]
+                labels.append([names[c] for c in code.tolist()])
+        labels.reverse()
+
+        count = merged["count"].tolist()
+        unit_sum = merged["unit_sum"].tolist()
+        total_sum = merged["total_sum"].tolist()
+        extremes = [merged[name].tolist() for name in ("unit_min", "unit_max", "total_min", "total_max")]
+
+        records = []
+        for i, cnt in enumerate(count):
+            unit_min, unit_max, total_min, total_max = (values[i] for values in extremes)
+            records.append((
+                *(dim_labels[i] for dim_labels in labels),
+                cnt,
+                int(unit_sum[i] / cnt),
+                round(total_sum[i] / cnt, 2),
+                None if unit_min != unit_min else int(unit_min),
+                None if unit_max != unit_max else int(unit_max),
+                None if total_min != total_min else round(total_min, 2),
+                None if total_max != total_max else round(total_max, 2),
+                round(total_sum[i], 2),
+            ))
+        return records
+
+
+def result_fields(group_by: Sequence[str]) -> Tuple[str, ...]:
+    """上卷结果的字段顺序：维度（month 输出为 year_month）+ 指标"""
+    return tuple("year_month" if dim == "month" else dim for dim in group_by) + MEASURE_FIELDS
@@ -2,78 +2,171 @@ import os
 import json
 import re
 import time
+import base64
+import hmac
+import bisect
+import threading
 import html as _html
 from pathlib import Path
-from datetime import datetime
+from datetime import date, datetime
 from urllib.parse import urljoin
-from flask import Flask, jsonify, request, send_from_directory
-from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import func, text
-from sqlalchemy.exc import SQLAlchemyError
-import statistics
-
-try:
-    import requests
-except Exception:
-    requests = None
+import numpy as np
+from flask import (
+    Blueprint, Flask, Response, current_app, g, has_app_context, has_request_context, jsonify, request,
+    send_from_directory, stream_with_context,
+)
+import price_stats
+import aggregate_cube
+import comparables
+import downsample
+import export
+import json_provider
+import metrics
+import price_histogram
+import profiler
+import request_timing
+import slow_query
+import sqlite_source
+import result_cache
+from lazy_module import lazy_import
+
+# 以下依赖导入慢、又只在部分部署形态下用到，第一次访问时才导入（见 lazy_module.py）：
+# 数据模型连同 Flask-SQLAlchemy / SQLAlchemy 只有 MySQL 数据源用（auto 模式在 create_app() 里就会导入，
+# 省下的只是 json / sqlite 部署）；requests 只有新闻热榜用
+models = lazy_import("models")
+sa = lazy_import("sqlalchemy")
+requests = lazy_import("requests", optional=True)
 
 # === 配置部分 ===
-DB_USER = 'hp_user'
-DB_PASS = '123456'
-DB_HOST = '127.0.0.1'
-DB_NAME = 'house_price_db'
+# MySQL 连接配置见 models.py
 
-app = Flask(__name__)
+# 数据源：auto（MySQL -> SQLite -> JSON 依次回退）/ mysql / sqlite / json
+DATA_SOURCE = os.environ.get("HPQAQ_DATA_SOURCE", "auto").strip().lower()
 
-# 使用 pymysql 连接 MySQL（数据库可用时走这个；不可用则自动回退 JSON）
-app.config['SQLALCHEMY_DATABASE_URI'] = (
-    f'mysql+pymysql://{DB_USER}:{DB_PASS}@{DB_HOST}/{DB_NAME}?charset=utf8mb4'
-)
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['JSON_AS_ASCII'] = False
+# 统计结果缓存条数上限（0 表示不缓存）
+RESULT_CACHE_SIZE = int(os.environ.get("HPQAQ_RESULT_CACHE_SIZE", "512"))
+
+# JSON 编码器：auto（有 orjson 就用）/ orjson / stdlib
+JSON_ENCODER = os.environ.get("HPQAQ_JSON_ENCODER", "auto")
+
+# 请求耗时埋点（Server-Timing 响应头 + 按接口的分位数日志）：on / off
+TIMING = os.environ.get("HPQAQ_TIMING", "on").strip().lower() not in ("0", "off", "false", "no")
+
+# 分位数日志的输出间隔（秒），0 表示不输出
+TIMING_LOG_INTERVAL = float(os.environ.get("HPQAQ_TIMING_LOG_INTERVAL", "60"))
+
+# 多进程部署时各 worker 写指标快照的目录（/metrics 读取后合并）；为空表示只统计本进程
+METRICS_DIR = os.environ.get("HPQAQ_METRICS_DIR", "")
+
+# 启动预热的城市：all（CITY_JSON_MAP 中全部城市，默认）/ 逗号分隔的城市代码 / off（连数据库连接池也不预先打开）
+WARMUP_CITIES = os.environ.get("HPQAQ_WARMUP", "all").strip().lower()
+WARMUP_ENABLED = WARMUP_CITIES not in ("", "0", "off", "none", "false")
+
+# 慢查询日志阈值（毫秒），超过的 SQL 输出日志并在首次出现时 EXPLAIN；off 表示关闭
+_SLOW_QUERY_MS = os.environ.get("HPQAQ_SLOW_QUERY_MS", "500").strip().lower()
+SLOW_QUERY_MS = None if _SLOW_QUERY_MS in ("off", "") else float(_SLOW_QUERY_MS)
 
-db = SQLAlchemy(app)
+# 慢查询首次出现时是否执行 EXPLAIN：on / off
+SLOW_QUERY_EXPLAIN = os.environ.get("HPQAQ_SLOW_QUERY_EXPLAIN", "on").strip().lower() not in ("0", "off", "false", "no")
 
-# === 数据模型 (Model) ===
-class City(db.Model):
-    __tablename__ = 'cities'
-    id = db.Column(db.Integer, primary_key=True)
-    code = db.Column(db.String(20), unique=True, index=True)
-    name = db.Column(db.String(50))
+# 按需采样剖析（单个请求 / 全进程，仅管理员）：on / off
+PROFILER = os.environ.get("HPQAQ_PROFILER", "off").strip().lower() in ("1", "on", "true", "yes")
 
-class Region(db.Model):
-    __tablename__ = 'regions'
-    id = db.Column(db.Integer, primary_key=True)
-    city_code = db.Column(db.String(20), db.ForeignKey('cities.code'), index=True)
-    name = db.Column(db.String(50))
+# 管理接口（/api/admin/*）的访问令牌，请求头 X-Admin-Token 需与之一致；为空时拒绝所有管理请求
+ADMIN_TOKEN = os.environ.get("HPQAQ_ADMIN_TOKEN", "")
 
-class Transaction(db.Model):
-    __tablename__ = 'transactions'
+# 是否信任本机（127.0.0.1 / ::1）来的请求为管理员：on / off（默认 off）
+# 经本机反向代理转发的请求在应用看来都来自本机，只有不经代理、直接在本机访问时才应打开
+ADMIN_ALLOW_LOCAL = os.environ.get("HPQAQ_ADMIN_ALLOW_LOCAL", "off").strip().lower() in ("1", "on", "true", "yes")
 
-    id = db.Column(db.Integer, primary_key=True)
-    city_code = db.Column(db.String(20), db.ForeignKey('cities.code'), index=True)
-    region_name = db.Column(db.String(50), index=True)
+# 是否启用 MySQL（数据库可用时走 MySQL；不可用则自动回退）；不启用时不导入 SQLAlchemy、不创建 engine
+DB_ENABLED = DATA_SOURCE in ("auto", "mysql")
 
-    bizcircle = db.Column(db.String(100), index=True)
-    community = db.Column(db.String(500), index=True)
-    layout = db.Column(db.String(50))
+# 路由与请求钩子都注册在蓝图上，由 create_app 装到应用里（模块末尾创建默认应用 app，供 gunicorn app:app 使用）
+bp = Blueprint("hpqaq", __name__)
 
-    total_price_wan = db.Column(db.Numeric(10, 2))
-    unit_price_yuan_sqm = db.Column(db.Integer)
-    area_sqm = db.Column(db.Numeric(10, 2))
+def flask_app() -> Flask:
+    """当前应用上下文中的应用；后台线程（预热、指标快照）没有上下文时取模块末尾创建的默认应用"""
+    return current_app._get_current_object() if has_app_context() else app
 
-    deal_date = db.Column(db.Date, index=True)
+# === 运行指标（/metrics，格式与多进程合并见 metrics.py） ===
+metrics.REGISTRY.set_directory(METRICS_DIR)
 
-    house_id = db.Column(db.String(100), unique=True)
-    orientation = db.Column(db.String(50))
-    building_year = db.Column(db.String(20))
-    floor = db.Column(db.String(50))
-    detail_url = db.Column(db.String(500))
-    crawl_time = db.Column(db.DateTime, default=datetime.now)
+HTTP_REQUESTS = metrics.Counter(
+    "hpqaq_http_requests_total", "HTTP 请求数（source 为本次请求使用的数据源）",
+    ("endpoint", "method", "status", "source"),
+)
+HTTP_DURATION = metrics.Histogram(
+    "hpqaq_http_request_duration_seconds", "HTTP 请求耗时（秒）", ("endpoint",),
+)
+HTTP_IN_FLIGHT = metrics.Gauge("hpqaq_http_requests_in_flight", "正在处理的请求数")
+CACHE_EVENTS = metrics.Counter(
+    "hpqaq_cache_events_total", "进程内缓存的命中 / 未命中 / 淘汰次数", ("cache", "event"),
+)
+CACHE_ENTRIES = metrics.Gauge("hpqaq_cache_entries", "进程内缓存的条目数", ("cache",))
+DB_AVAILABLE = metrics.Gauge("hpqaq_db_available", "最近一次 MySQL 探测是否成功（1 / 0）", mode="max")
+DB_POOL = metrics.Gauge("hpqaq_db_pool_connections", "SQLAlchemy 连接池状态（state=size / checked_out / overflow）", ("state",))
+DB_POOL_EVENTS = metrics.Counter(
+    "hpqaq_db_pool_events_total", "连接池事件数（event=connect / checkout / invalidate）", ("event",),
+)
+
+def _request_endpoint() -> str:
+    return request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+
+@bp.before_app_request
+def _metrics_start():
+    metrics.REGISTRY.ensure_writer()
+    g.metrics_start = time.perf_counter()
+    HTTP_IN_FLIGHT.inc()
+
+@bp.after_app_request
+def _metrics_record(response):
+    _record_request(response.status_code)
+    return response
+
+@bp.teardown_app_request
+def _metrics_finish(exc):
+    # 视图抛出未处理的异常时不会经过 after_request，这里补记为 500
+    if g.get("metrics_start") is None:
+        return
+    if not g.get("metrics_recorded"):
+        _record_request(500)
+    HTTP_IN_FLIGHT.dec()
+
+def _record_request(status: int):
+    start = g.get("metrics_start")
+    if start is None or g.get("metrics_recorded"):
+        return
+    g.metrics_recorded = True
+    endpoint = _request_endpoint()
+    HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=status, source=g.get("data_source", ""))
+    HTTP_DURATION.observe(time.perf_counter() - start, endpoint=endpoint)
+
+def _collect_runtime_gauges():
+    CACHE_ENTRIES.set(STATS_CACHE.stats()["size"], cache="stats")
+    if DB_ENABLED:
+        with flask_app().app_context():
+            pool = models.db.engine.pool
+            if hasattr(pool, "size"):
+                DB_POOL.set(pool.size(), state="size")
+                DB_POOL.set(pool.checkedout(), state="checked_out")
+                DB_POOL.set(max(pool.overflow(), 0), state="overflow")
+
+metrics.REGISTRY.register_collector(_collect_runtime_gauges)
+
+# 连接池事件计数，启用 MySQL 时由 init_db 注册
+_POOL_EVENT_LISTENERS = {
+    name: (lambda *args, _name=name: DB_POOL_EVENTS.inc(event=_name))
+    for name in ("connect", "checkout", "invalidate")
+}
 
 # === JSON 回退数据源 ===
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
-DATA_DIR = PROJECT_ROOT / "data"
+# 城市 JSON 所在目录（HPQAQ_DATA_DIR 可指向别处，例如基准测试生成的合成数据）
+DATA_DIR = Path(os.environ.get("HPQAQ_DATA_DIR") or PROJECT_ROOT / "data")
+
+# MySQL 数据版本文件：import_data.py 导入完成后更新，统计缓存据此失效
+MYSQL_VERSION_FILE = DATA_DIR / ".mysql_version"
 
 CITY_JSON_MAP = {
     "beijing": "crawl_history_beijing.json",
@@ -232,15 +325,67 @@ def db_is_available() -> bool:
     - MySQL 正常 -> True
     """
     try:
-        db.session.execute(text("SELECT 1"))
+        with request_timing.span("db_check"):
+            models.db.session.execute(sa.text("SELECT 1"))
+        DB_AVAILABLE.set(1)
         return True
     except Exception:
         try:
-            db.session.rollback()
+            models.db.session.rollback()
         except Exception:
             pass
+        DB_AVAILABLE.set(0)
         return False
 
+def resolve_data_source(city_code: str = "") -> str:
+    """
+    选择本次请求使用的数据源，返回 "mysql" / "sqlite" / "json"：
+    - DATA_SOURCE=auto：MySQL 可用走 MySQL，否则城市有 SQLite 文件走 SQLite，最后回退 JSON
+    - 指定 mysql / sqlite 时只尝试该数据源，不可用同样回退 JSON
+    - 不传 city_code 时（如 /api/health），只要任一城市有 SQLite 文件即视为 sqlite
+    结果同时记在请求上下文中，作为请求指标的 source 标签
+    """
+    source = _resolve_data_source(city_code)
+    if has_request_context():
+        g.data_source = source
+    return source
+
+def _resolve_data_source(city_code: str) -> str:
+    if DB_ENABLED and db_is_available():
+        return "mysql"
+    if DATA_SOURCE in ("auto", "sqlite"):
+        if city_code:
+            if sqlite_source.get_city_source(city_code) is not None:
+                return "sqlite"
+        elif sqlite_source.has_any_city(CITY_JSON_MAP):
+            return "sqlite"
+    return "json"
+
+# === 统计结果缓存 ===
+STATS_CACHE = result_cache.LRUCache(RESULT_CACHE_SIZE)
+STATS_CACHE.on_event = lambda name: CACHE_EVENTS.inc(cache="stats", event=name)
+
+def data_version(source: str, city_code: str) -> str:
+    """当前数据版本号，作为缓存键的一部分；数据文件 / 导入版本变化后旧缓存自然失效"""
+    if source == "mysql":
+        return result_cache.file_token(MYSQL_VERSION_FILE)
+    if source == "sqlite":
+        return result_cache.file_token(sqlite_source.city_db_path(city_code))
+    return result_cache.file_token(city_json_path(city_code))
+
+def historical_cache_key(source, city_code, bizcircle, start_month, end_month, shape, percentiles=()):
+    """历史均价的缓存键；单个查询与批量对比共用，互相命中"""
+    return (
+        "historical_avg_price", source, data_version(source, city_code),
+        city_code, bizcircle, start_month, end_month, shape, percentiles,
+    )
+
+def _has_rows(result) -> bool:
+    """空结果不缓存：可能是数据库临时出错被吞掉的结果"""
+    if isinstance(result, dict):
+        return bool(result.get("count"))
+    return bool(result)
+
 def _parse_date_any(s):
     if not s:
         return None
@@ -269,17 +414,23 @@ def _as_int(x, default=0):
     except Exception:
         return default
 
-def load_city_items_from_json(city_code: str):
-    """从 data/crawl_history_xxx.json 读取数据列表"""
+def city_json_path(city_code: str) -> Path:
+    """城市代码 -> data/crawl_history_xxx.json 路径"""
     city_code = (city_code or "").strip().lower()
     filename = CITY_JSON_MAP.get(city_code, f"crawl_history_{city_code}.json")
-    path = DATA_DIR / filename
+    return DATA_DIR / filename
+
+def load_city_items_from_json(city_code: str):
+    """从 data/crawl_history_xxx.json 读取数据列表"""
+    path = city_json_path(city_code)
 
     if not path.exists():
         return []
 
-    with path.open("r", encoding="utf-8") as f:
+    start = time.perf_counter()
+    with request_timing.span("json_load"), path.open("r", encoding="utf-8") as f:
         obj = json.load(f)
+    price_stats.JSON_LOAD_SECONDS.observe(time.perf_counter() - start)
 
     # 兼容：可能是 list，也可能是 {"items":[...]} / {"data":[...]}
     if isinstance(obj, list):
@@ -319,20 +470,515 @@ def normalize_item(raw: dict):
         "_deal_date_obj": d_obj,
     }
 
+# === 列表分页：(deal_date, id) 游标 ===
+# 排序统一为 deal_date 倒序、id 倒序，日期为空的排在最后（与 MySQL DESC 的 NULL 顺序一致）。
+# JSON 数据源没有自增 id，使用记录在文件中的下标作为 id。
+_CITY_SORTED_CACHE = {}  # city_code -> {mtime, items, keys, rank}
+
+def _listing_sort_key(d_obj, row_id: int):
+    """把 (deal_date DESC, id DESC) 转为升序可比较的键，便于 bisect 定位游标"""
+    if d_obj is None:
+        return (1, 0, -row_id)
+    return (0, -d_obj.toordinal(), -row_id)
+
+def load_sorted_city_items(city_code: str):
+    """
+    读取并归一化城市数据，按列表顺序排好后缓存（文件 mtime 变化时重建）。
+    返回 (items, keys, rank)，keys[i] 为 items[i] 的排序键，rank[id] 为 id 在 items 中的位置
+    （位图索引给出的行号经 rank 换成列表位置）。
+    """
+    path = city_json_path(city_code)
+    if not path.exists():
+        return [], [], np.zeros(0, dtype=np.int64)
+
+    mtime = path.stat().st_mtime_ns
+    cached = _CITY_SORTED_CACHE.get(city_code)
+    if cached and cached["mtime"] == mtime:
+        CACHE_EVENTS.inc(cache="listings", event="hit")
+        return cached["items"], cached["keys"], cached["rank"]
+    CACHE_EVENTS.inc(cache="listings", event="miss")
+
+    items = []
+    raw_items = load_city_items_from_json(city_code)
+    with request_timing.span("normalize"):
+        for row_id, raw in enumerate(raw_items):
+            x = normalize_item(raw)
+            x["_row_id"] = row_id
+            items.append(x)
+    with request_timing.span("sort"):
+        items.sort(key=lambda x: _listing_sort_key(x["_deal_date_obj"], x["_row_id"]))
+        keys = [_listing_sort_key(x["_deal_date_obj"], x["_row_id"]) for x in items]
+        rank = np.empty(len(items), dtype=np.int64)
+        rank[[x["_row_id"] for x in items]] = np.arange(len(items))
+
+    _CITY_SORTED_CACHE[city_code] = {"mtime": mtime, "items": items, "keys": keys, "rank": rank}
+    return items, keys, rank
+
+def listing_positions(city_code: str, items, rank, equals, community, month_lo, month_hi):
+    """
+    JSON 列表中满足筛选条件的记录位置（升序）：位图索引求交得到行号，经 rank 换成列表位置；
+    没有筛选条件时返回 range（全部记录）。列式缓存与列表缓存不一致时（文件恰好在两次读取之间变化）
+    退回逐条判断
+    """
+    columns = price_stats.load_city_columns(DATA_DIR, CITY_JSON_MAP, city_code)
+    if columns is not None and len(columns) == len(items):
+        rows = columns.bitmap_index().query(equals, {"community": community}, month_lo, month_hi)
+        return range(len(items)) if rows is None else np.sort(rank[rows.to_array()])
+
+    matches = listing_predicate(equals, community, month_lo, month_hi)
+    if matches is None:
+        return range(len(items))
+    return [i for i, x in enumerate(items) if matches(x)]
+
+def listing_predicate(equals, community, month_lo, month_hi):
+    """逐条判断用的筛选函数（作用于 normalize_item 的结果）；没有筛选条件时返回 None"""
+    conds = [lambda x, d=dim, v=value: (x.get(d) or "") == v for dim, value in equals.items() if value]
+    if community:
+        conds.append(lambda x, v=community: v in (x.get("community") or ""))
+    if month_lo is not None or month_hi is not None:
+        lo = -1 if month_lo is None else month_lo
+        hi = float("inf") if month_hi is None else month_hi
+        conds.append(lambda x: x["_deal_date_obj"] is not None
+                     and lo <= x["_deal_date_obj"].year * 12 + x["_deal_date_obj"].month - 1 <= hi)
+    if not conds:
+        return None
+    return lambda x: all(c(x) for c in conds)
+
+def listing_date_bounds(start_month, end_month):
+    """列表的起止月份 -> (起始日期, 结束月份的下一月 1 日)，未指定的一端为 None"""
+    lo = hi = None
+    if start_month:
+        year, month = map(int, start_month.split("-"))
+        lo = date(year, month, 1)
+    if end_month:
+        year, month = map(int, end_month.split("-"))
+        hi = date(year + month // 12, month % 12 + 1, 1)
+    return lo, hi
+
+def encode_cursor(deal_date, row_id: int) -> str:
+    """(deal_date, id) -> 不透明的 URL 安全字符串"""
+    d = deal_date.isoformat() if deal_date else None
+    raw = json.dumps([d, int(row_id)], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str):
+    """encode_cursor 的逆操作；格式不对时抛 ValueError"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        d, row_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        d_obj = datetime.strptime(d, "%Y-%m-%d").date() if d else None
+        return d_obj, int(row_id)
+    except Exception as e:
+        raise ValueError("invalid_cursor") from e
+
+# === MySQL 查询构造（handler 与 explain_check.py 共用） ===
+def build_listings_query(city_code: str, region=None, bizcircle=None, community=None, layout=None,
+                         date_lo=None, date_hi=None):
+    """成交列表查询（已排序，未分页）；date_lo <= deal_date < date_hi"""
+    query = models.Transaction.query.filter_by(city_code=city_code)
+
+    if region:
+        query = query.filter(models.Transaction.region_name == region)
+    if bizcircle:
+        query = query.filter(models.Transaction.bizcircle == bizcircle)
+    if community:
+        query = query.filter(models.Transaction.community.contains(community))
+    if layout:
+        query = query.filter(models.Transaction.layout == layout)
+    if date_lo:
+        query = query.filter(models.Transaction.deal_date >= date_lo)
+    if date_hi:
+        query = query.filter(models.Transaction.deal_date < date_hi)
+
+    return query.order_by(models.Transaction.deal_date.desc(), models.Transaction.id.desc())
+
+def apply_listings_cursor(query, cursor):
+    """加上 (deal_date, id) < 游标 的条件；cursor 为 None 时原样返回"""
+    if not cursor:
+        return query
+    d_obj, row_id = cursor
+    if d_obj is None:
+        return query.filter(models.Transaction.deal_date.is_(None), models.Transaction.id < row_id)
+    return query.filter(sa.or_(
+        models.Transaction.deal_date < d_obj,
+        sa.and_(models.Transaction.deal_date == d_obj, models.Transaction.id < row_id),
+        models.Transaction.deal_date.is_(None),
+    ))
+
+def trend_period_expr(resolution: str):
+    """走势的周期表达式（MySQL）：月为 'YYYY-MM'，周 / 季度为 price_stats.period_label 使用的序号"""
+    if resolution == "week":
+        # TO_DAYS('0001-01-01') = 366，减去后与 date.toordinal() - 1 一致，每周从周一开始
+        return sa.func.floor((sa.func.to_days(models.Transaction.deal_date) - 366) / 7)
+    if resolution == "quarter":
+        return sa.func.year(models.Transaction.deal_date) * 4 + sa.func.quarter(models.Transaction.deal_date) - 1
+    return sa.func.date_format(models.Transaction.deal_date, '%Y-%m')
+
+def build_price_trend_query(city_code: str, region=None, bizcircle=None, resolution: str = "month"):
+    """走势聚合查询（默认按月）：WHERE 只用等值 + deal_date 范围条件，配合复合索引只扫索引"""
+    query = models.db.session.query(
+        trend_period_expr(resolution).label('month'),
+        sa.func.avg(models.Transaction.unit_price_yuan_sqm).label('avg_unit'),
+        sa.func.avg(models.Transaction.total_price_wan).label('avg_total'),
+        sa.func.count(models.Transaction.id).label('count')
+    ).filter(
+        models.Transaction.city_code == city_code,
+        models.Transaction.deal_date.isnot(None)
+    )
+
+    if region:
+        query = query.filter(models.Transaction.region_name == region)
+    if bizcircle:
+        query = query.filter(models.Transaction.bizcircle == bizcircle)
+
+    return query.group_by('month').order_by('month')
+
+def get_bool_arg(name: str, default: bool) -> bool:
+    v = request.args.get(name)
+    if v is None or v.strip() == "":
+        return default
+    return v.strip().lower() not in ("0", "false", "no", "off")
+
+# 导出时只查询列表需要的列（transaction_item 按属性名取值，ORM 对象和这些列的行都适用）
+EXPORT_COLUMNS = (
+    "house_id", "region_name", "bizcircle", "community", "layout", "area_sqm", "total_price_wan",
+    "unit_price_yuan_sqm", "deal_date", "detail_url", "orientation", "building_year", "floor",
+)
+
+def transaction_item(item) -> dict:
+    """Transaction -> 列表接口的记录结构（与 JSON / SQLite 的字段一致）"""
+    return {
+        "house_id": item.house_id,
+        "region": item.region_name,
+        "bizcircle": item.bizcircle,
+        "community": item.community,
+        "layout": item.layout,
+        "area_sqm": float(item.area_sqm) if item.area_sqm else 0,
+        "total_price_wan": float(item.total_price_wan) if item.total_price_wan else 0,
+        "unit_price_yuan_sqm": item.unit_price_yuan_sqm,
+        "deal_date": item.deal_date.isoformat() if item.deal_date else None,
+        "detail_url": item.detail_url,
+        "orientation": item.orientation,
+        "building_year": item.building_year,
+        "floor": item.floor
+    }
+
+def _public_item(x: dict) -> dict:
+    """去掉内部字段（_ 开头），不修改缓存中的原对象"""
+    return {k: v for k, v in x.items() if not k.startswith("_")}
+
+def get_month_range_args():
+    """
+    可选的 start_month / end_month 查询参数（YYYY-MM），未传的一端为 None
+    格式错误抛 ValueError("invalid_month")，起始晚于结束抛 ValueError("invalid_month_range")
+    """
+    start_month = result_cache.normalize_month(request.args.get("start_month", "").strip()) or None
+    end_month = result_cache.normalize_month(request.args.get("end_month", "").strip()) or None
+    try:
+        price_stats.month_range(start_month or "2000-01", end_month or "2000-01")
+    except ValueError:
+        raise ValueError("invalid_month") from None
+    if start_month and end_month and start_month > end_month:
+        raise ValueError("invalid_month_range")
+    return start_month, end_month
+
+def get_shape_arg() -> str:
+    """图表类接口的输出形态：rows（默认）或 columns"""
+    shape = request.args.get("shape", "rows").strip().lower()
+    return shape if shape in ("rows", "columns") else "rows"
+
+def get_stats_arg():
+    """
+    stats=p50,p90 / stats=median / stats=quantiles（全部）-> 分位数元组，如 (50, 90)
+    不传返回 ()；含无法识别的取值返回 None
+    """
+    raw = request.args.get("stats", "").strip().lower()
+    if not raw:
+        return ()
+    percentiles = set()
+    for token in (t.strip() for t in raw.split(",")):
+        if token in ("quantiles", "percentiles"):
+            percentiles.update(price_stats.QUANTILE_PERCENTILES)
+        elif token == "median":
+            percentiles.add(50)
+        elif token.startswith("p") and token[1:].isdigit() and int(token[1:]) in price_stats.QUANTILE_PERCENTILES:
+            percentiles.add(int(token[1:]))
+        elif token:
+            return None
+    return tuple(sorted(percentiles))
+
+def get_month_sketches(source, city_code, region=None, bizcircle=None, start_month=None, end_month=None):
+    """按数据源读取并合并 (区域, 商圈, 月) 草图：{year_month: (单价草图, 总价草图)}"""
+    if source == "mysql":
+        return price_stats.get_month_sketches_from_db(
+            models.db.session, models.MonthSketch, city_code, region, bizcircle, start_month, end_month
+        )
+    if source == "sqlite":
+        return sqlite_source.get_city_source(city_code).month_sketches(
+            region, bizcircle, start_month, end_month
+        )
+    return price_stats.get_month_sketches_from_json(
+        DATA_DIR, CITY_JSON_MAP, city_code, region, bizcircle, start_month, end_month
+    )
+
+# 立方体格子按 (数据源, 城市) 缓存在进程内，数据版本变化后重新读取
+_CUBE_CACHE = {}
+
+def get_city_cube(source, city_code):
+    """当前数据版本的立方体格子（CubeCells），读不到时返回 None"""
+    version = data_version(source, city_code)
+    cached = _CUBE_CACHE.get((source, city_code))
+    if cached and cached[0] == version:
+        CACHE_EVENTS.inc(cache="cube", event="hit")
+        return cached[1]
+    CACHE_EVENTS.inc(cache="cube", event="miss")
+
+    if source == "mysql":
+        cube = price_stats.get_cube_from_db(models.db.session, models.MonthCube, city_code)
+    elif source == "sqlite":
+        cube = sqlite_source.get_city_source(city_code).cube_cells()
+    else:
+        cube = price_stats.get_cube_from_json(DATA_DIR, CITY_JSON_MAP, city_code)
+    if cube is not None:
+        _CUBE_CACHE[(source, city_code)] = (version, cube)
+    return cube
+
+_COMPS_CACHE = {}
+
+def get_city_comps(source, city_code):
+    """当前数据版本的可比成交索引（CompsIndex），读不到时返回 None"""
+    version = data_version(source, city_code)
+    cached = _COMPS_CACHE.get((source, city_code))
+    if cached and cached[0] == version:
+        CACHE_EVENTS.inc(cache="comps", event="hit")
+        return cached[1]
+    CACHE_EVENTS.inc(cache="comps", event="miss")
+
+    if source == "mysql":
+        index = price_stats.get_comps_index_from_db(models.db.session, models.Transaction, city_code)
+    elif source == "sqlite":
+        index = sqlite_source.get_city_source(city_code).comps_index()
+    else:
+        index = price_stats.get_comps_index_from_json(DATA_DIR, CITY_JSON_MAP, city_code)
+    if index is not None:
+        _COMPS_CACHE[(source, city_code)] = (version, index)
+    return index
+
+def fetch_items_by_ids(source, city_code, row_ids):
+    """按 id 取列表记录 {id: item}：MySQL 为 transactions.id，SQLite / JSON 为文件下标"""
+    if source == "mysql":
+        rows = models.Transaction.query.filter(models.Transaction.id.in_(row_ids)).all() if row_ids else []
+        return {t.id: transaction_item(t) for t in rows}
+    if source == "sqlite":
+        return sqlite_source.get_city_source(city_code).listings_by_ids(row_ids)
+    items, _, rank = load_sorted_city_items(city_code)
+    return {i: _public_item(items[rank[i]]) for i in row_ids if i < len(rank)}
+
+def get_trend_series(source, city_code, region=None, bizcircle=None, resolution="month"):
+    """
+    某个粒度的完整走势 [(周期标签, avg_unit, avg_total, count), ...]
+    按数据版本缓存：周 / 月 / 季度各算一次，之后的降采样都在缓存的序列上做
+    """
+    def compute():
+        if source == "mysql":
+            rows = build_price_trend_query(city_code, region, bizcircle, resolution).all()
+            return [
+                (
+                    r.month if resolution == "month" else price_stats.period_label(resolution, int(r.month)),
+                    int(r.avg_unit) if r.avg_unit else 0,
+                    round(float(r.avg_total), 2) if r.avg_total else 0,
+                    r.count
+                )
+                for r in rows
+            ]
+        if source == "sqlite":
+            return sqlite_source.get_city_source(city_code).price_trend(region, bizcircle, resolution)
+        return price_stats.get_price_trend_from_json(
+            DATA_DIR, CITY_JSON_MAP, city_code, region, bizcircle, resolution
+        )
+
+    key = ("price_trend", source, data_version(source, city_code), city_code, region, bizcircle, resolution)
+    return STATS_CACHE.get_or_compute(key, compute, cache_if=bool)
+
+def get_trend_span(source, city_code, region=None, bizcircle=None):
+    """
+    走势覆盖的 (最早, 最晚) 成交日序号，没有带日期的记录为 None
+    auto 粒度据此估算各档点数，只计算选中的那一档序列；按数据版本缓存
+    """
+    def compute():
+        if source == "mysql":
+            query = models.db.session.query(
+                sa.func.min(models.Transaction.deal_date), sa.func.max(models.Transaction.deal_date)
+            ).filter(
+                models.Transaction.city_code == city_code,
+                models.Transaction.deal_date.isnot(None)
+            )
+            if region:
+                query = query.filter(models.Transaction.region_name == region)
+            if bizcircle:
+                query = query.filter(models.Transaction.bizcircle == bizcircle)
+            first, last = query.one()
+            return (first.toordinal(), last.toordinal()) if first is not None else None
+        if source == "sqlite":
+            return sqlite_source.get_city_source(city_code).trend_span(region, bizcircle)
+        return price_stats.get_trend_span_from_json(DATA_DIR, CITY_JSON_MAP, city_code, region, bizcircle)
+
+    key = ("trend_span", source, data_version(source, city_code), city_code, region, bizcircle)
+    return STATS_CACHE.get_or_compute(key, compute, cache_if=bool)
+
+PRICE_TREND_FIELDS = ("month", "avg_unit_price_yuan_sqm", "avg_total_price_wan", "count")
+
+# === 启动预热与就绪状态 ===
+# 预热在后台线程中进行：打开 MySQL 连接池，逐个城市读入数据并建好列表缓存、位图索引、立方体、
+# 可比成交的 KD 树和默认走势。完成前 /api/ready 返回 503，/api/health 只反映进程存活
+WARMUP_STATE = {"state": "pending", "started_at": None, "elapsed_ms": None, "db_pool": None, "cities": {}}
+_WARMUP_LOCK = threading.Lock()
+
+def warmup_city_codes():
+    """HPQAQ_WARMUP -> 需要预热的城市代码列表"""
+    if not WARMUP_ENABLED:
+        return []
+    if WARMUP_CITIES == "all":
+        return sorted(CITY_JSON_MAP)
+    return [c.strip() for c in WARMUP_CITIES.split(",") if c.strip()]
+
+def open_db_pool():
+    """同时签出 pool_size 条连接各执行一次 SELECT 1 再归还，使连接池满员；返回打开的连接数"""
+    conns = []
+    try:
+        pool_size = models.db.engine.pool.size() if hasattr(models.db.engine.pool, "size") else 1
+        for _ in range(pool_size):
+            conn = models.db.engine.connect()
+            conns.append(conn)
+            conn.execute(sa.text("SELECT 1"))
+    finally:
+        for conn in conns:
+            conn.close()
+    return len(conns)
+
+def warm_up_city(city_code: str):
+    """预热单个城市，返回 {source, steps: {步骤: 耗时 ms}}"""
+    source = resolve_data_source(city_code)
+    steps = {}
+
+    def step(name, fn):
+        t0 = time.perf_counter()
+        fn()
+        steps[name] = round((time.perf_counter() - t0) * 1000, 1)
+
+    def build_comps():
+        index = get_city_comps(source, city_code)
+        if index is not None:
+            index.build_trees()
+
+    if source == "json":
+        step("listings", lambda: load_sorted_city_items(city_code))
+
+        def build_bitmap_index():
+            columns = price_stats.load_city_columns(DATA_DIR, CITY_JSON_MAP, city_code)
+            if columns is not None:
+                columns.bitmap_index()
+
+        step("bitmap_index", build_bitmap_index)
+    elif source == "sqlite":
+        step("open", lambda: sqlite_source.get_city_source(city_code))
+    step("cube", lambda: get_city_cube(source, city_code))
+    step("comps", build_comps)
+    step("price_trend", lambda: get_trend_series(source, city_code))
+    return {"source": source, "steps": steps}
+
+def warm_up(open_pool: bool = True, app: Flask = None):
+    """
+    按 HPQAQ_WARMUP 预热；单个城市失败只记录错误，不影响其他城市，结束后即视为就绪
+    open_pool=False 时不打开连接池（gunicorn 主进程预热数据后 fork，连接不能跨进程共享，由各 worker 自己打开）；
+    HPQAQ_WARMUP=off 时同样不打开，连接在第一次查询时按需建立
+    app 为空时预热默认应用
+    """
+    t0 = time.perf_counter()
+    with (app or flask_app()).app_context():
+        if open_pool and DB_ENABLED and WARMUP_ENABLED:
+            try:
+                WARMUP_STATE["db_pool"] = {"ok": True, "connections": open_db_pool()}
+            except Exception as e:
+                WARMUP_STATE["db_pool"] = {"ok": False, "error": str(e)}
+            print(f"[warmup] db pool: {WARMUP_STATE['db_pool']}")
+
+        for city_code in warmup_city_codes():
+            t1 = time.perf_counter()
+            try:
+                result = warm_up_city(city_code)
+            except Exception as e:
+                result = {"error": str(e)}
+                if DB_ENABLED:
+                    models.db.session.rollback()
+            result["ms"] = round((time.perf_counter() - t1) * 1000, 1)
+            WARMUP_STATE["cities"][city_code] = result
+            print(f"[warmup] {city_code}: {result}")
+
+    WARMUP_STATE["elapsed_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    WARMUP_STATE["state"] = "done"
+    print(f"[warmup] done in {WARMUP_STATE['elapsed_ms']} ms")
+
+def start_warmup():
+    """启动后台预热线程（每个进程只启动一次）"""
+    with _WARMUP_LOCK:
+        if WARMUP_STATE["state"] != "pending":
+            return
+        WARMUP_STATE["state"] = "running"
+        WARMUP_STATE["started_at"] = datetime.now().isoformat(timespec="seconds")
+    threading.Thread(target=warm_up, kwargs={"app": flask_app()}, name="hpqaq-warmup", daemon=True).start()
+
+@bp.before_app_request
+def _ensure_warmup_started():
+    # WSGI 服务器导入 app 时不会执行 __main__；没有显式调用 start_warmup 时由第一个请求（通常是就绪探针）触发
+    if WARMUP_STATE["state"] == "pending":
+        start_warmup()
+
+# === 管理接口访问控制 ===
+def has_admin_token(environ) -> bool:
+    """
+    请求头 X-Admin-Token 与 HPQAQ_ADMIN_TOKEN 一致（未设置令牌时恒为 False）
+    剖析（单个请求的 X-Profile / _profile=1 与全进程采样）只认令牌：栈里带有代码路径与参数，不按来源地址放行
+    """
+    if not ADMIN_TOKEN:
+        return False
+    # 按字节比较：WSGI 的请求头是 latin-1 解码的 str，compare_digest 遇到非 ASCII 的 str 会抛 TypeError
+    header = environ.get("HTTP_X_ADMIN_TOKEN", "").encode("latin-1", "replace")
+    return hmac.compare_digest(header, ADMIN_TOKEN.encode("utf-8"))
+
+def is_admin(environ) -> bool:
+    """
+    管理员请求判断（参数为 WSGI environ）
+    - 请求头 X-Admin-Token 与 HPQAQ_ADMIN_TOKEN 一致（未设置令牌时任何请求头都不算）
+    - 或者开启了 HPQAQ_ADMIN_ALLOW_LOCAL 且请求来自本机（127.0.0.1 / ::1）
+    默认两者都没有配置，管理请求一律拒绝
+    """
+    if has_admin_token(environ):
+        return True
+    return ADMIN_ALLOW_LOCAL and environ.get("REMOTE_ADDR") in ("127.0.0.1", "::1")
+
+def admin_denied(token_only: bool = False):
+    """/api/admin/* 的访问检查：允许时返回 None，否则返回 403 响应；token_only=True 时不认本机放行"""
+    if (has_admin_token if token_only else is_admin)(request.environ):
+        return None
+    return jsonify({"error": "forbidden"}), 403
+
+
 # === 辅助路径 ===
 FRONTEND_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), "..", "frontend"))
 
 # === API 接口 ===
-@app.get("/api/health")
+@bp.get("/api/health")
 def health():
     """
     前端初始化时调用此接口获取城市列表：
     - DB 可用：从 City 表读取
-    - DB 不可用：从 CITY_JSON_MAP 返回
+    - DB 不可用：从 CITY_JSON_MAP 返回（db 字段为 sqlite 或 json）
     """
     try:
-        if db_is_available():
-            cities = City.query.order_by(City.code).all()
+        source = resolve_data_source()
+        if source == "mysql":
+            cities = models.City.query.order_by(models.City.code).all()
             return jsonify({
                 "ok": True,
                 "db": "mysql",
@@ -341,174 +987,343 @@ def health():
         else:
             return jsonify({
                 "ok": True,
-                "db": "json",
+                "db": source,
                 "cities": sorted(CITY_JSON_MAP.keys())
             })
     except Exception as e:
         return jsonify({"ok": False, "error": str(e)}), 500
 
-@app.get("/api/cities")
+@bp.get("/api/ready")
+def ready():
+    """
+    就绪探针：启动预热完成后返回 200，之前返回 503（负载均衡据此决定是否转发流量）
+    进程存活请用 /api/health
+    """
+    # 预热线程仍在写入 cities，先复制一份再序列化
+    state = dict(WARMUP_STATE, cities=dict(WARMUP_STATE["cities"]), ready=WARMUP_STATE["state"] == "done")
+    return jsonify(state), 200 if state["ready"] else 503
+
+@bp.get("/metrics")
+def get_metrics():
+    """Prometheus 文本格式的运行指标（多进程部署时合并全部 worker）"""
+    return Response(metrics.REGISTRY.render(), mimetype=metrics.CONTENT_TYPE)
+
+@bp.route("/api/admin/slow_queries", methods=["GET", "DELETE"])
+def admin_slow_queries():
+    """
+    慢查询报告（本进程）：最近 window 秒（默认 3600）内按总耗时排序的前 top 种语句形状（默认 20，最多 100），
+    带首次变慢时的 EXPLAIN；DELETE 清空已记录的形状
+    """
+    denied = admin_denied()
+    if denied is not None:
+        return denied
+    if request.method == "DELETE":
+        slow_query.clear()
+        return jsonify({"ok": True})
+    top = min(max(request.args.get("top", 20, type=int), 1), 100)
+    window = max(request.args.get("window", 3600, type=float), 1.0)
+    return jsonify({
+        "enabled": slow_query.ENABLED,
+        "threshold_ms": slow_query.THRESHOLD_MS if slow_query.ENABLED else None,
+        "window": window,
+        "pid": os.getpid(),
+        "queries": slow_query.report(top, window),
+    })
+
+@bp.post("/api/admin/profile")
+def admin_profile():
+    """
+    全进程采样剖析：seconds 秒内（默认 10，最多 60）对所有 worker 正在处理请求的线程做统计采样，
+    返回合并后的折叠栈（text/plain）；interval_ms 为采样间隔（默认 5）。需开启 HPQAQ_PROFILER，且只认令牌
+    """
+    denied = admin_denied(token_only=True)
+    if denied is not None:
+        return denied
+    if not profiler.ENABLED:
+        return jsonify({"error": "profiler_disabled"}), 404
+    seconds = min(max(request.args.get("seconds", 10, type=float), 0.1), profiler.MAX_SESSION_SECONDS)
+    interval = min(max(request.args.get("interval_ms", profiler.SESSION_INTERVAL * 1000, type=float), 1.0), 1000.0) / 1000.0
+    result = profiler.profile_session(seconds, interval)
+    if result is None:
+        return jsonify({"error": "profile_in_progress"}), 409
+    return Response(result["collapsed"], mimetype="text/plain", headers={"X-Profile-Processes": str(result["processes"])})
+
+@bp.get("/api/cities")
 def get_cities():
-    if db_is_available():
-        cities = City.query.order_by(City.code).all()
+    if resolve_data_source() == "mysql":
+        cities = models.City.query.order_by(models.City.code).all()
         return jsonify({"cities": [c.code for c in cities]})
     return jsonify({"cities": sorted(CITY_JSON_MAP.keys())})
 
-@app.get("/api/listings")
+@bp.get("/api/listings")
 def get_listings():
-    """获取成交列表（DB 可用走 DB，不可用走 JSON）"""
+    """
+    获取成交列表（DB 可用走 DB，不可用走 JSON）
+    分页两种方式：
+    - page/page_size：传统页码分页（默认返回 total）
+    - cursor：上一页返回的 next_cursor，按 (deal_date, id) 定位，翻到多深代价都一样（默认不返回 total）
+    with_total=0/1 可显式控制是否统计总数。
+    start_month / end_month（YYYY-MM，可选）按成交月份过滤，指定后没有成交日期的记录不返回。
+    """
     city_code = request.args.get("city", "").strip().lower()
     if not city_code:
         return jsonify({"error": "missing_city"}), 400
 
+    try:
+        start_month, end_month = get_month_range_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    date_lo, date_hi = listing_date_bounds(start_month, end_month)
+
     page = request.args.get("page", 1, type=int)
     page_size = request.args.get("page_size", 20, type=int)
+    page = max(page, 1)
+    page_size = max(page_size, 1)
+
+    cursor = None
+    if raw_cursor := request.args.get("cursor", "").strip():
+        try:
+            cursor = decode_cursor(raw_cursor)
+        except ValueError:
+            return jsonify({"error": "invalid_cursor"}), 400
+    with_total = get_bool_arg("with_total", cursor is None)
+    source = resolve_data_source(city_code)
 
     # --- 1) DB 可用：原 ORM 查询 ---
-    if db_is_available():
-        query = Transaction.query.filter_by(city_code=city_code)
-
-        if region := request.args.get("region"):
-            query = query.filter(Transaction.region_name == region)
-        if bizcircle := request.args.get("bizcircle"):
-            query = query.filter(Transaction.bizcircle == bizcircle)
-        if community := request.args.get("community"):
-            query = query.filter(Transaction.community.contains(community))
-        if layout := request.args.get("layout"):
-            query = query.filter(Transaction.layout == layout)
-
-        query = query.order_by(Transaction.deal_date.desc())
-        pagination = query.paginate(page=page, per_page=page_size, error_out=False)
-
-        items = []
-        for item in pagination.items:
-            items.append({
-                "house_id": item.house_id,
-                "region": item.region_name,
-                "bizcircle": item.bizcircle,
-                "community": item.community,
-                "layout": item.layout,
-                "area_sqm": float(item.area_sqm) if item.area_sqm else 0,
-                "total_price_wan": float(item.total_price_wan) if item.total_price_wan else 0,
-                "unit_price_yuan_sqm": item.unit_price_yuan_sqm,
-                "deal_date": item.deal_date.isoformat() if item.deal_date else None,
-                "detail_url": item.detail_url,
-                "orientation": item.orientation,
-                "building_year": item.building_year,
-                "floor": item.floor
-            })
+    if source == "mysql":
+        query = build_listings_query(
+            city_code,
+            region=request.args.get("region"),
+            bizcircle=request.args.get("bizcircle"),
+            community=request.args.get("community"),
+            layout=request.args.get("layout"),
+            date_lo=date_lo,
+            date_hi=date_hi,
+        )
+
+        with request_timing.span("count"):
+            total = query.order_by(None).count() if with_total else None
+
+        query = apply_listings_cursor(query, cursor)
+        if not cursor:
+            query = query.offset((page - 1) * page_size)
+        with request_timing.span("query"):
+            rows = query.limit(page_size + 1).all()
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+
+        with request_timing.span("items"):
+            items = [transaction_item(item) for item in rows]
 
+        next_cursor = encode_cursor(rows[-1].deal_date, rows[-1].id) if has_more else None
         return jsonify({
             "items": items,
-            "total": pagination.total,
+            "total": total,
             "page": page,
-            "page_size": page_size
+            "page_size": page_size,
+            "has_more": has_more,
+            "next_cursor": next_cursor
         })
 
-    # --- 2) DB 不可用：JSON 回退 ---
-    raw_items = load_city_items_from_json(city_code)
-    items = [normalize_item(r) for r in raw_items]
-
-    # 过滤（按你的接口参数）
-    if region := request.args.get("region"):
-        items = [x for x in items if (x.get("region") or "") == region]
-    if bizcircle := request.args.get("bizcircle"):
-        items = [x for x in items if (x.get("bizcircle") or "") == bizcircle]
-    if community := request.args.get("community"):
-        items = [x for x in items if community in (x.get("community") or "")]
-    if layout := request.args.get("layout"):
-        items = [x for x in items if (x.get("layout") or "") == layout]
-
-    # 排序：按 deal_date 倒序
-    items.sort(key=lambda x: x.get("_deal_date_obj") or datetime.min.date(), reverse=True)
-
-    total = len(items)
-    start = (page - 1) * page_size
-    end = start + page_size
-    page_items = items[start:end]
-
-    # 去掉内部字段
-    for x in page_items:
-        x.pop("_deal_date_obj", None)
+    # --- 2) SQLite：索引查询 ---
+    if source == "sqlite":
+        items, total, has_more, last_key = sqlite_source.get_city_source(city_code).listings(
+            region=request.args.get("region"),
+            bizcircle=request.args.get("bizcircle"),
+            community=request.args.get("community"),
+            layout=request.args.get("layout"),
+            date_lo=date_lo,
+            date_hi=date_hi,
+            page=page,
+            page_size=page_size,
+            cursor=cursor,
+            with_total=with_total,
+        )
+        return jsonify({
+            "items": items,
+            "total": total,
+            "page": page,
+            "page_size": page_size,
+            "has_more": has_more,
+            "next_cursor": encode_cursor(*last_key) if last_key else None
+        })
+
+    # --- 3) JSON 回退：位图索引求出命中记录在预排序列表中的位置，直接切出一页 ---
+    with request_timing.span("load"):
+        items, keys, rank = load_sorted_city_items(city_code)
+    equals = {dim: request.args.get(dim) for dim in ("region", "bizcircle", "layout")}
+    with request_timing.span("filter"):
+        positions = listing_positions(
+            city_code, items, rank, equals, request.args.get("community"),
+            aggregate_cube.month_index_of(start_month) if start_month else None,
+            aggregate_cube.month_index_of(end_month) if end_month else None,
+        )
 
+    with request_timing.span("page"):
+        if cursor:
+            first = bisect.bisect_left(positions, bisect.bisect_right(keys, _listing_sort_key(*cursor)))
+        else:
+            first = (page - 1) * page_size
+        selected = positions[first:first + page_size + 1]
+        has_more = len(selected) > page_size
+        page_items = [items[i] for i in selected[:page_size]]
+
+    total = len(positions) if with_total else None
+
+    next_cursor = None
+    if has_more:
+        last = page_items[-1]
+        next_cursor = encode_cursor(last["_deal_date_obj"], last["_row_id"])
+
+    with request_timing.span("items"):
+        public_items = [_public_item(x) for x in page_items]
     return jsonify({
-        "items": page_items,
+        "items": public_items,
         "total": total,
         "page": page,
-        "page_size": page_size
+        "page_size": page_size,
+        "has_more": has_more,
+        "next_cursor": next_cursor
     })
 
-@app.get("/api/price_trend")
-def get_price_trend():
-    """获取价格走势（DB 可用走 DB，不可用走 JSON）"""
+@bp.get("/api/export")
+def export_listings():
+    """
+    导出满足筛选条件的全部成交记录（分块流式响应，内存占用与条数无关）
+    查询参数：
+    - city: 城市代码（必填）
+    - format: csv（默认）或 ndjson
+    - region / bizcircle / layout / community / start_month / end_month: 与 /api/listings 相同
+    记录按 id 升序（导入 / 文件顺序）输出，字段与 /api/listings 的记录一致
+    """
     city_code = request.args.get("city", "").strip().lower()
     if not city_code:
         return jsonify({"error": "missing_city"}), 400
-
-    # --- 1) DB 可用：原 MySQL 聚合 ---
-    if db_is_available():
-        query = db.session.query(
-            func.date_format(Transaction.deal_date, '%Y-%m').label('month'),
-            func.avg(Transaction.unit_price_yuan_sqm).label('avg_unit'),
-            func.avg(Transaction.total_price_wan).label('avg_total'),
-            func.count(Transaction.id).label('count')
-        ).filter(
-            Transaction.city_code == city_code,
-            Transaction.deal_date.isnot(None)
+    fmt = request.args.get("format", "csv").strip().lower()
+    if fmt not in export.EXPORT_FORMATS:
+        return jsonify({"error": "invalid_format", "formats": list(export.EXPORT_FORMATS)}), 400
+    try:
+        start_month, end_month = get_month_range_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    filters = {dim: request.args.get(dim) for dim in ("region", "bizcircle", "community", "layout")}
+    source = resolve_data_source(city_code)
+
+    if source == "mysql":
+        date_lo, date_hi = listing_date_bounds(start_month, end_month)
+        # 服务端游标：yield_per 同时打开 stream_results，逐批从 MySQL 取行，不缓存整个结果集
+        query = build_listings_query(city_code, **filters, date_lo=date_lo, date_hi=date_hi) \
+            .order_by(None).order_by(models.Transaction.id) \
+            .with_entities(*(getattr(models.Transaction, name) for name in EXPORT_COLUMNS)) \
+            .yield_per(export.EXPORT_BATCH_SIZE)
+        rows = (transaction_item(r) for r in query)
+    elif source == "sqlite":
+        date_lo, date_hi = listing_date_bounds(start_month, end_month)
+        rows = sqlite_source.get_city_source(city_code).iter_listings(
+            **filters, date_lo=date_lo, date_hi=date_hi
         )
+    else:
+        path = city_json_path(city_code)
+        matches = listing_predicate(
+            {dim: filters[dim] for dim in ("region", "bizcircle", "layout")},
+            filters["community"],
+            aggregate_cube.month_index_of(start_month) if start_month else None,
+            aggregate_cube.month_index_of(end_month) if end_month else None,
+        )
+        raws = export.iter_json_array(path) if path.exists() else iter(())
+        items = (normalize_item(raw) for raw in raws)
+        rows = (_public_item(x) for x in items if matches is None or matches(x))
 
-        if region := request.args.get("region"):
-            query = query.filter(Transaction.region_name == region)
-        if bizcircle := request.args.get("bizcircle"):
-            query = query.filter(Transaction.bizcircle == bizcircle)
-
-        rows = query.group_by('month').order_by('month').all()
-
-        points = []
-        for r in rows:
-            points.append({
-                "month": r.month,
-                "avg_unit_price_yuan_sqm": int(r.avg_unit) if r.avg_unit else 0,
-                "avg_total_price_wan": round(float(r.avg_total), 2) if r.avg_total else 0,
-                "count": r.count
-            })
-
-        return jsonify({"points": points})
-
-    # --- 2) DB 不可用：JSON 回退聚合 ---
-    raw_items = load_city_items_from_json(city_code)
-    items = [normalize_item(r) for r in raw_items]
-
-    if region := request.args.get("region"):
-        items = [x for x in items if (x.get("region") or "") == region]
-    if bizcircle := request.args.get("bizcircle"):
-        items = [x for x in items if (x.get("bizcircle") or "") == bizcircle]
+    if fmt == "csv":
+        chunks, mimetype = export.csv_chunks(rows), "text/csv"
+    else:
+        chunks, mimetype = export.ndjson_chunks(rows, current_app.json.dumps), "application/x-ndjson"
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={
+            "Content-Disposition": f'attachment; filename="{city_code}_transactions.{fmt}"',
+            "X-Accel-Buffering": "no",
+        },
+    )
 
-    bucket = {}  # month -> {"sum_unit":..., "sum_total":..., "count":...}
-    for x in items:
-        d = x.get("_deal_date_obj")
-        if not d:
-            continue
-        month = d.strftime("%Y-%m")
-        b = bucket.setdefault(month, {"sum_unit": 0, "sum_total": 0.0, "count": 0})
-        b["sum_unit"] += _as_int(x.get("unit_price_yuan_sqm"), 0)
-        b["sum_total"] += _as_float(x.get("total_price_wan"), 0.0)
-        b["count"] += 1
-
-    points = []
-    for month in sorted(bucket.keys()):
-        b = bucket[month]
-        cnt = b["count"] or 1
-        points.append({
-            "month": month,
-            "avg_unit_price_yuan_sqm": int(b["sum_unit"] / cnt),
-            "avg_total_price_wan": round(b["sum_total"] / cnt, 2),
-            "count": b["count"]
-        })
+@bp.get("/api/price_trend")
+def get_price_trend():
+    """
+    获取价格走势（DB 可用走 DB，不可用走 SQLite / JSON）
+    查询参数：
+    - city: 城市代码（必填）
+    - region / bizcircle: 区域 / 商圈（可选）
+    - resolution: week / month / quarter / auto（可选）；不传且没有 max_points 时为 month
+    - max_points: 点数上限（可选，>= 3）。auto 时按成交日期跨度估算各档点数，取不超过上限的最细一档
+      （细节最多的一档；最粗一档总是最容易满足上限，取它会让 auto 退化成季度），
+      只计算选中的一档；仍然超出时用 LTTB 降采样到 max_points 个点
+    - shape: rows（默认）或 columns
+    - stats: p25,p50,p75,p90 / median / quantiles：附加每个周期的单价、总价分位数（周粒度不支持）
+    """
+    city_code = request.args.get("city", "").strip().lower()
+    if not city_code:
+        return jsonify({"error": "missing_city"}), 400
+    shape = get_shape_arg()
+    percentiles = get_stats_arg()
+    if percentiles is None:
+        return jsonify({"error": "invalid_stats"}), 400
 
-    return jsonify({"points": points})
+    max_points = request.args.get("max_points", "").strip()
+    if max_points:
+        try:
+            max_points = int(max_points)
+        except ValueError:
+            return jsonify({"error": "invalid_max_points"}), 400
+        if max_points < 3:
+            return jsonify({"error": "invalid_max_points"}), 400
+    else:
+        max_points = None
+
+    resolution = request.args.get("resolution", "").strip().lower() or ("auto" if max_points else "month")
+    if resolution == "auto":
+        # 从细到粗，周粒度没有分位数草图
+        candidates = [r for r in price_stats.TREND_RESOLUTIONS if not (percentiles and r == "week")]
+    elif resolution in price_stats.TREND_RESOLUTIONS:
+        if percentiles and resolution == "week":
+            return jsonify({"error": "stats_unsupported_resolution"}), 400
+        candidates = [resolution]
+    else:
+        return jsonify({"error": "invalid_resolution", "resolutions": list(price_stats.TREND_RESOLUTIONS)}), 400
+
+    region = request.args.get("region") or None
+    bizcircle = request.args.get("bizcircle") or None
+    source = resolve_data_source(city_code)
+
+    resolution = candidates[0]
+    if len(candidates) > 1 and max_points is not None:
+        # 由日期跨度算出各档点数的上限，取不超过 max_points 的最细一档（都超出取最粗），只计算这一档
+        span = get_trend_span(source, city_code, region, bizcircle)
+        counts = price_stats.trend_period_counts(*span) if span else {}
+        resolution = next((r for r in candidates if counts.get(r, 0) <= max_points), candidates[-1])
+    records = get_trend_series(source, city_code, region, bizcircle, resolution)
+
+    total_points = len(records)
+    if max_points is not None and total_points > max_points:
+        indices = downsample.lttb_indices([r[1] for r in records], max_points)
+        records = [records[i] for i in indices]
+
+    points = price_stats.rows_or_columns(PRICE_TREND_FIELDS, records, shape)
+    if percentiles:
+        sketches = get_month_sketches(source, city_code, region=region, bizcircle=bizcircle)
+        price_stats.attach_quantiles(
+            points, price_stats.rollup_month_sketches(sketches, resolution), percentiles, shape,
+            month_field="month"
+        )
+    return jsonify({
+        "points": points,
+        "resolution": resolution,
+        "total_points": total_points,
+        "downsampled": len(records) < total_points
+    })
 
-@app.get("/api/historical_avg_price")
+@bp.get("/api/historical_avg_price")
 def get_historical_avg_price():
     """
     获取历史均价统计（按年度或月度）
@@ -519,16 +1334,22 @@ def get_historical_avg_price():
     - end_year: 结束年份（默认 2025）- 兼容旧版
     - start_month: 起始月份（格式：YYYY-MM）- 新版
     - end_month: 结束月份（格式：YYYY-MM）- 新版
+    - shape: rows（默认）或 columns（列式输出，供图表使用）
+    - stats: p25,p50,p75,p90 / median / quantiles（可选，附加每月分位数）
     """
     city_code = request.args.get("city", "").strip().lower()
     if not city_code:
         return jsonify({"error": "missing_city"}), 400
     
     bizcircle = request.args.get("bizcircle", "").strip() or None
+    shape = get_shape_arg()
+    percentiles = get_stats_arg()
+    if percentiles is None:
+        return jsonify({"error": "invalid_stats"}), 400
     
     # 优先使用月份参数，如果没有则使用年份参数（兼容旧版）
-    start_month = request.args.get("start_month", "").strip()
-    end_month = request.args.get("end_month", "").strip()
+    start_month = result_cache.normalize_month(request.args.get("start_month", "").strip())
+    end_month = result_cache.normalize_month(request.args.get("end_month", "").strip())
     
     if start_month and end_month:
         # 使用月份参数
@@ -546,42 +1367,410 @@ def get_historical_avg_price():
         if start_year > end_year:
             return jsonify({"error": "invalid_year_range"}), 400
     
-    # --- 1) DB 可用：从数据库统计 ---
-    if db_is_available():
-        result = statistics.get_historical_avg_price_from_db(
-            db.session,
-            Transaction,
+    source = resolve_data_source(city_code)
+
+    def compute():
+        result = compute_avg()
+        if percentiles:
+            sketches = get_month_sketches(source, city_code, None, bizcircle, start_month, end_month)
+            price_stats.attach_quantiles(result, sketches, percentiles, shape)
+        return result
+
+    def compute_avg():
+        # --- 1) DB 可用：从数据库统计 ---
+        if source == "mysql":
+            return price_stats.get_historical_avg_price_from_db(
+                models.db.session,
+                models.Transaction,
+                city_code,
+                bizcircle,
+                start_month,
+                end_month,
+                shape=shape
+            )
+        # --- 2) SQLite：索引统计 ---
+        if source == "sqlite":
+            return sqlite_source.get_city_source(city_code).historical_avg_price(
+                bizcircle, start_month, end_month, shape=shape
+            )
+        # --- 3) 从 JSON 统计 ---
+        return price_stats.get_historical_avg_price_from_json(
+            DATA_DIR,
+            CITY_JSON_MAP,
             city_code,
             bizcircle,
             start_month,
-            end_month
+            end_month,
+            shape=shape
         )
-        return jsonify({
-            "ok": True,
-            "source": "mysql",
-            "city": city_code,
-            "bizcircle": bizcircle,
-            "data": result
-        })
-    
-    # --- 2) DB 不可用：从 JSON 统计 ---
-    result = statistics.get_historical_avg_price_from_json(
-        DATA_DIR,
-        CITY_JSON_MAP,
-        city_code,
-        bizcircle,
-        start_month,
-        end_month
-    )
+
+    key = historical_cache_key(source, city_code, bizcircle, start_month, end_month, shape, percentiles)
+    result = STATS_CACHE.get_or_compute(key, compute, cache_if=_has_rows)
     return jsonify({
         "ok": True,
-        "source": "json",
+        "source": source,
         "city": city_code,
         "bizcircle": bizcircle,
         "data": result
     })
 
-@app.get("/api/bizcircles")
+HISTORICAL_BATCH_MAX_SERIES = 50
+
+@bp.post("/api/historical_avg_price/batch")
+def get_historical_avg_price_batch():
+    """
+    批量获取历史均价（对比模式，替代逐个调用 /api/historical_avg_price）
+    请求体（JSON）：
+    - series: [{"city": "beijing", "bizcircle": "中关村"}, {"city": "shanghai"}, ...]（必填）
+    - start_month / end_month: 起止月份（格式：YYYY-MM，默认 2023-01 ~ 2025-12）
+    - shape: rows（默认）或 columns
+    同一城市的多个商圈合并为一次 JSON 扫描或一条分组 SQL；已缓存的序列直接复用。
+    返回的 series 与请求顺序一致。
+    """
+    body = request.get_json(silent=True) or {}
+    series = body.get("series")
+    if not isinstance(series, list) or not series:
+        return jsonify({"error": "missing_series"}), 400
+    if len(series) > HISTORICAL_BATCH_MAX_SERIES:
+        return jsonify({"error": "too_many_series", "max": HISTORICAL_BATCH_MAX_SERIES}), 400
+
+    start_month = result_cache.normalize_month(str(body.get("start_month") or "2023-01"))
+    end_month = result_cache.normalize_month(str(body.get("end_month") or "2025-12"))
+    try:
+        price_stats.month_range(start_month, end_month)
+    except ValueError:
+        return jsonify({"error": "invalid_month"}), 400
+    if start_month > end_month:
+        return jsonify({"error": "invalid_month_range"}), 400
+    shape = str(body.get("shape") or "rows").strip().lower()
+    if shape not in ("rows", "columns"):
+        shape = "rows"
+
+    targets = []
+    for item in series:
+        if not isinstance(item, dict):
+            return jsonify({"error": "invalid_series"}), 400
+        city_code = str(item.get("city") or "").strip().lower()
+        if not city_code:
+            return jsonify({"error": "missing_city"}), 400
+        bizcircle = str(item.get("bizcircle") or "").strip() or None
+        targets.append((city_code, bizcircle))
+
+    # 先查缓存，未命中的按城市分组，每个城市只扫一次
+    results = {}
+    sources = {}
+    misses = {}  # city_code -> [bizcircle, ...]
+    for city_code, bizcircle in dict.fromkeys(targets):
+        source = sources.get(city_code) or resolve_data_source(city_code)
+        sources[city_code] = source
+        key = historical_cache_key(source, city_code, bizcircle, start_month, end_month, shape)
+        found, value = STATS_CACHE.lookup(key)
+        if found:
+            results[(city_code, bizcircle)] = value
+        else:
+            misses.setdefault(city_code, []).append(bizcircle)
+
+    for city_code, bizcircles in misses.items():
+        source = sources[city_code]
+        if source == "mysql":
+            computed = price_stats.get_historical_avg_price_batch_from_db(
+                models.db.session, models.Transaction, city_code, bizcircles, start_month, end_month, shape
+            )
+        elif source == "sqlite":
+            computed = sqlite_source.get_city_source(city_code).historical_avg_price_batch(
+                bizcircles, start_month, end_month, shape
+            )
+        else:
+            computed = price_stats.get_historical_avg_price_batch_from_json(
+                DATA_DIR, CITY_JSON_MAP, city_code, bizcircles, start_month, end_month, shape
+            )
+        for bizcircle in bizcircles:
+            value = computed[bizcircle]
+            results[(city_code, bizcircle)] = value
+            if _has_rows(value):
+                key = historical_cache_key(source, city_code, bizcircle, start_month, end_month, shape)
+                STATS_CACHE.store(key, value)
+
+    return jsonify({
+        "ok": True,
+        "start_month": start_month,
+        "end_month": end_month,
+        "series": [
+            {
+                "city": city_code,
+                "bizcircle": bizcircle,
+                "source": sources[city_code],
+                "data": results[(city_code, bizcircle)],
+            }
+            for city_code, bizcircle in targets
+        ]
+    })
+
+@bp.get("/api/price_heatmap")
+def get_price_heatmap():
+    """
+    全城热力图：商圈（或区域）× 月份的均价矩阵，一次分组统计得到所有格子
+    查询参数：
+    - city: 城市代码（必填）
+    - dimension: bizcircle（默认）或 region
+    - start_month / end_month: 起止月份（格式：YYYY-MM，默认 2023-01 ~ 2025-12）
+    """
+    city_code = request.args.get("city", "").strip().lower()
+    if not city_code:
+        return jsonify({"error": "missing_city"}), 400
+
+    dimension = request.args.get("dimension", "bizcircle").strip().lower()
+    if dimension not in price_stats.HEATMAP_DIMENSIONS:
+        return jsonify({"error": "invalid_dimension"}), 400
+
+    start_month = result_cache.normalize_month(request.args.get("start_month", "").strip() or "2023-01")
+    end_month = result_cache.normalize_month(request.args.get("end_month", "").strip() or "2025-12")
+    try:
+        price_stats.month_range(start_month, end_month)
+    except ValueError:
+        return jsonify({"error": "invalid_month"}), 400
+    if start_month > end_month:
+        return jsonify({"error": "invalid_month_range"}), 400
+
+    source = resolve_data_source(city_code)
+
+    def compute():
+        if source == "mysql":
+            return price_stats.get_price_heatmap_from_db(
+                models.db.session, models.Transaction, city_code, dimension, start_month, end_month
+            )
+        if source == "sqlite":
+            return sqlite_source.get_city_source(city_code).price_heatmap(
+                dimension, start_month, end_month
+            )
+        return price_stats.get_price_heatmap_from_json(
+            DATA_DIR, CITY_JSON_MAP, city_code, dimension, start_month, end_month
+        )
+
+    key = ("price_heatmap", source, data_version(source, city_code),
+           city_code, dimension, start_month, end_month)
+    heatmap = STATS_CACHE.get_or_compute(key, compute, cache_if=lambda h: bool(h["names"]))
+    return jsonify({
+        "ok": True,
+        "source": source,
+        "city": city_code,
+        **heatmap
+    })
+
+@bp.get("/api/price_histogram")
+def get_price_histogram():
+    """
+    价格 / 面积分布直方图（固定对数分箱，按 (区域, 商圈, 月) 预先计数，查询时只把格子向量相加）
+    查询参数：
+    - city: 城市代码（必填）
+    - metric: unit_price_yuan_sqm（默认）或 area_sqm
+    - region / bizcircle: 区域 / 商圈（可选）
+    - start_month / end_month: 起止月份（格式：YYYY-MM，可选，默认全部月份）
+    """
+    city_code = request.args.get("city", "").strip().lower()
+    if not city_code:
+        return jsonify({"error": "missing_city"}), 400
+
+    metric = request.args.get("metric", "unit_price_yuan_sqm").strip()
+    if metric not in price_stats.HISTOGRAM_METRICS:
+        return jsonify({"error": "invalid_metric", "metrics": list(price_stats.HISTOGRAM_METRICS)}), 400
+
+    region = request.args.get("region", "").strip() or None
+    bizcircle = request.args.get("bizcircle", "").strip() or None
+    try:
+        start_month, end_month = get_month_range_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    source = resolve_data_source(city_code)
+
+    def compute():
+        if source == "mysql":
+            counts = price_stats.get_histogram_from_db(
+                models.db.session, models.MonthHistogram, city_code, metric, region, bizcircle, start_month, end_month
+            )
+        elif source == "sqlite":
+            counts = sqlite_source.get_city_source(city_code).price_histogram(
+                metric, region, bizcircle, start_month, end_month
+            )
+        else:
+            counts = price_stats.get_histogram_from_json(
+                DATA_DIR, CITY_JSON_MAP, city_code, metric, region, bizcircle, start_month, end_month
+            )
+        return price_histogram.histogram_result(metric, counts)
+
+    key = ("price_histogram", source, data_version(source, city_code),
+           city_code, metric, region, bizcircle, start_month, end_month)
+    histogram = STATS_CACHE.get_or_compute(key, compute, cache_if=lambda h: h["total"] > 0)
+    return jsonify({
+        "ok": True,
+        "source": source,
+        "city": city_code,
+        "region": region,
+        "bizcircle": bizcircle,
+        "start_month": start_month,
+        "end_month": end_month,
+        **histogram
+    })
+
+@bp.get("/api/facets")
+def get_facets():
+    """
+    列表筛选项计数：当前筛选条件下，区域 / 商圈 / 户型每个取值的记录数
+    筛选参数与 /api/listings 相同（不含起止月份）：city（必填）、region、bizcircle、layout、community（包含匹配）
+    每个维度的计数套用其他维度的筛选条件（不含自身），空取值和 0 条的取值不返回
+    """
+    city_code = request.args.get("city", "").strip().lower()
+    if not city_code:
+        return jsonify({"error": "missing_city"}), 400
+
+    filters = {dim: request.args.get(dim, "").strip() or None for dim in price_stats.FACET_DIMENSIONS}
+    community = request.args.get("community", "").strip() or None
+    source = resolve_data_source(city_code)
+
+    def compute():
+        if source == "mysql":
+            return price_stats.get_facets_from_db(models.db.session, models.Transaction, city_code, filters, community)
+        if source == "sqlite":
+            return sqlite_source.get_city_source(city_code).facets(filters, community)
+        return price_stats.get_facets_from_json(DATA_DIR, CITY_JSON_MAP, city_code, filters, community)
+
+    key = ("facets", source, data_version(source, city_code), city_code,
+           *(filters[dim] for dim in price_stats.FACET_DIMENSIONS), community)
+    facets = STATS_CACHE.get_or_compute(key, compute, cache_if=lambda f: f["total"] > 0)
+    return jsonify({
+        "ok": True,
+        "source": source,
+        "city": city_code,
+        **facets
+    })
+
+@bp.get("/api/comps")
+def get_comps():
+    """
+    可比成交：与给定房源最相似的 k 条成交，按距离升序
+    查询参数：
+    - city: 城市代码（必填）
+    - area_sqm: 面积（必填，> 0）
+    - bizcircle: 商圈（可选）；指定后只在该商圈内检索，否则全城
+    - room_count: 居室数（可选，>= 0）
+    - unit_price_yuan_sqm / total_price_wan: 单价或总价（可选，都给时用单价）
+    - as_of: 参照日期 YYYY-MM-DD（可选，默认数据中最近的成交日）
+    - k: 返回条数（可选，默认 20，1-100）
+    距离各维度的尺度见 comparables.COMPS_SCALES；没有给出的维度不参与距离
+    """
+    city_code = request.args.get("city", "").strip().lower()
+    if not city_code:
+        return jsonify({"error": "missing_city"}), 400
+
+    area = request.args.get("area_sqm", type=float)
+    if area is None or not area > 0 or area == float("inf"):
+        return jsonify({"error": "invalid_area"}), 400
+    rooms = request.args.get("room_count")
+    if rooms is not None:
+        rooms = request.args.get("room_count", type=int)
+        if rooms is None or rooms < 0:
+            return jsonify({"error": "invalid_room_count"}), 400
+    unit_price = request.args.get("unit_price_yuan_sqm", type=float)
+    total_price = request.args.get("total_price_wan", type=float)
+    if unit_price is None and total_price is not None:
+        unit_price = total_price * 10000 / area
+    if unit_price is not None and not (0 < unit_price < float("inf")):
+        return jsonify({"error": "invalid_price"}), 400
+    as_of = None
+    if raw_as_of := request.args.get("as_of", "").strip():
+        try:
+            as_of = datetime.strptime(raw_as_of, "%Y-%m-%d").date()
+        except ValueError:
+            return jsonify({"error": "invalid_as_of"}), 400
+    k = request.args.get("k", 20, type=int)
+    if k is None or not 1 <= k <= 100:
+        return jsonify({"error": "invalid_k"}), 400
+    bizcircle = request.args.get("bizcircle", "").strip() or None
+
+    source = resolve_data_source(city_code)
+    index = get_city_comps(source, city_code)
+    neighbours = []
+    if index is not None:
+        neighbours = index.query(
+            area, rooms, unit_price, as_of.toordinal() if as_of else None, bizcircle, k
+        )
+    items = fetch_items_by_ids(source, city_code, [row_id for row_id, _ in neighbours])
+
+    return jsonify({
+        "ok": True,
+        "source": source,
+        "city": city_code,
+        "query": {
+            "bizcircle": bizcircle,
+            "area_sqm": area,
+            "room_count": rooms,
+            "unit_price_yuan_sqm": round(unit_price) if unit_price is not None else None,
+            "as_of": as_of.isoformat() if as_of else (
+                date.fromordinal(index.latest_day).isoformat() if index is not None and index.latest_day else None
+            ),
+            "k": k,
+        },
+        "scales": comparables.COMPS_SCALES,
+        "items": [
+            {**items[row_id], "distance": round(distance, 4)}
+            for row_id, distance in neighbours if row_id in items
+        ]
+    })
+
+@bp.get("/api/cube")
+def get_cube():
+    """
+    多维聚合立方体的上卷 / 下钻查询
+    查询参数：
+    - city: 城市代码（必填）
+    - group_by: 分组维度，逗号分隔，取自 region / bizcircle / layout / month；为空时返回全量汇总一行
+    - region / bizcircle / layout: 维度过滤（可选）；下钻 = 在上一级的取值上过滤，再多按一个维度分组
+    - start_month / end_month: 起止月份（格式：YYYY-MM，可选，默认全部月份）
+    - shape: rows（默认）或 columns
+    """
+    city_code = request.args.get("city", "").strip().lower()
+    if not city_code:
+        return jsonify({"error": "missing_city"}), 400
+
+    group_by = []
+    for dim in request.args.get("group_by", "").strip().lower().split(","):
+        dim = dim.strip()
+        if dim and dim not in group_by:
+            group_by.append(dim)
+    if any(dim not in aggregate_cube.CUBE_DIMENSIONS for dim in group_by):
+        return jsonify({"error": "invalid_group_by", "dimensions": list(aggregate_cube.CUBE_DIMENSIONS)}), 400
+
+    filters = {dim: request.args.get(dim, "").strip() or None for dim in ("region", "bizcircle", "layout")}
+    try:
+        start_month, end_month = get_month_range_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    shape = get_shape_arg()
+
+    source = resolve_data_source(city_code)
+    cube = get_city_cube(source, city_code)
+    records = []
+    if cube is not None:
+        mask = cube.mask(
+            aggregate_cube.month_index_of(start_month) if start_month else None,
+            aggregate_cube.month_index_of(end_month) if end_month else None,
+            **filters
+        )
+        records = cube.rollup(group_by, mask)
+
+    return jsonify({
+        "ok": True,
+        "source": source,
+        "city": city_code,
+        "group_by": group_by,
+        "filters": {dim: value for dim, value in filters.items() if value},
+        "start_month": start_month,
+        "end_month": end_month,
+        "data": price_stats.rows_or_columns(aggregate_cube.result_fields(group_by), records, shape)
+    })
+
+@bp.get("/api/bizcircles")
 def get_bizcircles():
     """
     获取指定城市的所有商圈列表
@@ -592,36 +1781,46 @@ def get_bizcircles():
     if not city_code:
         return jsonify({"error": "missing_city"}), 400
     
-    # --- 1) DB 可用：从数据库获取 ---
-    if db_is_available():
-        bizcircles = statistics.get_available_bizcircles_from_db(
-            db.session,
-            Transaction,
+    source = resolve_data_source(city_code)
+
+    def compute():
+        # --- 1) DB 可用：从数据库获取 ---
+        if source == "mysql":
+            return price_stats.get_available_bizcircles_from_db(
+                models.db.session,
+                models.Transaction,
+                city_code
+            )
+        # --- 2) SQLite：索引去重 ---
+        if source == "sqlite":
+            return sqlite_source.get_city_source(city_code).bizcircles()
+        # --- 3) 从 JSON 获取 ---
+        return price_stats.get_available_bizcircles_from_json(
+            DATA_DIR,
+            CITY_JSON_MAP,
             city_code
         )
-        return jsonify({
-            "ok": True,
-            "source": "mysql",
-            "city": city_code,
-            "bizcircles": bizcircles
-        })
-    
-    # --- 2) DB 不可用：从 JSON 获取 ---
-    bizcircles = statistics.get_available_bizcircles_from_json(
-        DATA_DIR,
-        CITY_JSON_MAP,
-        city_code
-    )
+
+    key = ("bizcircles", source, data_version(source, city_code), city_code)
+    bizcircles = STATS_CACHE.get_or_compute(key, compute, cache_if=_has_rows)
     return jsonify({
         "ok": True,
-        "source": "json",
+        "source": source,
         "city": city_code,
         "bizcircles": bizcircles
     })
 
+@bp.get("/api/cache_stats")
+def get_cache_stats():
+    """统计结果缓存的命中 / 未命中 / 淘汰计数（本进程）"""
+    return jsonify({
+        "ok": True,
+        "stats_cache": STATS_CACHE.stats()
+    })
+
 # === 静态文件托管 ===
-@app.route("/", defaults={"path": ""})
-@app.route("/<path:path>")
+@bp.route("/", defaults={"path": ""})
+@bp.route("/<path:path>")
 def serve_frontend(path: str):
     if path.startswith("api"):
         return jsonify({"error": "not_found"}), 404
@@ -631,5 +1830,42 @@ def serve_frontend(path: str):
         return send_from_directory(FRONTEND_DIR, path)
     return send_from_directory(FRONTEND_DIR, "index.html")
 
+# === 应用工厂 ===
+def init_db(app: Flask) -> None:
+    """
+    启用 MySQL：绑定 Flask-SQLAlchemy（创建 engine，连接池第一次查询时才建立连接），
+    注册连接池事件计数与 SQL 计时 / 慢查询监听。数据模型和 SQLAlchemy 在这里第一次被导入
+    """
+    models.init_db(app)
+    for name, listener in _POOL_EVENT_LISTENERS.items():
+        if not sa.event.contains(sa.Pool, name, listener):
+            sa.event.listen(sa.Pool, name, listener)
+    request_timing.listen_sql()
+    slow_query.listen_sql()
+
+def create_app() -> Flask:
+    """
+    创建应用：JSON 编码器、请求耗时埋点、慢查询日志、数据库（仅 DB_ENABLED）、API 蓝图、剖析中间件
+    Flask-SQLAlchemy 不允许在处理过第一个请求后再初始化，所以数据库在这里按数据源配置一次性决定是否启用
+    """
+    app = Flask(__name__)
+    app.config['JSON_AS_ASCII'] = False
+    json_provider.init_app(app, JSON_ENCODER)
+    request_timing.init_app(app, TIMING, TIMING_LOG_INTERVAL)
+    request_timing.listen_minisql()
+    slow_query.init_app(SLOW_QUERY_MS, SLOW_QUERY_EXPLAIN)
+    if DB_ENABLED:
+        init_db(app)
+    app.register_blueprint(bp)
+    # 剖析中间件包在最外层；关闭时什么也不装。多 worker 的采样经指标目录下的 profile/ 子目录协调
+    profiler.init_app(app, PROFILER, has_admin_token, os.path.join(METRICS_DIR, "profile") if METRICS_DIR else None)
+    return app
+
+# 默认应用：gunicorn app:app、flask run 与各脚本直接使用
+app = create_app()
+
 if __name__ == "__main__":
+    # debug 重载器的监视进程（未设置 WERKZEUG_RUN_MAIN）不处理请求，只在实际服务的子进程中预热
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_warmup()
     app.run(host="127.0.0.1", port=5000, debug=True)
@@ -0,0 +1,287 @@
+"""
+后端函数的规模基准测试
+用 synthetic_data.py 生成 10 万 / 100 万 / 1000 万条的合成城市文件，对 JSON 数据路径上的各个函数计时并记录峰值内存，
+结果写成 JSON，和上一次的结果对比即可看出性能变化。
+
+- 每个 (用例, 规模) 在独立的子进程中运行：缓存、内存碎片互不影响，进程的最大 RSS 也只属于这个用例
+- 计时：先做一次预运行（不计入），再运行 repeat 次，报告中位数与最小值；每次运行前 gc.collect()
+- 内存：计时结束后在 tracemalloc 下再运行一次，取这次运行中 Python 与 numpy 分配的峰值（不含运行前已有的数据），
+  另报子进程的最大 RSS
+- 数据：同一 seed 生成的文件逐字节相同，已存在的文件直接复用；结果里记录 seed、文件大小与环境信息
+
+用例：
+    load_json             load_city_items_from_json：解析城市 JSON 文件
+    normalize_item        对全部原始记录调用 normalize_item
+    load_sorted           load_sorted_city_items：读取 + 归一化 + 排序（清空缓存后）
+    listings_filters      /api/listings 的 JSON 筛选（区域 / 商圈 / 户型 / 小区关键字 / 月份区间 / 深翻页），
+                          缓存已建好，计一轮 LISTINGS_REQUESTS 的总耗时
+    columns_build         price_stats.load_city_columns：构建列式缓存（清空缓存后）
+    historical_avg        price_stats.get_historical_avg_price_from_json：全市 + 最热商圈，列式缓存已建好
+
+用法：
+    cd backend
+    python benchmark.py                                   # 10 万、100 万条，全部用例
+    python benchmark.py --sizes 100k,1m,10m --repeat 5 --output bench_new.json
+    python benchmark.py --cases load_json,historical_avg --compare bench_old.json
+1000 万条的 JSON 文件约 4.8 GB，json.load 需要几十 GB 内存，按机器情况选择规模。
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import synthetic_data
+
+BACKEND_DIR = Path(__file__).resolve().parent
+DEFAULT_DATA_DIR = Path(os.environ.get("HPQAQ_BENCH_DIR", "/tmp/hpqaq-bench"))
+DEFAULT_SIZES = "100k,1m"
+
+# 对比时慢于上次超过这个比例的用例标记出来
+REGRESSION_RATIO = 1.10
+
+START_MONTH, END_MONTH = "2018-01", "2025-12"
+
+
+# === 用例（在子进程中执行；返回无参的 run 函数，准备工作在返回前做完） ===
+def _case_load_json(hpqaq, city: str) -> Callable:
+    return lambda: hpqaq.load_city_items_from_json(city)
+
+
+def _case_normalize_item(hpqaq, city: str) -> Callable:
+    raw_items = hpqaq.load_city_items_from_json(city)
+    normalize = hpqaq.normalize_item
+    return lambda: [normalize(raw) for raw in raw_items]
+
+
+def _case_load_sorted(hpqaq, city: str) -> Callable:
+    def run():
+        hpqaq._CITY_SORTED_CACHE.clear()
+        hpqaq.load_sorted_city_items(city)
+    return run
+
+
+def _top_values(hpqaq, city: str) -> Dict[str, str]:
+    """数据里最常见的区域 / 商圈 / 户型 / 小区（筛选条件用）"""
+    items, _, _ = hpqaq.load_sorted_city_items(city)
+    top = {}
+    for field in ("region", "bizcircle", "layout", "community"):
+        counts = Counter(x.get(field) for x in items if x.get(field))
+        top[field] = counts.most_common(1)[0][0]
+    return top
+
+
+def _listings_requests(top: Dict[str, str]) -> List[Dict]:
+    return [
+        {},
+        {"region": top["region"]},
+        {"bizcircle": top["bizcircle"]},
+        {"bizcircle": top["bizcircle"], "layout": top["layout"]},
+        {"community": top["community"][:2]},
+        {"start_month": "2024-01", "end_month": "2024-06"},
+        {"region": top["region"], "start_month": "2020-01", "end_month": "2022-12"},
+        {"region": top["region"], "page": 200},
+    ]
+
+
+def _case_listings_filters(hpqaq, city: str) -> Callable:
+    client = hpqaq.app.test_client()
+    requests_ = [dict(q, city=city, page_size=20) for q in _listings_requests(_top_values(hpqaq, city))]
+
+    def run():
+        for query in requests_:
+            resp = client.get("/api/listings", query_string=query)
+            if resp.status_code != 200:
+                raise RuntimeError(f"/api/listings {query} -> {resp.status_code}")
+    return run
+
+
+def _case_columns_build(hpqaq, city: str) -> Callable:
+    import price_stats
+
+    def run():
+        price_stats._CITY_COLUMNS_CACHE.clear()
+        price_stats.load_city_columns(hpqaq.DATA_DIR, hpqaq.CITY_JSON_MAP, city)
+    return run
+
+
+def _case_historical_avg(hpqaq, city: str) -> Callable:
+    import price_stats
+    bizcircle = _top_values(hpqaq, city)["bizcircle"]
+    price_stats.load_city_columns(hpqaq.DATA_DIR, hpqaq.CITY_JSON_MAP, city)
+
+    def run():
+        for biz in (None, bizcircle):
+            price_stats.get_historical_avg_price_from_json(
+                hpqaq.DATA_DIR, hpqaq.CITY_JSON_MAP, city, biz, START_MONTH, END_MONTH
+            )
+    return run
+
+
+CASES: Dict[str, Callable] = {
+    "load_json": _case_load_json,
+    "normalize_item": _case_normalize_item,
+    "load_sorted": _case_load_sorted,
+    "listings_filters": _case_listings_filters,
+    "columns_build": _case_columns_build,
+    "historical_avg": _case_historical_avg,
+}
+
+
+def _median(values: List[float]) -> float:
+    ordered = sorted(values)
+    mid = len(ordered) // 2
+    return ordered[mid] if len(ordered) % 2 else (ordered[mid - 1] + ordered[mid]) / 2
+
+
+def run_case(case: str, city: str, repeat: int) -> Dict:
+    """子进程内：导入 app（JSON 数据源），准备后计时 repeat 次，再在 tracemalloc 下跑一次"""
+    sys.path.insert(0, str(BACKEND_DIR))
+    import app as hpqaq
+
+    run = CASES[case](hpqaq, city)
+    run()
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "median_s": round(_median(times), 4),
+        "min_s": round(min(times), 4),
+        "peak_mb": round(peak / 2 ** 20, 1),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def _spawn(case: str, city: str, data_dir: Path, repeat: int) -> Dict:
+    env = dict(
+        os.environ,
+        HPQAQ_DATA_DIR=str(data_dir),
+        HPQAQ_DATA_SOURCE="json",
+        HPQAQ_WARMUP="off",
+        HPQAQ_TIMING="off",
+        HPQAQ_SLOW_QUERY_MS="off",
+        HPQAQ_RESULT_CACHE_SIZE="0",
+    )
+    env.pop("HPQAQ_METRICS_DIR", None)
+    cmd = [sys.executable, str(Path(__file__).resolve()), "--child", case, "--city", city, "--repeat", str(repeat)]
+    proc = subprocess.run(cmd, env=env, cwd=str(BACKEND_DIR), capture_output=True, text=True)
+    if proc.returncode != 0:
+        return {"error": (proc.stderr.strip().splitlines() or ["exit %d" % proc.returncode])[-1]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def ensure_dataset(data_dir: Path, rows: int, seed: int, messy: float) -> str:
+    """生成（或复用）合成城市文件，返回城市代码；seed / messy 不同的数据放在不同子目录"""
+    city = f"syn{synthetic_data.rows_label(rows)}"
+    path = data_dir / f"crawl_history_{city}.json"
+    if not path.exists():
+        start = time.perf_counter()
+        synthetic_data.write_city_file(path, rows, seed, messy)
+        print(f"[benchmark] generated {path} in {time.perf_counter() - start:.1f} s")
+    return city
+
+
+def _environment() -> Dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=str(BACKEND_DIR),
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    import numpy as np
+    return {
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def print_table(results: List[Dict], previous: Optional[Dict[tuple, Dict]] = None) -> None:
+    header = f"{'case':<18}{'rows':>10}{'median s':>11}{'min s':>10}{'peak MB':>10}{'RSS MB':>10}"
+    if previous is not None:
+        header += f"{'prev s':>10}{'ratio':>8}"
+    print(header)
+    for r in results:
+        if "error" in r:
+            print(f"{r['case']:<18}{r['rows']:>10}  ERROR {r['error']}")
+            continue
+        line = f"{r['case']:<18}{r['rows']:>10}{r['median_s']:>11.4f}{r['min_s']:>10.4f}{r['peak_mb']:>10.1f}{r['max_rss_mb']:>10.1f}"
+        old = (previous or {}).get((r["case"], r["rows"]))
+        if old and old.get("median_s"):
+            ratio = r["median_s"] / old["median_s"]
+            line += f"{old['median_s']:>10.4f}{ratio:>8.2f}" + ("  SLOWER" if ratio > REGRESSION_RATIO else "")
+        print(line)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Scaling benchmarks for the JSON data path")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="逗号分隔的规模，如 100k,1m,10m")
+    parser.add_argument("--cases", default=",".join(CASES), help="逗号分隔的用例名")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=synthetic_data.DEFAULT_SEED)
+    parser.add_argument("--messy", type=float, default=synthetic_data.DEFAULT_MESSY)
+    parser.add_argument("--data-dir", default=str(DEFAULT_DATA_DIR), help="合成数据目录（可复用）")
+    parser.add_argument("--output", help="结果 JSON 路径，默认 bench_<时间>.json")
+    parser.add_argument("--compare", help="与之前的结果 JSON 对比")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--city", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(run_case(args.child, args.city, args.repeat)))
+        return 0
+
+    cases = [c.strip() for c in args.cases.split(",") if c.strip()]
+    unknown = [c for c in cases if c not in CASES]
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(unknown)} (available: {', '.join(CASES)})")
+    sizes = [synthetic_data.parse_rows(s) for s in args.sizes.split(",") if s.strip()]
+    data_dir = Path(args.data_dir) / f"seed{args.seed}-messy{args.messy}"
+
+    previous = None
+    if args.compare:
+        old = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        previous = {(r["case"], r["rows"]): r for r in old.get("results", [])}
+
+    results = []
+    for rows in sizes:
+        city = ensure_dataset(data_dir, rows, args.seed, args.messy)
+        for case in cases:
+            print(f"[benchmark] {case} @ {rows} rows ...", flush=True)
+            results.append(dict(case=case, rows=rows, **_spawn(case, city, data_dir, args.repeat)))
+
+    report = {
+        "meta": dict(_environment(), seed=args.seed, messy=args.messy, repeat=args.repeat,
+                     files={str(rows): (data_dir / f"crawl_history_syn{synthetic_data.rows_label(rows)}.json").stat().st_size
+                            for rows in sizes}),
+        "results": results,
+    }
+    output = Path(args.output or f"bench_{time.strftime('%Y%m%d-%H%M%S')}.json")
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print()
+    print_table(results, previous)
+    print(f"\n[benchmark] results -> {output}")
+    return 1 if any("error" in r for r in results) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
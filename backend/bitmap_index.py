@@ -0,0 +1,253 @@
+"""
+压缩位图索引（Roaring 思路）
+- 行号（uint32）按高 16 位分块，每块一个容器：
+  记录数 <= 4096 时为有序 uint16 数组（稀疏），否则为 65536 位的位图（8 KB）
+- 交 / 并按块进行：数组 & 数组 = 有序求交，数组 & 位图 = 逐个测位，位图 & 位图 = 按字节与；
+  结果再按记录数选择容器类型
+- BitmapIndex：每个分类维度的每个取值、每个月份桶一个位图；多条件组合 = 位图 AND（月份区间 = 桶的 OR），
+  得到的有序行号直接用于分页，或转成布尔掩码交给列式聚合
+"""
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+ARRAY_MAX = 4096
+_CHUNK = 1 << 16
+
+
+def _cardinality(container: np.ndarray) -> int:
+    if container.dtype == np.uint8:
+        return int(np.count_nonzero(np.unpackbits(container)))
+    return len(container)
+
+
+def _bits_to_array(bits: np.ndarray) -> np.ndarray:
+    """位图容器 -> 有序 uint16 数组（按 bool 视图取非零，比直接对 uint8 快一个数量级）"""
+    return np.flatnonzero(np.unpackbits(bits, bitorder="little").view(bool)).astype(np.uint16)
+
+
+def _to_bits(container: np.ndarray) -> np.ndarray:
+    """任意容器 -> 位图容器（uint8[8192]，低位在前）"""
+    if container.dtype == np.uint8:
+        return container
+    flags = np.zeros(_CHUNK, dtype=bool)
+    flags[container] = True
+    return np.packbits(flags, bitorder="little")
+
+
+def _compact(container: np.ndarray) -> Optional[np.ndarray]:
+    """按记录数选择容器类型；空容器返回 None"""
+    card = _cardinality(container)
+    if card == 0:
+        return None
+    if container.dtype == np.uint8:
+        return _bits_to_array(container) if card <= ARRAY_MAX else container
+    return _to_bits(container) if card > ARRAY_MAX else container
+
+
+def _test_bits(bits: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """位图容器中 values（uint16）对应的位是否为 1"""
+    return ((bits[values >> 3] >> (values & 7).astype(np.uint8)) & 1).astype(bool)
+
+
+def _and(a: np.ndarray, b: np.ndarray) -> Optional[np.ndarray]:
+    if a.dtype == np.uint8 and b.dtype == np.uint8:
+        return _compact(np.bitwise_and(a, b))
+    if a.dtype == np.uint8:
+        a, b = b, a
+    if b.dtype == np.uint8:
+        return _compact(a[_test_bits(b, a)])
+    return _compact(np.intersect1d(a, b, assume_unique=True))
+
+
+def _or_all(containers: List[np.ndarray]) -> np.ndarray:
+    """同一块上多个容器的并：总数不超过 ARRAY_MAX 时合并数组，否则一次性按字节或"""
+    if len(containers) == 1:
+        return containers[0]
+    if all(c.dtype == np.uint16 for c in containers) and sum(map(len, containers)) <= ARRAY_MAX:
+        return np.unique(np.concatenate(containers))
+    bits = np.zeros(_CHUNK // 8, dtype=np.uint8)
+    flags = None
+    for c in containers:
+        if c.dtype == np.uint8:
+            np.bitwise_or(bits, c, out=bits)
+        else:
+            if flags is None:
+                flags = np.zeros(_CHUNK, dtype=bool)
+            flags[c] = True
+    if flags is not None:
+        np.bitwise_or(bits, np.packbits(flags, bitorder="little"), out=bits)
+    return _compact(bits)
+
+
+class RoaringBitmap:
+    """不可变的行号集合：keys 为有序的块号，containers 为对应的容器"""
+
+    __slots__ = ("keys", "containers", "_len")
+
+    def __init__(self, keys: Sequence[int] = (), containers: Sequence[np.ndarray] = ()):
+        self.keys = list(keys)
+        self.containers = list(containers)
+        self._len: Optional[int] = None
+
+    @classmethod
+    def from_sorted(cls, row_ids) -> "RoaringBitmap":
+        """升序、无重复的行号 -> 位图"""
+        row_ids = np.asarray(row_ids, dtype=np.int64)
+        if not len(row_ids):
+            return cls()
+        high = row_ids >> 16
+        bounds = np.flatnonzero(np.diff(high)) + 1
+        starts = np.concatenate(([0], bounds))
+        ends = np.concatenate((bounds, [len(row_ids)]))
+        keys, containers = [], []
+        for s, e in zip(starts.tolist(), ends.tolist()):
+            keys.append(int(high[s]))
+            containers.append(_compact((row_ids[s:e] & 0xFFFF).astype(np.uint16)))
+        return cls(keys, containers)
+
+    def __len__(self) -> int:
+        if self._len is None:
+            self._len = sum(_cardinality(c) for c in self.containers)
+        return self._len
+
+    @property
+    def nbytes(self) -> int:
+        return sum(c.nbytes for c in self.containers)
+
+    def __and__(self, other: "RoaringBitmap") -> "RoaringBitmap":
+        keys, containers = [], []
+        i = j = 0
+        while i < len(self.keys) and j < len(other.keys):
+            if self.keys[i] < other.keys[j]:
+                i += 1
+            elif self.keys[i] > other.keys[j]:
+                j += 1
+            else:
+                merged = _and(self.containers[i], other.containers[j])
+                if merged is not None:
+                    keys.append(self.keys[i])
+                    containers.append(merged)
+                i += 1
+                j += 1
+        return RoaringBitmap(keys, containers)
+
+    def __or__(self, other: "RoaringBitmap") -> "RoaringBitmap":
+        return RoaringBitmap.union(self, other)
+
+    @classmethod
+    def union(cls, *bitmaps: "RoaringBitmap") -> "RoaringBitmap":
+        """多个位图的并（按块合并，适合月份区间这类多路 OR）"""
+        by_key: Dict[int, List[np.ndarray]] = {}
+        for bitmap in bitmaps:
+            for key, container in zip(bitmap.keys, bitmap.containers):
+                by_key.setdefault(key, []).append(container)
+        keys = sorted(by_key)
+        return cls(keys, [_or_all(by_key[k]) for k in keys])
+
+    @classmethod
+    def intersection(cls, bitmaps: Iterable["RoaringBitmap"]) -> "RoaringBitmap":
+        """多个位图的交：从记录数最少的开始，中途为空即停"""
+        ordered = sorted(bitmaps, key=len)
+        if not ordered:
+            raise ValueError("intersection of no bitmaps")
+        result = ordered[0]
+        for bitmap in ordered[1:]:
+            if not result.keys:
+                break
+            result = result & bitmap
+        return result
+
+    def to_array(self) -> np.ndarray:
+        """升序的行号（int64）"""
+        parts = []
+        for key, c in zip(self.keys, self.containers):
+            low = _bits_to_array(c) if c.dtype == np.uint8 else c
+            parts.append(low.astype(np.int64) + (key << 16))
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+
+    def to_mask(self, n_rows: int) -> np.ndarray:
+        """长度为 n_rows 的布尔掩码"""
+        mask = np.zeros(n_rows, dtype=bool)
+        mask[self.to_array()] = True
+        return mask
+
+
+class BitmapIndex:
+    """
+    单个城市的位图索引：names / codes 为分类维度（编码 -1 为缺失，不建位图），
+    months 为月份序号（-1 为无日期），行号即数组下标
+    """
+
+    def __init__(self, names: Dict[str, List[str]], codes: Dict[str, np.ndarray], months: np.ndarray):
+        self.n_rows = len(months)
+        self.names = names
+        self._code_index = {
+            dim: {name: code for code, name in enumerate(dim_names)} for dim, dim_names in names.items()
+        }
+        self.bitmaps = {dim: self._group(codes[dim], len(names[dim])) for dim in names}
+
+        self.month = np.asarray(months)
+        months = self.month.astype(np.int64)
+        has_date = months >= 0
+        self.month_min = int(months[has_date].min()) if has_date.any() else 0
+        span = int(months.max()) - self.month_min + 1 if has_date.any() else 0
+        self.month_bitmaps = self._group(np.where(has_date, months - self.month_min, -1), span)
+
+    @staticmethod
+    def _group(codes: np.ndarray, size: int) -> List[RoaringBitmap]:
+        """编码 0..size-1 各自的行号位图（稳定排序后切片，行号保持升序）"""
+        codes = np.asarray(codes, dtype=np.int64)
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(size + 1))
+        return [RoaringBitmap.from_sorted(order[bounds[c]:bounds[c + 1]]) for c in range(size)]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(b.nbytes for bitmaps in self.bitmaps.values() for b in bitmaps) + sum(
+            b.nbytes for b in self.month_bitmaps
+        )
+
+    def equals(self, dimension: str, value: str) -> RoaringBitmap:
+        code = self._code_index[dimension].get(value, -1)
+        return self.bitmaps[dimension][code] if code >= 0 else RoaringBitmap()
+
+    def containing(self, dimension: str, text: str) -> RoaringBitmap:
+        """取值包含子串 text 的行（对去重后的名称判断，再 OR）"""
+        return RoaringBitmap.union(*(
+            self.bitmaps[dimension][code]
+            for code, name in enumerate(self.names[dimension]) if text in name
+        ))
+
+    def month_range(self, month_lo: Optional[int] = None, month_hi: Optional[int] = None) -> RoaringBitmap:
+        """有日期、月份序号落在 [month_lo, month_hi] 内的行"""
+        lo = 0 if month_lo is None else max(month_lo - self.month_min, 0)
+        hi = len(self.month_bitmaps) - 1 if month_hi is None else max(month_hi - self.month_min, -1)
+        return RoaringBitmap.union(*self.month_bitmaps[lo:hi + 1])
+
+    def query(
+        self,
+        equals: Optional[Dict[str, Optional[str]]] = None,
+        contains: Optional[Dict[str, Optional[str]]] = None,
+        month_lo: Optional[int] = None,
+        month_hi: Optional[int] = None,
+    ) -> Optional[RoaringBitmap]:
+        """
+        所有条件的交；没有任何条件时返回 None（表示全部行）
+        月份区间最后处理：其他条件的交已经很小（不到总行数的 1/8）时直接查月份列过滤，
+        否则与月份桶的并求交
+        """
+        parts = [self.equals(dim, value) for dim, value in (equals or {}).items() if value]
+        parts += [self.containing(dim, text) for dim, text in (contains or {}).items() if text]
+        result = RoaringBitmap.intersection(parts) if parts else None
+        if month_lo is None and month_hi is None:
+            return result
+        if result is not None and len(result) * 8 < self.n_rows:
+            rows = result.to_array()
+            months = self.month[rows]
+            keep = months >= (0 if month_lo is None else max(month_lo, 0))
+            if month_hi is not None:
+                keep &= months <= month_hi
+            return RoaringBitmap.from_sorted(rows[keep])
+        in_range = self.month_range(month_lo, month_hi)
+        return in_range if result is None else result & in_range
@@ -0,0 +1,263 @@
+"""
+列式聚合引擎（NumPy），供 JSON 数据源的统计使用
+- 每个城市的记录转换为几列数组：日序号 / 月份序号 / 周序号 int32（date.toordinal() / year * 12 + month - 1 / ISO 周，无日期为 -1）、
+  单价 / 总价 / 面积 float64、区域 / 商圈 / 户型 / 小区的分类编码 int32（缺失为 -1）
+- 过滤 = 布尔掩码，分组 = np.bincount；多条件组合可先走位图索引（bitmap_index）得到行号
+- 分组键在加载时预先算好（月份 / 维度编码 × 月份 -> 从 1 开始的桶号，无日期或维度为空的记录为 0），
+  聚合时 键 * 掩码 把过滤掉的记录送进 0 号桶，再对整列 bincount，不做布尔索引拷贝
+- bincount 按数组顺序逐个累加，求和顺序与逐条 Python 累加相同，均价取整后结果完全一致
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from bitmap_index import BitmapIndex
+from price_histogram import HISTOGRAM_BINS, group_histograms
+from quantile_sketch import paired_group_sketches
+
+
+def encode_categories(values: Sequence[Optional[str]]) -> Tuple[List[str], np.ndarray]:
+    """
+    ["民治", None, "坂田", "民治"] -> (["坂田", "民治"], [1, -1, 0, 1])
+    编码按名称排序分配，空值 / 非字符串编码为 -1
+    """
+    names = sorted({v for v in values if isinstance(v, str) and v})
+    index = {name: code for code, name in enumerate(names)}
+    codes = np.fromiter((index.get(v, -1) for v in values), dtype=np.int32, count=len(values))
+    return names, codes
+
+
+def month_label(month_index: int) -> str:
+    """月份序号 -> "YYYY-MM" """
+    year, month0 = divmod(int(month_index), 12)
+    return f"{year}-{month0 + 1:02d}"
+
+
+def calendar_indexes(days) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    日序号（date.toordinal()，无日期为 -1）-> (月份序号, 周序号)，无日期的记录两者都为 -1
+    周序号 = (日序号 - 1) // 7：0001-01-01 是周一，每周从周一开始，与 ISO 周一致
+    """
+    days = np.asarray(days, dtype=np.int64)
+    has_date = days > 0
+    dates = np.datetime64("0001-01-01", "D") + (np.where(has_date, days, 1) - 1)
+    months = dates.astype("datetime64[M]").astype(np.int64) + 1970 * 12
+    return np.where(has_date, months, -1), np.where(has_date, (days - 1) // 7, -1)
+
+
+class CityColumns:
+    """单个城市的列式数据（只读）"""
+
+    def __init__(
+        self,
+        months: Sequence[int],
+        unit_prices: Sequence[float],
+        total_prices: Sequence[float],
+        regions: Sequence[Optional[str]],
+        bizcircles: Sequence[Optional[str]],
+        areas: Sequence[float] = (),
+        layouts: Sequence[Optional[str]] = (),
+        weeks: Sequence[int] = (),
+        communities: Sequence[Optional[str]] = (),
+        days: Sequence[int] = (),
+    ):
+        self.month = np.asarray(months, dtype=np.int32)
+        self.day = np.asarray(days, dtype=np.int32) if len(days) else np.full(len(self.month), -1, dtype=np.int32)
+        self.week = np.asarray(weeks, dtype=np.int32) if len(weeks) else np.full(len(self.month), -1, dtype=np.int32)
+        self.unit = np.asarray(unit_prices, dtype=np.float64)
+        self.total = np.asarray(total_prices, dtype=np.float64)
+        self.area = np.asarray(areas, dtype=np.float64) if len(areas) else np.zeros(len(self.month))
+        self.names: Dict[str, List[str]] = {}
+        self.codes: Dict[str, np.ndarray] = {}
+        self.names["region"], self.codes["region"] = encode_categories(regions)
+        self.names["bizcircle"], self.codes["bizcircle"] = encode_categories(bizcircles)
+        self.names["layout"], self.codes["layout"] = encode_categories(
+            layouts if len(layouts) else [None] * len(self.month)
+        )
+        self.names["community"], self.codes["community"] = encode_categories(
+            communities if len(communities) else [None] * len(self.month)
+        )
+        self._code_index = {
+            dim: {name: code for code, name in enumerate(names)} for dim, names in self.names.items()
+        }
+
+        has_date = self.month >= 0
+        self.month_min = int(self.month[has_date].min()) if has_date.any() else 0
+        self.month_span = int(self.month.max()) - self.month_min + 1 if has_date.any() else 1
+        self._month_key = np.where(has_date, self.month.astype(np.int64) - self.month_min + 1, 0)
+        self._group_key: Dict[str, np.ndarray] = {}
+        self._period_keys: Dict[str, Tuple[np.ndarray, int, int]] = {}
+        self._cell_sketches: Optional[List[tuple]] = None
+        self._cell_histograms: Dict[str, List[tuple]] = {}
+        self._bitmap_index: Optional[BitmapIndex] = None
+
+    def __len__(self) -> int:
+        return len(self.month)
+
+    def code_of(self, dimension: str, name: str) -> int:
+        """名称 -> 编码；不存在返回 -1"""
+        return self._code_index[dimension].get(name, -1)
+
+    def select(self, dimension: str, names) -> np.ndarray:
+        """维度取值属于 names 的记录（一次查表，不存在的名称忽略）"""
+        flags = np.zeros(len(self.names[dimension]) + 1, dtype=bool)  # 末位对应编码 -1
+        for name in names:
+            code = self.code_of(dimension, name)
+            if code >= 0:
+                flags[code] = True
+        return flags[self.codes[dimension]]
+
+    def bitmap_index(self) -> BitmapIndex:
+        """区域 / 商圈 / 户型 / 小区 + 月份桶的位图索引（首次使用时建好并缓存）"""
+        if self._bitmap_index is None:
+            self._bitmap_index = BitmapIndex(self.names, self.codes, self.month)
+        return self._bitmap_index
+
+    def containing(self, dimension: str, text: str) -> np.ndarray:
+        """维度取值包含子串 text 的记录（只对去重后的名称做子串判断，再查表）"""
+        return self.select(dimension, [name for name in self.names[dimension] if text in name])
+
+    def mask(
+        self,
+        month_lo: Optional[int] = None,
+        month_hi: Optional[int] = None,
+        **equals: Optional[str],
+    ) -> np.ndarray:
+        """
+        有日期且落在 [month_lo, month_hi] 内、并且各维度等于给定名称的记录
+        例：mask(region="龙华区")；名称为空表示不过滤该维度，名称不存在时没有记录匹配
+        """
+        m = self.month >= (0 if month_lo is None else max(month_lo, 0))
+        if month_hi is not None:
+            m &= self.month <= month_hi
+        for dimension, name in equals.items():
+            if name:
+                code = self.code_of(dimension, name)
+                if code < 0:
+                    return np.zeros(len(self.month), dtype=bool)
+                m &= self.codes[dimension] == code
+        return m
+
+    def _sums(self, key: np.ndarray, mask: np.ndarray, size: int):
+        """对 key * mask 做 bincount，返回去掉 0 号桶后非空桶的 (桶号 - 1, 单价和, 总价和, 条数)"""
+        key = key * mask
+        count = np.bincount(key, minlength=size + 1)
+        nz = np.flatnonzero(count[1:]) + 1
+        sum_unit = np.bincount(key, weights=self.unit, minlength=size + 1)
+        sum_total = np.bincount(key, weights=self.total, minlength=size + 1)
+        return nz - 1, sum_unit[nz].tolist(), sum_total[nz].tolist(), count[nz].tolist()
+
+    def monthly(self, mask: np.ndarray) -> Tuple[List[int], List[float], List[float], List[int]]:
+        """
+        掩码内的记录按月分组求和
+        返回 (月份序号, 单价和, 总价和, 条数)，只含有记录的月份，按月份升序
+        """
+        offset, sum_unit, sum_total, count = self._sums(self._month_key, mask, self.month_span)
+        return (offset + self.month_min).tolist(), sum_unit, sum_total, count
+
+    def _period_key(self, resolution: str) -> Tuple[np.ndarray, int, int]:
+        """week / quarter 的分组键（同月份键，从 1 开始，无日期为 0），首次使用时算好并缓存"""
+        cached = self._period_keys.get(resolution)
+        if cached is None:
+            if resolution == "week":
+                index = self.week
+            else:
+                index = np.where(self.month >= 0, self.month // 3, -1)
+            has_date = index >= 0
+            base = int(index[has_date].min()) if has_date.any() else 0
+            span = int(index.max()) - base + 1 if has_date.any() else 1
+            key = np.where(has_date, index.astype(np.int64) - base + 1, 0)
+            cached = self._period_keys[resolution] = (key, base, span)
+        return cached
+
+    def periodic(
+        self,
+        mask: np.ndarray,
+        resolution: str = "month",
+    ) -> Tuple[List[int], List[float], List[float], List[int]]:
+        """
+        掩码内的记录按 周（week）/ 月（month）/ 季度（quarter）分组求和
+        返回 (周期序号, 单价和, 总价和, 条数)；季度序号为 year * 4 + quarter - 1
+        """
+        if resolution == "month":
+            return self.monthly(mask)
+        key, base, span = self._period_key(resolution)
+        offset, sum_unit, sum_total, count = self._sums(key, mask, span)
+        return (offset + base).tolist(), sum_unit, sum_total, count
+
+    def date_span(self, mask: np.ndarray) -> Optional[Tuple[int, int]]:
+        """掩码内有成交日期的记录的 (最早, 最晚) 日序号；没有则返回 None"""
+        days = self.day[mask & (self.day > 0)]
+        if not len(days):
+            return None
+        return int(days.min()), int(days.max())
+
+    def grouped_monthly(
+        self,
+        dimension: str,
+        mask: np.ndarray,
+    ) -> Tuple[List[int], List[int], List[float], List[float], List[int]]:
+        """
+        掩码内、维度非空的记录按 (维度编码, 月份) 分组求和（一次 bincount）
+        返回 (维度编码, 月份序号, 单价和, 总价和, 条数)，只含非空格子，按编码、月份升序
+        """
+        key = self._group_key.get(dimension)
+        if key is None:
+            codes = self.codes[dimension]
+            key = np.where(
+                (codes >= 0) & (self._month_key > 0),
+                codes.astype(np.int64) * self.month_span + self._month_key,
+                0,
+            )
+            self._group_key[dimension] = key
+        size = len(self.names[dimension]) * self.month_span
+        cell, sum_unit, sum_total, count = self._sums(key, mask, size)
+        group, month_offset = np.divmod(cell, self.month_span)
+        return group.tolist(), (month_offset + self.month_min).tolist(), sum_unit, sum_total, count
+
+    def _cells(self):
+        """有日期记录的 (区域, 商圈, 月) 格子编号，以及编号 -> (区域, 商圈, year_month) 的解码函数"""
+        n_biz = len(self.names["bizcircle"]) + 1
+        has_date = self.month >= 0
+        cell = (
+            (self.codes["region"].astype(np.int64) + 1) * n_biz
+            + (self.codes["bizcircle"] + 1)
+        ) * self.month_span + (self._month_key - 1)
+
+        regions = [None] + self.names["region"]
+        bizcircles = [None] + self.names["bizcircle"]
+
+        def decode(cell_id):
+            rest, month_offset = divmod(cell_id, self.month_span)
+            region_code, biz_code = divmod(rest, n_biz)
+            return regions[region_code], bizcircles[biz_code], month_label(self.month_min + month_offset)
+
+        return cell[has_date], has_date, decode
+
+    def cell_sketches(self) -> List[tuple]:
+        """
+        按 (区域, 商圈, 月) 分格的单价 / 总价分位数草图（首次调用时建好并缓存）
+        返回 [(区域, 商圈, year_month, 单价草图, 总价草图), ...]，区域 / 商圈为空时为 None
+        """
+        if self._cell_sketches is None:
+            cell, has_date, decode = self._cells()
+            sketches = paired_group_sketches(cell, self.unit[has_date], self.total[has_date])
+            self._cell_sketches = [
+                (*decode(cell_id), unit_sketch, total_sketch)
+                for cell_id, (unit_sketch, total_sketch) in sketches.items()
+            ]
+        return self._cell_sketches
+
+    def cell_histograms(self, metric: str) -> List[tuple]:
+        """
+        按 (区域, 商圈, 月) 分格的分箱计数（metric 见 price_histogram.HISTOGRAM_BINS，首次调用时建好并缓存）
+        返回 [(区域, 商圈, year_month, 计数向量), ...]
+        """
+        if metric not in self._cell_histograms:
+            values = self.unit if metric == "unit_price_yuan_sqm" else self.area
+            cell, has_date, decode = self._cells()
+            histograms = group_histograms(cell, values[has_date], HISTOGRAM_BINS[metric])
+            self._cell_histograms[metric] = [
+                (*decode(cell_id), counts) for cell_id, counts in histograms.items()
+            ]
+        return self._cell_histograms[metric]
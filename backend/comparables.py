@@ -0,0 +1,195 @@
+"""
+可比成交（最近邻）检索
+- 每条成交映射为 4 维特征：log(面积) / 0.1、居室数、log(单价) / 0.1、成交日序号 / 180，
+  即面积、单价相差约 10%、居室差 1 间、成交时间相差半年，各记 1 个单位的距离
+- 按商圈分区（分类维度不参与距离），每个分区一棵 KD 树，另有一棵全城的树；首次查询该分区时建好
+- 查询没有给出的维度（居室 / 价格）权重为 0，不参与距离也不参与剪枝；成交日期总是参与，越近越相似
+- 面积、单价、成交日期、居室数任一缺失的记录不作为可比成交
+"""
+import heapq
+import math
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from columnar import encode_categories
+
+# 各维度 1 个单位距离对应的差异
+COMPS_SCALES = {
+    "area_sqm": 0.1,  # log 面积（约 10%）
+    "room_count": 1.0,  # 居室数
+    "unit_price_yuan_sqm": 0.1,  # log 单价（约 10%）
+    "days": 180.0,  # 成交日期（天）
+}
+
+_ROOMS_RE = re.compile(r"(\d+)\s*室")
+
+
+def room_count(layout: Optional[str]) -> Optional[int]:
+    """"3室2厅" -> 3；解析不出返回 None"""
+    if not isinstance(layout, str):
+        return None
+    m = _ROOMS_RE.search(layout)
+    return int(m.group(1)) if m else None
+
+
+class KDTree:
+    """
+    静态 KD 树：按取值跨度最大的轴在中位数处切分，叶子不超过 leaf_size 个点
+    点按叶子顺序重排（叶内连续），节点记录包围盒，查询时按包围盒下界做最佳优先搜索
+    """
+
+    def __init__(self, points: np.ndarray, ids: np.ndarray, leaf_size: int = 32):
+        self.leaf_size = leaf_size
+        self.start: List[int] = []
+        self.end: List[int] = []
+        self.left: List[int] = []
+        self.right: List[int] = []
+        self._lows: List[np.ndarray] = []
+        self._highs: List[np.ndarray] = []
+        # 按列存放（每个轴一行连续内存），切分时原地重排当前区间，节点的包围盒直接在切片视图上求
+        columns = np.ascontiguousarray(points.T)
+        order = np.arange(len(points))
+        if len(points):
+            self._build(columns, order, 0, len(points))
+        self.lows = np.array(self._lows)
+        self.highs = np.array(self._highs)
+        self.points = np.ascontiguousarray(columns.T)
+        self.ids = np.asarray(ids)[order]
+
+    def _build(self, columns: np.ndarray, order: np.ndarray, s: int, e: int) -> int:
+        node = len(self.start)
+        block = columns[:, s:e]
+        low, high = block.min(axis=1), block.max(axis=1)
+        self.start.append(s)
+        self.end.append(e)
+        self.left.append(-1)
+        self.right.append(-1)
+        self._lows.append(low)
+        self._highs.append(high)
+        axis = int(np.argmax(high - low))
+        if e - s > self.leaf_size and high[axis] > low[axis]:
+            mid = (s + e) // 2
+            part = np.argpartition(block[axis], mid - s)
+            columns[:, s:e] = block[:, part]
+            order[s:e] = order[s:e][part]
+            self.left[node] = self._build(columns, order, s, mid)
+            self.right[node] = self._build(columns, order, mid, e)
+        return node
+
+    def _bound(self, node: int, q: np.ndarray, w: np.ndarray) -> float:
+        """q 到节点包围盒的加权平方距离（下界）"""
+        gap = np.maximum(np.maximum(self.lows[node] - q, q - self.highs[node]), 0.0)
+        return float((gap * gap * w).sum())
+
+    def query(self, q: np.ndarray, w: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        加权平方距离最小的 k 个点，返回 (ids, 平方距离)，按 (距离, id) 升序
+        与对全部点逐个计算再排序的结果完全一致（距离相同的点按 id 决定先后）
+        """
+        best_ids = np.zeros(0, dtype=self.ids.dtype)
+        best_d2 = np.zeros(0)
+        if not len(self.ids) or k <= 0:
+            return best_ids, best_d2
+
+        kth = math.inf
+        heap = [(0.0, 0)]
+        while heap:
+            bound, node = heapq.heappop(heap)
+            if bound > kth:
+                break
+            left = self.left[node]
+            if left < 0:
+                s, e = self.start[node], self.end[node]
+                diff = self.points[s:e] - q
+                d2 = (diff * diff * w).sum(axis=1)
+                ids = np.concatenate((best_ids, self.ids[s:e]))
+                d2 = np.concatenate((best_d2, d2))
+                keep = np.lexsort((ids, d2))[:k]
+                best_ids, best_d2 = ids[keep], d2[keep]
+                if len(best_d2) == k:
+                    kth = float(best_d2[-1])
+                continue
+            for child in (left, self.right[node]):
+                child_bound = self._bound(child, q, w)
+                if child_bound <= kth:
+                    heapq.heappush(heap, (child_bound, child))
+        return best_ids, best_d2
+
+
+class CompsIndex:
+    """单个城市的可比成交索引（只读）：row_ids 为各数据源的记录 id（JSON 为文件下标）"""
+
+    def __init__(
+        self,
+        row_ids: Sequence[int],
+        bizcircles: Sequence[Optional[str]],
+        layouts: Sequence[Optional[str]],
+        areas: Sequence[float],
+        unit_prices: Sequence[float],
+        days: Sequence[int],
+    ):
+        rooms = np.array([room_count(v) for v in layouts], dtype=np.float64)
+        area = np.asarray(areas, dtype=np.float64)
+        unit = np.asarray(unit_prices, dtype=np.float64)
+        day = np.asarray(days, dtype=np.int64)
+        valid = (area > 0) & (unit > 0) & (day > 0) & ~np.isnan(rooms)
+
+        self.row_ids = np.asarray(row_ids, dtype=np.int64)[valid]
+        self.points = np.column_stack((
+            np.log(area[valid]) / COMPS_SCALES["area_sqm"],
+            rooms[valid] / COMPS_SCALES["room_count"],
+            np.log(unit[valid]) / COMPS_SCALES["unit_price_yuan_sqm"],
+            day[valid] / COMPS_SCALES["days"],
+        ))
+        self.latest_day = int(day[valid].max()) if valid.any() else 0
+        self.names, self.codes = encode_categories([b for b, ok in zip(bizcircles, valid.tolist()) if ok])
+        self._code_index = {name: code for code, name in enumerate(self.names)}
+        self._trees: Dict[int, KDTree] = {}
+
+    def __len__(self) -> int:
+        return len(self.row_ids)
+
+    def _tree(self, code: int) -> KDTree:
+        """某个商圈分区（code = -1 为全城）的 KD 树，首次使用时建好"""
+        tree = self._trees.get(code)
+        if tree is None:
+            rows = slice(None) if code < 0 else np.flatnonzero(self.codes == code)
+            tree = KDTree(self.points[rows], self.row_ids[rows])
+            self._trees[code] = tree
+        return tree
+
+    def build_trees(self) -> None:
+        """建好全城和所有商圈分区的树（启动预热用，之后的查询不再承担建树开销）"""
+        self._tree(-1)
+        for code in range(len(self.names)):
+            self._tree(code)
+
+    def query(
+        self,
+        area_sqm: float,
+        rooms: Optional[int] = None,
+        unit_price: Optional[float] = None,
+        day: Optional[int] = None,
+        bizcircle: Optional[str] = None,
+        k: int = 20,
+    ) -> List[Tuple[int, float]]:
+        """
+        最相似的 k 条成交 [(row_id, 距离), ...]，按距离升序
+        day 默认为索引中最近的成交日；bizcircle 为空时在全城范围检索，不存在的商圈返回空列表
+        """
+        code = -1
+        if bizcircle:
+            code = self._code_index.get(bizcircle, -2)
+            if code == -2:
+                return []
+        q = np.array([
+            math.log(area_sqm) / COMPS_SCALES["area_sqm"],
+            (rooms or 0) / COMPS_SCALES["room_count"],
+            math.log(unit_price) / COMPS_SCALES["unit_price_yuan_sqm"] if unit_price else 0.0,
+            (day or self.latest_day) / COMPS_SCALES["days"],
+        ])
+        w = np.array([1.0, float(rooms is not None), float(bool(unit_price)), 1.0])
+        ids, d2 = self._tree(code).query(q, w, k)
+        return [(i, math.sqrt(d)) for i, d in zip(ids.tolist(), d2.tolist())]
@@ -0,0 +1,72 @@
+"""
+数据库结构迁移：按模型定义补建缺失的索引
+db.create_all() 只会创建不存在的表，已存在的 transactions 表不会自动加上新索引，
+这里对比数据库里现有的索引名，缺哪个建哪个，可重复执行。
+另外为还没有分位数草图 / 分布直方图 / 聚合立方体的城市补建
+transaction_month_sketches / transaction_month_histograms / transaction_month_cube。
+
+用法：
+    cd backend
+    python db_migrate.py
+"""
+from sqlalchemy import inspect, text
+
+from models import create_cli_app, db, Transaction, MonthSketch, MonthHistogram, MonthCube
+
+
+def ensure_indexes(engine, model):
+    """为 model 对应的表补建缺失的索引，返回新建的索引名列表"""
+    table = model.__table__
+    existing = {ix["name"] for ix in inspect(engine).get_indexes(table.name)}
+
+    created = []
+    for index in sorted(table.indexes, key=lambda ix: ix.name):
+        if index.name in existing:
+            continue
+        print(f"Creating index {index.name} on {table.name} ...")
+        index.create(bind=engine)
+        created.append(index.name)
+    return created
+
+
+def ensure_month_cells(db_session):
+    """为 transactions 中有数据、但还没有草图 / 直方图 / 立方体的城市补建，返回处理的 (表名, 城市) 列表"""
+    import price_stats  # 统计模块连带 numpy、列式缓存等；import_data.py 只用 ensure_indexes，不必为它导入
+
+    cities = {r[0] for r in db_session.query(Transaction.city_code).distinct() if r[0]}
+    targets = (
+        (MonthSketch, price_stats.rebuild_month_sketches_in_db),
+        (MonthHistogram, price_stats.rebuild_month_histograms_in_db),
+        (MonthCube, price_stats.rebuild_month_cube_in_db),
+    )
+
+    rebuilt = []
+    for model, rebuild in targets:
+        done = {r[0] for r in db_session.query(model.city_code).distinct()}
+        for city_code in sorted(cities - done):
+            rows = rebuild(db_session, Transaction, model, city_code)
+            print(f"Built {rows} rows in {model.__tablename__} for {city_code}")
+            rebuilt.append((model.__tablename__, city_code))
+    return rebuilt
+
+
+def main():
+    with create_cli_app().app_context():
+        db.create_all()
+        created = ensure_indexes(db.engine, Transaction)
+
+        if created and db.engine.dialect.name == "mysql":
+            # 新索引建好后刷新统计信息，让优化器尽快选上它们
+            with db.engine.begin() as conn:
+                conn.execute(text(f"ANALYZE TABLE {Transaction.__tablename__}"))
+
+        if created:
+            print(f"Done: created {len(created)} index(es): {', '.join(created)}")
+        else:
+            print("Done: all indexes already exist.")
+
+        ensure_month_cells(db.session)
+
+
+if __name__ == "__main__":
+    main()
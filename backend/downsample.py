@@ -0,0 +1,42 @@
+"""
+走势序列的降采样：Largest-Triangle-Three-Buckets（LTTB）
+- 保留首尾两点，中间的点均分为 threshold - 2 个桶，每个桶选一个点：
+  与上一个选中点、下一个桶的平均点构成的三角形面积最大的那个
+- 只挑选原有的点，不做插值，选中点的样本数等字段原样保留；峰谷比等间隔抽样保留得更好
+"""
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+
+def lttb_indices(ys: Sequence[float], threshold: int, xs: Optional[Sequence[float]] = None) -> List[int]:
+    """
+    从 len(ys) 个点中选出 threshold 个，返回升序的下标
+    xs 默认为 0, 1, 2, ...；threshold >= 点数或 < 3 时返回全部下标
+    """
+    n = len(ys)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+
+    y = np.asarray(ys, dtype=np.float64)
+    x = np.arange(n, dtype=np.float64) if xs is None else np.asarray(xs, dtype=np.float64)
+    every = (n - 2) / (threshold - 2)
+
+    selected = [0]
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_start = end
+        next_end = min(int((i + 2) * every) + 1, n)
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(area.argmax())
+        selected.append(a)
+    selected.append(n - 1)
+    return selected
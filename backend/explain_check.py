@@ -0,0 +1,149 @@
+"""
+EXPLAIN 回归检查：确认热点查询仍然走复合索引
+- 聚合查询（走势、历史均价、热力图、商圈列表）要求 Extra 含 "Using index"（只扫索引，不回表）
+- 列表查询要求按索引顺序读取，不出现 "Using filesort"
+任一检查不通过时以非 0 状态码退出，可以放在导入数据 / 改动查询之后跑一遍。
+
+用法：
+    cd backend
+    python explain_check.py                       # 自动取库里第一个城市、商圈、区域
+    python explain_check.py --city sz --bizcircle 坂田 --region 龙华区
+"""
+import argparse
+import sys
+
+from app import (
+    app,
+    build_listings_query,
+    build_price_trend_query,
+    apply_listings_cursor,
+)
+import price_stats
+from models import db, Transaction
+
+INDEX_CITY_DATE = "ix_transactions_city_date_id"
+INDEX_CITY_BIZ = "ix_transactions_city_biz_date"
+INDEX_CITY_REGION = "ix_transactions_city_region_date"
+
+
+def explain(query):
+    """对 ORM 查询执行 EXPLAIN，返回每行的 dict"""
+    compiled = query.statement.compile(dialect=db.engine.dialect)
+    with db.engine.connect() as conn:
+        result = conn.exec_driver_sql(f"EXPLAIN {compiled}", compiled.params)
+        return [dict(r._mapping) for r in result]
+
+
+def check_plan(name, query, keys, index_only=False, no_filesort=False):
+    """检查 transactions 表的执行计划，返回问题列表（空列表表示通过）"""
+    problems = []
+    rows = [r for r in explain(query) if r.get("table") == Transaction.__tablename__]
+    if not rows:
+        return [f"{name}: no plan row for {Transaction.__tablename__}"]
+
+    for r in rows:
+        extra = r.get("Extra") or ""
+        if r.get("type") == "ALL":
+            problems.append(f"{name}: full table scan")
+        if r.get("key") not in keys:
+            problems.append(f"{name}: uses key {r.get('key')!r}, expected one of {sorted(keys)}")
+        if index_only and "Using index" not in extra:
+            problems.append(f"{name}: not index-only (Extra: {extra!r})")
+        if no_filesort and "Using filesort" in extra:
+            problems.append(f"{name}: needs filesort (Extra: {extra!r})")
+
+    status = "FAIL" if problems else "ok"
+    first = rows[0]
+    print(f"[{status:4}] {name:<28} key={first.get('key')} type={first.get('type')} "
+          f"rows={first.get('rows')} extra={first.get('Extra')!r}")
+    return problems
+
+
+def pick_sample(column, city_code=None):
+    query = db.session.query(column).filter(column.isnot(None), column != "")
+    if city_code:
+        query = query.filter(Transaction.city_code == city_code)
+    row = query.limit(1).first()
+    return row[0] if row else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EXPLAIN regression checks for Transaction queries")
+    parser.add_argument("--city", help="city_code，默认取库里第一个")
+    parser.add_argument("--bizcircle", help="商圈，默认取该城市第一个")
+    parser.add_argument("--region", help="区域，默认取该城市第一个")
+    parser.add_argument("--start-month", default="2023-01")
+    parser.add_argument("--end-month", default="2025-12")
+    args = parser.parse_args()
+
+    with app.app_context():
+        if db.engine.dialect.name != "mysql":
+            print(f"explain_check only supports MySQL (current: {db.engine.dialect.name})")
+            return 2
+
+        city = args.city or pick_sample(Transaction.city_code)
+        if not city:
+            print("No transactions in database, nothing to check.")
+            return 2
+        bizcircle = args.bizcircle or pick_sample(Transaction.bizcircle, city)
+        region = args.region or pick_sample(Transaction.region_name, city)
+        print(f"city={city} bizcircle={bizcircle} region={region}")
+
+        aggregate_keys = {INDEX_CITY_DATE, INDEX_CITY_BIZ, INDEX_CITY_REGION}
+        checks = [
+            ("price_trend(city)", build_price_trend_query(city),
+             aggregate_keys, True, False),
+            ("price_trend(bizcircle)", build_price_trend_query(city, bizcircle=bizcircle),
+             {INDEX_CITY_BIZ}, True, False),
+            ("price_trend(region)", build_price_trend_query(city, region=region),
+             {INDEX_CITY_REGION}, True, False),
+            ("historical_avg(city)", price_stats.build_historical_avg_query(
+                db.session, Transaction, city, None, args.start_month, args.end_month),
+             aggregate_keys, True, False),
+            ("historical_avg(bizcircle)", price_stats.build_historical_avg_query(
+                db.session, Transaction, city, bizcircle, args.start_month, args.end_month),
+             {INDEX_CITY_BIZ}, True, False),
+            ("price_heatmap(bizcircle)", price_stats.build_price_heatmap_query(
+                db.session, Transaction, city, "bizcircle", args.start_month, args.end_month),
+             {INDEX_CITY_BIZ}, True, False),
+            ("price_heatmap(region)", price_stats.build_price_heatmap_query(
+                db.session, Transaction, city, "region", args.start_month, args.end_month),
+             {INDEX_CITY_REGION}, True, False),
+            ("bizcircles", price_stats.build_available_bizcircles_query(
+                db.session, Transaction, city),
+             {INDEX_CITY_BIZ}, True, False),
+            ("listings(city)", build_listings_query(city).limit(21),
+             {INDEX_CITY_DATE}, False, True),
+            ("listings(bizcircle)", build_listings_query(city, bizcircle=bizcircle).limit(21),
+             {INDEX_CITY_BIZ}, False, True),
+            ("listings(region)", build_listings_query(city, region=region).limit(21),
+             {INDEX_CITY_REGION}, False, True),
+        ]
+
+        # 游标翻页：取第 21 条作为游标，模拟翻到第二页
+        last = build_listings_query(city, bizcircle=bizcircle).offset(20).limit(1).first()
+        if last is not None:
+            checks.append((
+                "listings(bizcircle, cursor)",
+                apply_listings_cursor(
+                    build_listings_query(city, bizcircle=bizcircle),
+                    (last.deal_date, last.id),
+                ).limit(21),
+                {INDEX_CITY_BIZ}, False, True,
+            ))
+
+        problems = []
+        for name, query, keys, index_only, no_filesort in checks:
+            problems += check_plan(name, query, keys, index_only, no_filesort)
+
+    if problems:
+        print("\nEXPLAIN regressions:")
+        for p in problems:
+            print(f"  - {p}")
+        return 1
+    print("\nAll plans use the expected indexes.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+"""
+成交记录的流式导出（CSV / NDJSON）
+- 记录逐条读取、逐批编码成文本块交给分块响应，内存占用与导出条数无关
+- JSON 文件用 iter_json_array 增量解析：每次读入固定大小的文本块，用 raw_decode 逐个切出数组元素，
+  不把整个文件读进内存
+- 字段与 /api/listings 的记录一致（EXPORT_FIELDS），CSV 首行为表头，NDJSON 每行一个 JSON 对象
+"""
+import csv
+import io
+import json
+import re
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator
+
+from sqlite_source import LISTING_COLUMNS
+
+EXPORT_FORMATS = ("csv", "ndjson")
+EXPORT_FIELDS = LISTING_COLUMNS
+
+# 每个响应块包含的记录数
+EXPORT_BATCH_SIZE = 1000
+
+_WHITESPACE = " \t\n\r"
+_SEPARATOR = re.compile(r"[ \t\n\r]*([,\]])[ \t\n\r]*")
+
+
+def iter_json_array(path: Path, chunk_size: int = 1 << 20) -> Iterator[Any]:
+    """
+    增量读取顶层为数组的 JSON 文件，逐个产出数组元素
+    顶层是 {"items": [...]} / {"data": [...]} 等对象时整体读入后产出其中的列表（兼容旧格式，非常量内存）
+    """
+    decoder = json.JSONDecoder()
+    with path.open("r", encoding="utf-8") as f:
+        buf = f.read(chunk_size)
+        eof = not buf
+        pos = 0
+
+        def fill() -> bool:
+            """再读一块；返回是否读到了新内容"""
+            nonlocal buf, pos, eof
+            more = f.read(chunk_size)
+            if not more:
+                eof = True
+                return False
+            buf = buf[pos:] + more
+            pos = 0
+            return True
+
+        def skip_whitespace() -> None:
+            nonlocal pos
+            while True:
+                while pos < len(buf) and buf[pos] in _WHITESPACE:
+                    pos += 1
+                if pos < len(buf) or not fill():
+                    return
+
+        skip_whitespace()
+        if pos < len(buf) and buf[pos] == "\ufeff":
+            pos += 1
+            skip_whitespace()
+        if pos >= len(buf):
+            return
+        if buf[pos] != "[":
+            while fill():
+                pass
+            obj = json.loads(buf[pos:])
+            if isinstance(obj, dict):
+                obj = obj.get("items") or obj.get("data") or []
+            yield from (obj if isinstance(obj, list) else [])
+            return
+
+        pos += 1
+        skip_whitespace()
+        if pos < len(buf) and buf[pos] == "]":
+            return
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if not fill():
+                    raise
+                continue
+            if (
+                not eof
+                and not isinstance(value, (dict, list, str))
+                and buf[end:end + 64].lstrip(_WHITESPACE)[:1] not in (",", "]")
+                and fill()
+            ):
+                # 数字 / 字面量没有结束符，看不到后面的 , 或 ] 时可能被块边界截断，补齐后重新解析
+                continue
+            pos = end
+            yield value
+
+            # 快速路径：分隔符及前后空白都在当前块内
+            m = _SEPARATOR.match(buf, pos)
+            if m and m.end() < len(buf):
+                if m.group(1) == "]":
+                    return
+                pos = m.end()
+                continue
+            skip_whitespace()
+            if pos >= len(buf):
+                raise ValueError(f"unterminated JSON array: {path}")
+            if buf[pos] == "]":
+                return
+            if buf[pos] != ",":
+                raise ValueError(f"expected ',' or ']' at offset {pos} of buffer: {path}")
+            pos += 1
+            skip_whitespace()
+
+
+def csv_chunks(rows: Iterable[Dict[str, Any]], batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[str]:
+    """记录 -> CSV 文本块（首块为表头），每块 batch_size 条；None 输出为空串"""
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n")
+    writer.writerow(EXPORT_FIELDS)
+    n = 0
+    for row in rows:
+        writer.writerow(["" if row.get(k) is None else row.get(k) for k in EXPORT_FIELDS])
+        n += 1
+        if n == batch_size:
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate()
+            n = 0
+    yield out.getvalue()
+
+
+def ndjson_chunks(
+    rows: Iterable[Dict[str, Any]],
+    dumps: Callable[[Any], str],
+    batch_size: int = EXPORT_BATCH_SIZE,
+) -> Iterator[str]:
+    """记录 -> NDJSON 文本块，每块 batch_size 行；dumps 为 JSON 编码函数（如 app.json.dumps）"""
+    lines = []
+    for row in rows:
+        lines.append(dumps({k: row.get(k) for k in EXPORT_FIELDS}))
+        if len(lines) == batch_size:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
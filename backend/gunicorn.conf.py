@@ -0,0 +1,108 @@
+"""
+生产环境多进程部署（gunicorn 配置）
+用法（在项目根目录或 backend/ 下均可）：
+    gunicorn -c backend/gunicorn.conf.py
+
+- 预派生（pre-fork）：主进程导入 app 并同步预热全部城市数据（列表缓存、列式缓存、位图索引、立方体、KD 树），
+  之后 gc.freeze() 再 fork 出 worker；预热好的数据以写时复制（copy-on-write）的方式在 worker 间共享，
+  不再每个 worker 各读一遍城市文件
+- 主进程启动时 gc.disable()，避免预热期间的垃圾回收把对象搬来搬去；worker fork 后重新 gc.enable()，
+  被冻结的对象不再参与回收扫描，回收时也就不会写这些对象所在的内存页
+- 每个 worker 用 gthread 多线程处理请求；worker / 线程数由环境变量配置
+- 指标：各 worker 把计数写到 HPQAQ_METRICS_DIR（默认为临时目录下按主进程 pid 命名的子目录），/metrics 合并输出；
+  开启 HPQAQ_PROFILER 时全进程采样也经这个目录通知各 worker
+- 平滑重载：kill -HUP <主进程> —— 主进程按数据版本重新预热（数据文件 / MySQL 导入有变化时才会重建），
+  再 fork 新 worker 接管，旧 worker 处理完手上的请求后退出。重载不会重新导入代码，代码更新需重启
+"""
+import gc
+import multiprocessing
+import os
+import sys
+import tempfile
+
+# === 配置部分 ===
+bind = os.environ.get("HPQAQ_BIND", "127.0.0.1:5000")
+
+# worker 进程数：默认每个 CPU 核心一个
+workers = int(os.environ.get("HPQAQ_WORKERS", str(multiprocessing.cpu_count())))
+
+# 每个 worker 的请求线程数（I/O 等待多时调大；统计计算受 GIL 限制，靠多进程用满多核）
+threads = int(os.environ.get("HPQAQ_THREADS", "4"))
+worker_class = "gthread"
+
+# 平滑重载 / 停止时等待 worker 处理完请求的秒数
+graceful_timeout = int(os.environ.get("HPQAQ_GRACEFUL_TIMEOUT", "30"))
+timeout = 120
+
+# 各 worker 的指标快照目录（/metrics 合并全部 worker）；默认放在临时目录下，按主进程 pid 区分
+os.environ.setdefault("HPQAQ_METRICS_DIR", os.path.join(tempfile.gettempdir(), f"hpqaq-metrics-{os.getpid()}"))
+
+chdir = os.path.dirname(os.path.abspath(__file__))
+wsgi_app = "app:app"
+preload_app = True
+
+# 预热期间不做垃圾回收（worker fork 后重新打开）
+gc.disable()
+
+
+def _hpqaq():
+    """主进程 preload 之后的 app 模块"""
+    return sys.modules["app"]
+
+
+def _warm_up_master(server):
+    """在主进程中预热数据，关掉主进程的数据库连接，再冻结现有对象"""
+    hpqaq = _hpqaq()
+    hpqaq.warm_up(open_pool=False)
+    if hpqaq.DB_ENABLED:
+        with hpqaq.app.app_context():
+            # 主进程不处理请求；预热时探测数据库留下的连接不能被 fork 出去的 worker 继承
+            hpqaq.models.db.engine.dispose()
+    gc.collect()
+    gc.freeze()
+    server.log.info("[gunicorn] warm-up done, %d objects frozen", gc.get_freeze_count())
+
+
+def on_starting(server):
+    # HPQAQ_METRICS_DIR 指定为固定目录时清掉上次运行留下的快照；平滑重载（HUP）不会调用，已退出 worker 的计数得以保留
+    sys.modules["metrics"].REGISTRY.clear_directory()
+
+
+def on_exit(server):
+    sys.modules["metrics"].REGISTRY.clear_directory()
+
+
+def when_ready(server):
+    _warm_up_master(server)
+
+
+def on_reload(server):
+    _warm_up_master(server)
+
+
+def post_fork(server, worker):
+    gc.enable()
+    hpqaq = _hpqaq()
+    if not hpqaq.DB_ENABLED:
+        return
+    with hpqaq.app.app_context():
+        # 丢掉从主进程继承的连接池（不关闭底层连接，那是主进程的），worker 重新建自己的连接
+        hpqaq.models.db.engine.dispose(close=False)
+
+
+def post_worker_init(worker):
+    hpqaq = _hpqaq()
+    # 开启剖析时，还没处理过请求的 worker 也要能响应其他 worker 发起的全进程采样
+    sys.modules["profiler"].ensure_watcher()
+    if not (hpqaq.DB_ENABLED and hpqaq.WARMUP_ENABLED):
+        return
+    with hpqaq.app.app_context():
+        try:
+            worker.log.info("[gunicorn] worker %s db pool: %d connections", worker.pid, hpqaq.open_db_pool())
+        except Exception as e:
+            worker.log.info("[gunicorn] worker %s db pool unavailable: %s", worker.pid, e)
+
+
+def worker_exit(server, worker):
+    # 写线程每秒才落盘一次；退出前补写最后一份快照，max_requests 回收或重载时最后一秒的计数不丢
+    sys.modules["metrics"].REGISTRY.write_snapshot()
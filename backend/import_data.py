@@ -2,7 +2,12 @@ import json
 import os
 import re
 from datetime import datetime
-from app import app, db, City, Transaction, Region
+from models import create_cli_app, db, City, Transaction, Region, MonthSketch, MonthHistogram, MonthCube, MYSQL_VERSION_FILE
+from db_migrate import ensure_indexes
+from result_cache import bump_version_file
+
+# 只需要数据库的最小应用，不导入 Web 应用（app.py）
+app = create_cli_app()
 
 DATA_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), "..", "data"))
 
@@ -29,7 +34,7 @@ def parse_price(val):
 def import_json_file(filepath):
     filename = os.path.basename(filepath)
     # 从文件名提取城市代码 (如 crawl_history_beijing.json -> beijing)
-    match = re.match(r"crawl_history_([a-zA-Z]+)\.json", filename)
+    match = re.match(r"crawl_history_([A-Za-z0-9]+)\.json", filename)
     if not match:
         print(f"Skipping {filename}: name format not match")
         return
@@ -71,6 +76,7 @@ def import_json_file(filepath):
 
         # 3. 批量插入
         count = 0
+        cube_records = []  # 新增记录的 (区域, 商圈, 户型, 年月, 单价, 总价)，用于增量更新立方体
         for item in data:
             # 必须有 house_id
             house_id = str(item.get("house_id", ""))
@@ -109,6 +115,12 @@ def import_json_file(filepath):
             )
             db.session.add(trans)
             count += 1
+            if deal_date:
+                cube_records.append((
+                    trans.region_name, trans.bizcircle, trans.layout,
+                    f"{deal_date.year}-{deal_date.month:02d}",
+                    trans.unit_price_yuan_sqm, trans.total_price_wan
+                ))
             
             # 每 100 条提交一次，防止内存溢出
             if count % 100 == 0:
@@ -118,10 +130,26 @@ def import_json_file(filepath):
         db.session.commit()
         print(f"Finished {city_name}: added {count} new records.")
 
+        # 4. 重建该城市的分位数草图、分布直方图
+        # 统计模块连带 numpy、列式缓存等，到这里才导入：建表、连不上库、没有数据文件时都用不到
+        import price_stats
+        cells = price_stats.rebuild_month_sketches_in_db(db.session, Transaction, MonthSketch, city_code)
+        print(f"Rebuilt {cells} quantile sketch cells for {city_name}.")
+        rows = price_stats.rebuild_month_histograms_in_db(db.session, Transaction, MonthHistogram, city_code)
+        print(f"Rebuilt {rows} histogram rows for {city_name}.")
+
+        # 5. 聚合立方体：已有格子时只合并新增记录涉及的月份，否则全量建
+        if MonthCube.query.filter_by(city_code=city_code).first() is None:
+            cells = price_stats.rebuild_month_cube_in_db(db.session, Transaction, MonthCube, city_code)
+        else:
+            cells = price_stats.update_month_cube_in_db(db.session, MonthCube, city_code, cube_records)
+        print(f"Updated {cells} aggregate cube cells for {city_name}.")
+
 def main():
     # 首次运行时创建表
     with app.app_context():
         db.create_all()
+        ensure_indexes(db.engine, Transaction)
         print("Database initialized.")
 
     if not os.path.exists(DATA_DIR):
@@ -132,5 +160,9 @@ def main():
         if fn.endswith(".json") and fn.startswith("crawl_history_"):
             import_json_file(os.path.join(DATA_DIR, fn))
 
+    # 通知运行中的服务：MySQL 数据已变化，统计缓存失效
+    bump_version_file(MYSQL_VERSION_FILE)
+    print(f"Data version bumped: {MYSQL_VERSION_FILE}")
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,91 @@
+"""
+API 响应的 JSON 序列化层
+- 优先使用 orjson（已安装时），不可用或遇到无法处理的对象时回退到标准库 json
+- 序列化耗时记为 request_timing 的 serialize 段，随 Server-Timing 响应头返回
+"""
+from typing import Any
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+import request_timing
+
+try:
+    import orjson
+except Exception:
+    orjson = None
+
+# 可选值：auto（有 orjson 就用）、orjson、stdlib
+ENCODER_CHOICES = ("auto", "orjson", "stdlib")
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider：
+    - ensure_ascii=False，中文原样输出（Flask 2.3 起 JSON_AS_ASCII 配置已不再生效）
+    - 日期、Decimal 等类型仍交给 Flask 默认的 default 处理，输出与标准库保持一致
+    """
+
+    ensure_ascii = False
+    encoder = "auto"
+
+    @property
+    def encoder_name(self) -> str:
+        if orjson is not None and self.encoder != "stdlib":
+            return "orjson"
+        return "stdlib"
+
+    def _orjson_option(self, indent: bool, sort_keys: bool) -> int:
+        opt = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if indent:
+            opt |= orjson.OPT_INDENT_2
+        if sort_keys:
+            opt |= orjson.OPT_SORT_KEYS
+        return opt
+
+    def _encode(self, obj: Any, indent: bool = False, **kwargs: Any) -> bytes:
+        if self.encoder_name == "orjson" and not kwargs:
+            try:
+                return orjson.dumps(
+                    obj,
+                    default=self.default,
+                    option=self._orjson_option(indent, self.sort_keys),
+                )
+            except TypeError:
+                # orjson 不支持的情况（如超过 64 位的整数），回退标准库
+                pass
+
+        if indent:
+            kwargs.setdefault("indent", 2)
+        else:
+            kwargs.setdefault("separators", (",", ":"))
+        return super().dumps(obj, **kwargs).encode("utf-8")
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        indent = bool(kwargs.pop("indent", None))
+        if kwargs.get("separators") == (",", ":"):
+            kwargs.pop("separators")
+        return self._encode(obj, indent=indent, **kwargs).decode("utf-8")
+
+    def response(self, *args: Any, **kwargs: Any):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+
+        with request_timing.span("serialize"):
+            body = self._encode(obj, indent=indent)
+
+        return self._app.response_class(body + b"\n", mimetype=self.mimetype)
+
+
+def init_app(app: Flask, encoder: str = "auto") -> FastJSONProvider:
+    """给 app 安装 FastJSONProvider"""
+    encoder = (encoder or "auto").strip().lower()
+    if encoder not in ENCODER_CHOICES:
+        raise ValueError(f"unknown json encoder: {encoder}")
+    if encoder == "orjson" and orjson is None:
+        print("[json_provider] orjson not installed, falling back to stdlib json")
+
+    provider = FastJSONProvider(app)
+    provider.encoder = encoder
+    app.json = provider
+    return provider
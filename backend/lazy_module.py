@@ -0,0 +1,39 @@
+"""
+延迟导入
+- lazy_import("名称") 返回模块的替身，第一次访问属性时才真正 import，之后直接转发到真实模块
+- 用于导入慢、又只在部分部署形态下用得到的依赖：SQLAlchemy / Flask-SQLAlchemy 与数据模型（只有 MySQL 数据源用）、
+  requests（只有新闻热榜用）。纯 JSON / SQLite 数据源的 worker 和命令行脚本启动时不再为它们付出导入时间
+- 真正的导入走 importlib.import_module，多个线程同时触发时由 import 锁保证只执行一次
+"""
+import importlib
+import importlib.util
+from typing import Optional
+
+
+class LazyModule:
+    """模块替身：属性访问转发到真实模块，第一次访问时导入"""
+
+    def __init__(self, name: str):
+        self._lazy_name = name
+        self._lazy_module = None
+
+    def __getattr__(self, attr: str):
+        module = self._lazy_module
+        if module is None:
+            module = self._lazy_module = importlib.import_module(self._lazy_name)
+        return getattr(module, attr)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._lazy_module is not None else "not loaded"
+        return f"<lazy module {self._lazy_name!r} ({state})>"
+
+
+def lazy_import(name: str, optional: bool = False) -> Optional[LazyModule]:
+    """
+    返回延迟导入的模块替身
+    optional=True 时先查找模块（不执行），没有安装则返回 None，对应 try: import x / except: x = None 的写法
+    """
+    if optional and importlib.util.find_spec(name) is None:
+        return None
+    return LazyModule(name)
+
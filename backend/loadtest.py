@@ -0,0 +1,358 @@
+"""
+HTTP 压测：按前端的实际请求模式回放流量，报告各接口的吞吐与延迟分位数
+benchmark.py 测的是单个函数；这里对运行中的服务（python app.py 或 gunicorn）做端到端压测。
+
+每个虚拟用户循环执行下面的场景（按 --mix 的权重随机选取），场景内的请求顺序与前端一致：
+    home      首页（js/app.js）初始化：/api/health，然后 loadListingsAndTrend：
+              /api/listings 第 1 页 -> /api/price_trend -> /api/facets -> /api/fang_news（news 权重大于 0 时，每个用户 5 分钟内只取一次）
+    browse    首页筛选后翻页：按 facets 的计数随机选区域 / 商圈 / 户型（偶尔加小区关键字），
+              第 1 页起连续翻 1–5 页，每翻一页都是 listings + price_trend + facets
+    stats     统计页（js/house_stat.js）：/api/health + /api/bizcircles -> /api/historical_avg_price，
+              之后一半概率看价格分布（/api/price_histogram），一半概率看热力图（/api/price_heatmap）
+    compare   对比模式：/api/bizcircles -> 选 2–6 个商圈一次 POST /api/historical_avg_price/batch；
+              --compare fanout 改为旧版前端的做法：对每个商圈并发 GET /api/historical_avg_price
+    news      点击新闻刷新按钮：/api/fang_news
+- 用户之间没有思考时间（--think-ms 可加），压测是闭环的：并发数固定，吞吐随服务端延迟变化
+- 每个虚拟用户一个 keep-alive 连接（http.client，只用标准库）；fanout 的并发请求各用一条短连接
+- 前 --warmup 秒的请求不计入统计；--seed 固定后各用户的随机选择可复现
+- 后端目前没有 /api/fang_news 路由（前端会请求，得到 404），默认 news=0 完全不请求；后端加上路由后再给 news 权重
+
+用法：
+    cd backend
+    HPQAQ_DATA_SOURCE=json python app.py &                 # 或 gunicorn -c gunicorn.conf.py
+    python loadtest.py --concurrency 8 --duration 30
+    python loadtest.py --url http://127.0.0.1:5000 --city shenzhen --mix home=2,browse=5,stats=2,compare=1,news=0 \\
+        --concurrency 32 --duration 60 --output load.json
+"""
+import argparse
+import http.client
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from urllib.parse import urlencode, urlsplit
+
+from request_timing import percentile
+
+DEFAULT_MIX = "home=3,browse=4,stats=2,compare=1,news=0"
+
+# 与前端一致的取值
+PAGE_SIZE = 20
+NEWS_LIMIT = 10
+NEWS_THROTTLE_SECONDS = 300
+MONTH_RANGES = (("2023-01", "2025-12"), ("2024-01", "2025-12"), ("2025-01", "2025-12"))
+
+
+class Recorder:
+    """按 (方法, 路径) 记录延迟与错误；start 之前的请求不计入"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.statuses: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.start: Optional[float] = None
+        self.stop: Optional[float] = None
+
+    def add(self, name: str, ms: float, status: str, ok: bool, at: float) -> None:
+        if self.start is None or at < self.start or (self.stop is not None and at > self.stop):
+            return
+        with self.lock:
+            self.latencies[name].append(ms)
+            self.statuses[name][status] += 1
+            if not ok:
+                self.errors[name] += 1
+
+    def summary(self) -> Dict[str, Dict]:
+        elapsed = max((self.stop or time.perf_counter()) - (self.start or 0.0), 1e-9)
+        rows = {}
+        with self.lock:
+            for name, values in sorted(self.latencies.items()):
+                ordered = sorted(values)
+                rows[name] = {
+                    "requests": len(ordered),
+                    "errors": self.errors.get(name, 0),
+                    "rps": round(len(ordered) / elapsed, 2),
+                    "p50_ms": round(percentile(ordered, 50), 1),
+                    "p90_ms": round(percentile(ordered, 90), 1),
+                    "p95_ms": round(percentile(ordered, 95), 1),
+                    "p99_ms": round(percentile(ordered, 99), 1),
+                    "max_ms": round(ordered[-1], 1),
+                    "status": dict(self.statuses[name]),
+                }
+        return rows
+
+
+class Client:
+    """一个虚拟用户的 keep-alive 连接"""
+
+    def __init__(self, base_url: str, recorder: Recorder, timeout: float):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 80
+        self.recorder = recorder
+        self.timeout = timeout
+        self.conn: Optional[http.client.HTTPConnection] = None
+
+    def request(self, method: str, path: str, params: Optional[Dict] = None, body: Optional[Dict] = None):
+        """发送请求并记录耗时；返回解析后的 JSON（失败返回 None）"""
+        query = {k: v for k, v in (params or {}).items() if v not in (None, "")}
+        url = path + ("?" + urlencode(query) if query else "")
+        payload = json.dumps(body).encode("utf-8") if body is not None else None
+        headers = {"Accept": "application/json"}
+        if payload is not None:
+            headers["Content-Type"] = "application/json"
+
+        name = f"{method} {path}"
+        start = time.perf_counter()
+        status, data = "error", None
+        try:
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self.conn.request(method, url, body=payload, headers=headers)
+            resp = self.conn.getresponse()
+            raw = resp.read()
+            status = str(resp.status)
+            if resp.status == 200:
+                data = json.loads(raw)
+            if resp.getheader("Connection", "").lower() == "close":
+                self.close()
+        except (OSError, http.client.HTTPException, ValueError):
+            self.close()
+        self.recorder.add(name, (time.perf_counter() - start) * 1000.0, status, status == "200", start)
+        return data
+
+    def close(self) -> None:
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+class CityInfo:
+    """压测前从服务端取到的城市筛选项（按记录数加权选取）"""
+
+    def __init__(self, city: str, bizcircles: List[str], facets: Dict[str, List[Dict]]):
+        self.city = city
+        self.bizcircles = bizcircles
+        self.facets = facets
+
+    def pick(self, rng: random.Random, dim: str) -> Optional[str]:
+        options = self.facets.get(dim) or []
+        if not options:
+            return None
+        return rng.choices([o["value"] for o in options], weights=[o["count"] for o in options])[0]
+
+
+def discover(client: Client, cities: Optional[List[str]]) -> List[CityInfo]:
+    """取城市列表、商圈与筛选项；没有数据的城市跳过"""
+    if not cities:
+        health = client.request("GET", "/api/health") or {}
+        cities = health.get("cities") or []
+    infos = []
+    for city in cities:
+        facets = client.request("GET", "/api/facets", {"city": city}) or {}
+        if not facets.get("total"):
+            continue
+        bizcircles = (client.request("GET", "/api/bizcircles", {"city": city}) or {}).get("bizcircles") or []
+        infos.append(CityInfo(city, bizcircles, facets.get("facets") or {}))
+    return infos
+
+
+class VirtualUser:
+    def __init__(self, index: int, args, cities: List[CityInfo], recorder: Recorder, fanout_pool: ThreadPoolExecutor):
+        self.rng = random.Random(f"{args.seed}-{index}")
+        self.args = args
+        self.cities = cities
+        self.recorder = recorder
+        self.client = Client(args.url, recorder, args.timeout)
+        self.fanout_pool = fanout_pool
+        self.news_fetched: Dict[str, float] = {}
+
+    # === 前端行为 ===
+    def _news(self, city: str, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self.news_fetched.get(city, -NEWS_THROTTLE_SECONDS) < NEWS_THROTTLE_SECONDS:
+            return
+        self.news_fetched[city] = now
+        self.client.request("GET", "/api/fang_news", {"city": city, "limit": NEWS_LIMIT})
+
+    def _listings_and_trend(self, query: Dict) -> Optional[Dict]:
+        """js/app.js loadListingsAndTrend"""
+        data = self.client.request("GET", "/api/listings", query)
+        filters = {k: query.get(k) for k in ("city", "region", "bizcircle", "community", "layout")}
+        self.client.request("GET", "/api/price_trend", filters)
+        self.client.request("GET", "/api/facets", filters)
+        if self.args.weights.get("news"):
+            self._news(query["city"])
+        return data
+
+    def home(self, info: CityInfo) -> None:
+        self.client.request("GET", "/api/health")
+        self._listings_and_trend({"city": info.city, "page": 1, "page_size": PAGE_SIZE})
+
+    def browse(self, info: CityInfo) -> None:
+        query = {"city": info.city, "page": 1, "page_size": PAGE_SIZE}
+        dims = self.rng.sample(["region", "bizcircle", "layout"], k=self.rng.randint(1, 2))
+        for dim in dims:
+            query[dim] = info.pick(self.rng, dim)
+        if self.rng.random() < 0.15 and query.get("bizcircle"):
+            # 小区关键字：取热门商圈名的前两个字模拟手输
+            query["community"] = query["bizcircle"][:2]
+        pages = self.rng.randint(1, 5)
+        for page in range(1, pages + 1):
+            query["page"] = page
+            data = self._listings_and_trend(dict(query))
+            total = (data or {}).get("total") or 0
+            if page * PAGE_SIZE >= total:
+                break
+
+    def stats(self, info: CityInfo) -> None:
+        self.client.request("GET", "/api/health")
+        self.client.request("GET", "/api/bizcircles", {"city": info.city})
+        start_month, end_month = self.rng.choice(MONTH_RANGES)
+        params = {"city": info.city, "start_month": start_month, "end_month": end_month}
+        if info.bizcircles and self.rng.random() < 0.6:
+            params["bizcircle"] = self.rng.choice(info.bizcircles)
+        self.client.request("GET", "/api/historical_avg_price", params)
+        if self.rng.random() < 0.5:
+            self.client.request("GET", "/api/price_histogram", params)
+        else:
+            dimension = self.rng.choice(["bizcircle", "region"])
+            self.client.request("GET", "/api/price_heatmap", {
+                "city": info.city, "dimension": dimension, "start_month": start_month, "end_month": end_month,
+            })
+
+    def compare(self, info: CityInfo) -> None:
+        self.client.request("GET", "/api/bizcircles", {"city": info.city})
+        if len(info.bizcircles) < 2:
+            return
+        chosen = self.rng.sample(info.bizcircles, k=min(len(info.bizcircles), self.rng.randint(2, 6)))
+        start_month, end_month = self.rng.choice(MONTH_RANGES)
+        if self.args.compare == "batch":
+            self.client.request("POST", "/api/historical_avg_price/batch", body={
+                "series": [{"city": info.city, "bizcircle": biz} for biz in chosen],
+                "start_month": start_month,
+                "end_month": end_month,
+            })
+            return
+
+        def one(biz: str) -> None:
+            client = Client(self.args.url, self.recorder, self.args.timeout)
+            client.request("GET", "/api/historical_avg_price", {
+                "city": info.city, "bizcircle": biz, "start_month": start_month, "end_month": end_month,
+            })
+            client.close()
+
+        list(self.fanout_pool.map(one, chosen))
+
+    def news(self, info: CityInfo) -> None:
+        self._news(info.city, force=True)
+
+    def run(self, deadline: float) -> None:
+        names = [name for name, w in self.args.weights.items() if w > 0]
+        weights = [self.args.weights[name] for name in names]
+        try:
+            while time.perf_counter() < deadline:
+                scenario = self.rng.choices(names, weights=weights)[0]
+                getattr(self, scenario)(self.rng.choice(self.cities))
+                if self.args.think_ms:
+                    time.sleep(self.rng.uniform(0.5, 1.5) * self.args.think_ms / 1000.0)
+        finally:
+            self.client.close()
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    weights = {}
+    for part in text.split(","):
+        name, _, value = part.partition("=")
+        name = name.strip()
+        if name not in ("home", "browse", "stats", "compare", "news"):
+            raise ValueError(f"unknown scenario: {name}")
+        weights[name] = float(value or 1)
+    if not any(weights.values()):
+        raise ValueError("all scenario weights are 0")
+    return weights
+
+
+def print_report(summary: Dict[str, Dict], elapsed: float) -> None:
+    print(f"{'endpoint':<42}{'reqs':>8}{'err':>6}{'rps':>9}{'p50':>9}{'p90':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    total = errors = 0
+    for name, row in summary.items():
+        total += row["requests"]
+        errors += row["errors"]
+        print(f"{name:<42}{row['requests']:>8}{row['errors']:>6}{row['rps']:>9.1f}"
+              f"{row['p50_ms']:>9.1f}{row['p90_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}{row['max_ms']:>9.1f}")
+    print(f"{'total':<42}{total:>8}{errors:>6}{total / elapsed:>9.1f}   (latency in ms, {elapsed:.1f} s measured)")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay frontend traffic patterns against a running instance")
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--city", action="append", help="压测的城市（可重复），默认取 /api/health 中有数据的城市")
+    parser.add_argument("--concurrency", type=int, default=8, help="虚拟用户数")
+    parser.add_argument("--duration", type=float, default=30.0, help="计入统计的秒数")
+    parser.add_argument("--warmup", type=float, default=5.0, help="开始统计前的预热秒数")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="场景权重，如 home=3,browse=4,stats=2,compare=1,news=1")
+    parser.add_argument("--compare", choices=("batch", "fanout"), default="batch",
+                        help="对比模式：batch（当前前端）/ fanout（每个商圈一个请求）")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="场景之间的平均思考时间（毫秒）")
+    parser.add_argument("--timeout", type=float, default=30.0, help="单个请求的超时（秒）")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="结果 JSON 路径")
+    args = parser.parse_args(argv)
+    try:
+        args.weights = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+
+    recorder = Recorder()
+    setup = Client(args.url, recorder, args.timeout)
+    health = setup.request("GET", "/api/health")
+    if health is None:
+        print(f"[loadtest] {args.url}/api/health is not reachable")
+        return 2
+    cities = discover(setup, args.city)
+    setup.close()
+    if not cities:
+        print("[loadtest] no city with data")
+        return 2
+    print(f"[loadtest] {args.url} db={health.get('db')} cities={[c.city for c in cities]} "
+          f"concurrency={args.concurrency} warmup={args.warmup}s duration={args.duration}s")
+
+    begin = time.perf_counter()
+    recorder.start = begin + args.warmup
+    recorder.stop = recorder.start + args.duration
+    fanout_pool = ThreadPoolExecutor(max_workers=max(args.concurrency * 6, 1)) if args.compare == "fanout" else None
+    users = [VirtualUser(i, args, cities, recorder, fanout_pool) for i in range(args.concurrency)]
+    threads = [threading.Thread(target=u.run, args=(recorder.stop,), daemon=True) for u in users]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if fanout_pool is not None:
+        fanout_pool.shutdown()
+
+    summary = recorder.summary()
+    print()
+    print_report(summary, args.duration)
+    if args.output:
+        report = {
+            "meta": {
+                "url": args.url, "db": health.get("db"), "cities": [c.city for c in cities],
+                "concurrency": args.concurrency, "duration": args.duration, "warmup": args.warmup,
+                "mix": args.weights, "compare": args.compare, "think_ms": args.think_ms, "seed": args.seed,
+                "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            },
+            "endpoints": summary,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n[loadtest] results -> {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,397 @@
+"""
+进程内指标注册表（Counter / Gauge / Histogram）与 Prometheus 文本格式输出
+- 指标在模块导入时创建并登记到 REGISTRY；记录一次只是在字典上做加法，持锁时间极短
+- 采集回调（register_collector）在每次取快照前调用，用于读取连接池状态这类"拉"来的值
+- 多进程（gunicorn 多 worker）：设置了 HPQAQ_METRICS_DIR 时，每个进程由后台线程每秒把自己的快照写到
+  <目录>/<pid>-<启动时间>.json（先写临时文件再 os.replace，读方不会读到半个文件）。启动时间取自 /proc/<pid>/stat，
+  pid + 启动时间唯一确定一个进程，pid 被复用后启动时间对不上，按已退出处理；
+  /metrics 无论落到哪个 worker，都持目录锁读取目录下全部快照合并后输出：
+  - Counter / Histogram：所有进程求和。已退出进程的快照在 /metrics 时累加进 exited.json 并删除，
+    目录里始终只有存活进程的文件加一个累计文件，计数不会因为 worker 重启而倒退
+  - Gauge：只合并存活进程，按声明方式 sum（默认）/ max / pid（每个进程一条，加 pid 标签）
+- fork 出的子进程清空继承来的计数（由父进程自己的快照负责），避免重复计算
+- 没有设置目录时只输出本进程的指标
+"""
+import bisect
+import contextlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows：没有文件锁，不合并已退出进程的快照
+    fcntl = None
+
+# 请求耗时的默认分桶（秒）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+GAUGE_MODES = ("sum", "max", "pid")
+
+# 已退出进程的 Counter / Histogram 累计文件，与目录锁文件
+EXITED_NAME = "exited.json"
+LOCK_NAME = ".lock"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry: "Registry" = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._registry = registry if registry is not None else REGISTRY
+        self._values: Dict[Tuple[str, ...], Any] = {}
+        self._registry.register(self)
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def clear(self) -> None:
+        self._values = {}
+
+
+class Counter(_Metric):
+    """只增不减的计数"""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._registry.lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+            self._registry.dirty = True
+
+
+class Gauge(_Metric):
+    """可增可减的当前值；mode 为多进程合并方式（sum / max / pid）"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), mode: str = "sum",
+                 registry: "Registry" = None):
+        if mode not in GAUGE_MODES:
+            raise ValueError(f"unknown gauge mode: {mode}")
+        self.mode = mode
+        super().__init__(name, documentation, labelnames, registry)
+
+    def set(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._registry.lock:
+            self._values[key] = float(value)
+            self._registry.dirty = True
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._registry.lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+            self._registry.dirty = True
+
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """分桶计数；每组标签存 [各桶计数（非累积）..., +Inf 桶计数, 总和, 次数]"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry: "Registry" = None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._registry.lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            row[slot] += 1
+            row[-2] += value
+            row[-1] += 1
+            self._registry.dirty = True
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, _Metric] = {}
+        self.collectors: List[Callable[[], None]] = []
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.directory: Optional[Path] = None
+        self._writer: Optional[threading.Thread] = None
+        self._writer_pid = 0
+        self._snapshot_name = ""
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def register(self, metric: _Metric) -> None:
+        if metric.name in self.metrics:
+            raise ValueError(f"duplicate metric: {metric.name}")
+        self.metrics[metric.name] = metric
+
+    def register_collector(self, fn: Callable[[], None]) -> None:
+        """fn() 在每次取快照前调用，负责把外部状态 set 到 Gauge 上"""
+        self.collectors.append(fn)
+
+    def _after_fork(self) -> None:
+        # 子进程：锁可能在 fork 时被父进程的写线程持有，重新创建；继承来的计数由父进程自己上报
+        self.lock = threading.Lock()
+        for metric in self.metrics.values():
+            metric.clear()
+        self.dirty = False
+        self._writer = None
+        self._writer_pid = 0
+        self._snapshot_name = ""
+
+    # === 快照 ===
+    def snapshot(self) -> Dict[str, Any]:
+        """本进程的全部指标 {name: [[labels, value], ...]}"""
+        for fn in self.collectors:
+            try:
+                fn()
+            except Exception as e:
+                print(f"[metrics] collector error: {e}")
+        with self.lock:
+            return {
+                name: [[list(key), list(value) if isinstance(value, list) else value]
+                       for key, value in metric._values.items()]
+                for name, metric in self.metrics.items()
+            }
+
+    # === 多进程：快照文件 ===
+    def set_directory(self, directory: Optional[str]) -> None:
+        self.directory = Path(directory) if directory else None
+        if self.directory is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+
+    def ensure_writer(self) -> None:
+        """本进程的快照写线程（每个进程首次调用时启动；fork 后在子进程中重新启动）"""
+        if self.directory is None or self._writer_pid == os.getpid():
+            return
+        self._writer_pid = os.getpid()
+        start = _process_start(self._writer_pid)
+        self._snapshot_name = f"{self._writer_pid}-{start if start is not None else time.time_ns()}.json"
+        self._writer = threading.Thread(target=self._write_loop, name="hpqaq-metrics", daemon=True)
+        self._writer.start()
+
+    def _write_loop(self, interval: float = 1.0) -> None:
+        pid = os.getpid()
+        while self._writer_pid == pid:
+            # 有采集回调时 Gauge 的值随时在变，每次都写；否则只在有新记录时写
+            if self.dirty or self.collectors:
+                self.write_snapshot()
+            time.sleep(interval)
+
+    def write_snapshot(self) -> None:
+        if self.directory is None or not self._snapshot_name:
+            return
+        path = self.directory / self._snapshot_name
+        self.dirty = False
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"pid": os.getpid(), "metrics": self.snapshot()}), encoding="utf-8")
+        os.replace(tmp, path)
+
+    def clear_directory(self) -> None:
+        """删除目录下所有进程的快照（服务启动时调用一次；平滑重载时不要调用，否则计数会倒退）"""
+        if self.directory is None:
+            return
+        for path in self.directory.glob("*.json"):
+            path.unlink(missing_ok=True)
+
+    @contextlib.contextmanager
+    def _directory_lock(self):
+        """目录锁（进程间互斥）：合并已退出进程与读取快照放在同一把锁里，读方不会把同一份计数算两次"""
+        if fcntl is None:
+            yield
+            return
+        with open(self.directory / LOCK_NAME, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _fold_exited(self) -> None:
+        """
+        已退出进程的快照：Counter / Histogram 累加进 exited.json，然后删除原文件（调用方持目录锁）
+        累计文件记下本次合并的文件名，删除前中断时下次先把这些文件删掉，不会重复累加
+        """
+        exited_path = self.directory / EXITED_NAME
+        exited = _read_snapshot(exited_path) or {}
+        for name in exited.get("folded", []):
+            (self.directory / name).unlink(missing_ok=True)
+
+        totals = {
+            name: {tuple(labels): value for labels, value in rows}
+            for name, rows in exited.get("metrics", {}).items()
+        }
+        folded = []
+        for path in self.directory.glob("*.json"):
+            ident = _snapshot_ident(path.name)
+            if ident is None or path.name == self._snapshot_name or _process_alive(*ident):
+                continue
+            data = _read_snapshot(path) or {}
+            for name, rows in data.get("metrics", {}).items():
+                metric = self.metrics.get(name)
+                if metric is None or metric.kind == "gauge":
+                    continue
+                target = totals.setdefault(name, {})
+                for labels, value in rows:
+                    _accumulate(target, tuple(labels), value)
+            folded.append(path.name)
+        if not folded:
+            return
+
+        tmp = exited_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({
+            "pid": 0,
+            "folded": folded,
+            "metrics": {name: [[list(key), value] for key, value in rows.items()] for name, rows in totals.items()},
+        }), encoding="utf-8")
+        os.replace(tmp, exited_path)
+        for name in folded:
+            (self.directory / name).unlink(missing_ok=True)
+
+    def _process_snapshots(self) -> List[Tuple[int, bool, Dict[str, Any]]]:
+        """[(pid, 是否存活, 快照)]；本进程总是用内存中的最新值，已退出进程合并为一份（pid 为 0）"""
+        me = os.getpid()
+        result = [(me, True, self.snapshot())]
+        if self.directory is None:
+            return result
+        with self._directory_lock():
+            if fcntl is not None:
+                self._fold_exited()
+            for path in self.directory.glob("*.json"):
+                if path.name == self._snapshot_name:
+                    continue
+                data = _read_snapshot(path)
+                if data is None:
+                    continue
+                ident = _snapshot_ident(path.name)
+                alive = ident is not None and ident[0] != me and _process_alive(*ident)
+                result.append((int(data.get("pid", 0)), alive, data.get("metrics", {})))
+        return result
+
+    # === Prometheus 文本格式 ===
+    def render(self) -> str:
+        merged: Dict[str, Dict[Tuple[str, ...], Any]] = {name: {} for name in self.metrics}
+        for pid, alive, snapshot in self._process_snapshots():
+            for name, rows in snapshot.items():
+                metric = self.metrics.get(name)
+                if metric is None:
+                    continue
+                if metric.kind == "gauge" and not alive:
+                    continue
+                target = merged[name]
+                for labels, value in rows:
+                    key = tuple(labels)
+                    if metric.kind == "gauge" and metric.mode == "pid":
+                        key = key + (str(pid),)
+                    if metric.kind == "gauge" and metric.mode == "max" and key in target:
+                        target[key] = max(target[key], value)
+                    else:
+                        _accumulate(target, key, value)
+
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append(f"# HELP {name} {_escape_help(metric.documentation)}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            labelnames = metric.labelnames
+            if metric.kind == "gauge" and metric.mode == "pid":
+                labelnames = labelnames + ("pid",)
+            for key, value in sorted(merged[name].items()):
+                labels = list(zip(labelnames, key))
+                if metric.kind != "histogram":
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric.buckets + (float("inf"),), value[:-2]):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else _format_value(bound)
+                    lines.append(f"{name}_bucket{_format_labels(labels + [('le', le)])} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(value[-2])}")
+                lines.append(f"{name}_count{_format_labels(labels)} {value[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+def _accumulate(target: Dict[Tuple[str, ...], Any], key: Tuple[str, ...], value: Any) -> None:
+    """Counter / Gauge 的值相加，Histogram 的分桶逐项相加"""
+    if key not in target:
+        target[key] = list(value) if isinstance(value, list) else value
+    elif isinstance(value, list):
+        target[key] = [a + b for a, b in zip(target[key], value)]
+    else:
+        target[key] = target[key] + value
+
+
+def _read_snapshot(path: Path) -> Optional[Dict[str, Any]]:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def _snapshot_ident(name: str) -> Optional[Tuple[int, int]]:
+    """快照文件名 <pid>-<启动时间>.json -> (pid, 启动时间)；累计文件等其他文件返回 None"""
+    pid, sep, start = name[:-len(".json")].partition("-")
+    if not sep or not pid.isdigit() or not start.isdigit():
+        return None
+    return int(pid), int(start)
+
+
+_PROC_STAT = os.path.exists("/proc/self/stat")
+
+
+def _process_start(pid: int) -> Optional[int]:
+    """进程启动时间（/proc/<pid>/stat 第 22 个字段，开机后的时钟滴答数）；进程不存在或没有 /proc 时为 None"""
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # 第 2 个字段是带括号的进程名，可能含空格，从最后一个右括号之后开始数（第 3 个字段起）
+    return int(stat[stat.rindex(b")") + 2:].split()[19])
+
+
+def _process_alive(pid: int, start: int) -> bool:
+    """快照文件对应的进程是否还在：有 /proc 时比对启动时间（pid 被复用也能识别），否则退回 kill(pid, 0)"""
+    if _PROC_STAT:
+        return _process_start(pid) == start
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _escape_help(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape_label(str(v))}"' for k, v in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+REGISTRY = Registry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
@@ -1,6 +1,22 @@
 from __future__ import annotations
 import sqlite3
-from typing import Any, Dict, Iterable, List, Optional, Sequence
+from contextlib import closing, nullcontext
+from typing import Any, Callable, ContextManager, Dict, Iterable, Iterator, List, Optional, Sequence
+
+# 查询钩子：返回上下文管理器的函数，query_all / query_one 的每次查询都包在里面（如请求耗时埋点的 sql 段）；
+# 由应用层通过 set_query_hook 注册，没有注册时不做任何事
+_query_hook: Optional[Callable[[], ContextManager]] = None
+_NULL_CONTEXT = nullcontext()
+
+
+def set_query_hook(hook: Optional[Callable[[], ContextManager]]) -> None:
+    global _query_hook
+    _query_hook = hook
+
+
+def _query_context() -> ContextManager:
+    return _query_hook() if _query_hook is not None else _NULL_CONTEXT
+
 
 class MiniSQL:
     def __init__(self, db_path: str):
@@ -14,23 +30,31 @@ class MiniSQL:
         return conn
 
     def exec(self, sql: str, params: Sequence[Any] = ()) -> int:
-        with self.connect() as conn:
+        with closing(self.connect()) as conn:
             cur = conn.execute(sql, params)
             conn.commit()
             return cur.rowcount
 
     def exec_many(self, sql: str, seq_of_params: Iterable[Sequence[Any]]) -> int:
-        with self.connect() as conn:
+        with closing(self.connect()) as conn:
             cur = conn.executemany(sql, seq_of_params)
             conn.commit()
             return cur.rowcount
 
     def query_all(self, sql: str, params: Sequence[Any] = ()) -> List[Dict[str, Any]]:
-        with self.connect() as conn:
+        with _query_context(), closing(self.connect()) as conn:
             rows = conn.execute(sql, params).fetchall()
             return [dict(r) for r in rows]
 
+    def iter_query(self, sql: str, params: Sequence[Any] = (), batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """逐批 fetchmany 的查询，连接在迭代结束（或生成器关闭）时释放"""
+        with closing(self.connect()) as conn:
+            cur = conn.execute(sql, params)
+            while rows := cur.fetchmany(batch_size):
+                for r in rows:
+                    yield dict(r)
+
     def query_one(self, sql: str, params: Sequence[Any] = ()) -> Optional[Dict[str, Any]]:
-        with self.connect() as conn:
+        with _query_context(), closing(self.connect()) as conn:
             row = conn.execute(sql, params).fetchone()
             return dict(row) if row else None
@@ -0,0 +1,166 @@
+"""
+数据模型与 MySQL 连接配置
+从 app.py 拆出：import_data.py / db_migrate.py 只需要模型，不必导入整个 Web 应用（numpy、统计模块、requests 等）；
+app.py 也只在数据源为 auto / mysql 时才导入本模块（见 app.create_app），纯 JSON / SQLite 部署不加载 SQLAlchemy
+"""
+import os
+from datetime import datetime
+from pathlib import Path
+
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+
+# === 配置部分 ===
+DB_USER = 'hp_user'
+DB_PASS = '123456'
+DB_HOST = '127.0.0.1'
+DB_NAME = 'house_price_db'
+
+# 使用 pymysql 连接 MySQL
+DATABASE_URI = f'mysql+pymysql://{DB_USER}:{DB_PASS}@{DB_HOST}/{DB_NAME}?charset=utf8mb4'
+
+# MySQL 数据版本文件：import_data.py 导入完成后更新，app.py 的统计缓存据此失效（与 app.MYSQL_VERSION_FILE 相同）
+MYSQL_VERSION_FILE = Path(
+    os.environ.get("HPQAQ_DATA_DIR") or Path(__file__).resolve().parent.parent / "data"
+) / ".mysql_version"
+
+db = SQLAlchemy()
+
+
+def init_db(app: Flask) -> None:
+    """把 db 绑定到 app；engine 在这里创建，连接池在第一次查询时才真正建立连接"""
+    app.config.setdefault('SQLALCHEMY_DATABASE_URI', DATABASE_URI)
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+
+
+def create_cli_app() -> Flask:
+    """只带数据库的最小 Flask 应用，供命令行脚本推入应用上下文使用"""
+    app = Flask(__name__)
+    init_db(app)
+    return app
+
+
+# === 数据模型 (Model) ===
+class City(db.Model):
+    __tablename__ = 'cities'
+    id = db.Column(db.Integer, primary_key=True)
+    code = db.Column(db.String(20), unique=True, index=True)
+    name = db.Column(db.String(50))
+
+
+class Region(db.Model):
+    __tablename__ = 'regions'
+    id = db.Column(db.Integer, primary_key=True)
+    city_code = db.Column(db.String(20), db.ForeignKey('cities.code'), index=True)
+    name = db.Column(db.String(50))
+
+
+class Transaction(db.Model):
+    __tablename__ = 'transactions'
+
+    id = db.Column(db.Integer, primary_key=True)
+    city_code = db.Column(db.String(20), db.ForeignKey('cities.code'), index=True)
+    region_name = db.Column(db.String(50), index=True)
+
+    bizcircle = db.Column(db.String(100), index=True)
+    community = db.Column(db.String(500), index=True)
+    layout = db.Column(db.String(50))
+
+    total_price_wan = db.Column(db.Numeric(10, 2))
+    unit_price_yuan_sqm = db.Column(db.Integer)
+    area_sqm = db.Column(db.Numeric(10, 2))
+
+    deal_date = db.Column(db.Date, index=True)
+
+    house_id = db.Column(db.String(100), unique=True)
+    orientation = db.Column(db.String(50))
+    building_year = db.Column(db.String(20))
+    floor = db.Column(db.String(50))
+    detail_url = db.Column(db.String(500))
+    crawl_time = db.Column(db.DateTime, default=datetime.now)
+
+    # 复合索引：热点查询都是 city_code + 一个维度过滤，再按 deal_date 排序/分组。
+    # - 显式带上主键 id，列表的 (deal_date, id) 游标翻页可以直接按索引顺序读取
+    # - 带上单价/总价，走势和历史均价的聚合只扫索引，不回表
+    # 已有库请运行 db_migrate.py 补建（db.create_all 不会给已存在的表加索引）
+    __table_args__ = (
+        db.Index(
+            'ix_transactions_city_date_id',
+            'city_code', 'deal_date', 'id',
+            'unit_price_yuan_sqm', 'total_price_wan'
+        ),
+        db.Index(
+            'ix_transactions_city_biz_date',
+            'city_code', 'bizcircle', 'deal_date', 'id',
+            'unit_price_yuan_sqm', 'total_price_wan'
+        ),
+        db.Index(
+            'ix_transactions_city_region_date',
+            'city_code', 'region_name', 'deal_date', 'id',
+            'unit_price_yuan_sqm', 'total_price_wan'
+        ),
+        # 户型筛选 / 户型计数（/api/facets）
+        db.Index('ix_transactions_city_layout', 'city_code', 'layout'),
+    )
+
+
+class MonthSketch(db.Model):
+    """(城市, 区域, 商圈, 月) 的单价 / 总价分位数草图，导入数据后由 price_stats.rebuild_month_sketches_in_db 重建"""
+    __tablename__ = 'transaction_month_sketches'
+
+    id = db.Column(db.Integer, primary_key=True)
+    city_code = db.Column(db.String(20), nullable=False)
+    region_name = db.Column(db.String(50))
+    bizcircle = db.Column(db.String(100))
+    year_month = db.Column(db.String(7), nullable=False)
+    count = db.Column(db.Integer, nullable=False)
+    unit_sketch = db.Column(db.Text, nullable=False)
+    total_sketch = db.Column(db.Text, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_month_sketches_city_month', 'city_code', 'year_month'),
+    )
+
+
+class MonthHistogram(db.Model):
+    """(城市, 区域, 商圈, 月) 的固定分箱计数，导入数据后由 price_stats.rebuild_month_histograms_in_db 重建"""
+    __tablename__ = 'transaction_month_histograms'
+
+    id = db.Column(db.Integer, primary_key=True)
+    city_code = db.Column(db.String(20), nullable=False)
+    region_name = db.Column(db.String(50))
+    bizcircle = db.Column(db.String(100))
+    year_month = db.Column(db.String(7), nullable=False)
+    metric = db.Column(db.String(30), nullable=False)
+    counts = db.Column(db.Text, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_month_histograms_city_metric_month', 'city_code', 'metric', 'year_month'),
+    )
+
+
+class MonthCube(db.Model):
+    """
+    (城市, 区域, 商圈, 户型, 月) 聚合立方体格子：条数、单价 / 总价的和与最小 / 最大值
+    导入时由 price_stats.update_month_cube_in_db 按月增量合并
+    """
+    __tablename__ = 'transaction_month_cube'
+
+    id = db.Column(db.Integer, primary_key=True)
+    city_code = db.Column(db.String(20), nullable=False)
+    region_name = db.Column(db.String(50))
+    bizcircle = db.Column(db.String(100))
+    layout = db.Column(db.String(50))
+    year_month = db.Column(db.String(7), nullable=False)
+    count = db.Column(db.Integer, nullable=False)
+    unit_sum = db.Column(db.Float(precision=53), nullable=False)
+    total_sum = db.Column(db.Float(precision=53), nullable=False)
+    unit_min = db.Column(db.Float(precision=53))
+    unit_max = db.Column(db.Float(precision=53))
+    total_min = db.Column(db.Float(precision=53))
+    total_max = db.Column(db.Float(precision=53))
+
+    __table_args__ = (
+        db.Index('ix_month_cube_city_month', 'city_code', 'year_month'),
+    )
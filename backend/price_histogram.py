@@ -0,0 +1,79 @@
+"""
+价格 / 面积分布直方图：固定的对数刻度分箱
+- 分箱对所有城市、所有月份相同，(区域, 商圈, 月) 各格子的计数向量可以直接相加
+- 计数向量布局：[低于下限, 第 0 箱, ..., 第 n-1 箱, 不低于上限]，缺失值（<= 0）计入“低于下限”
+- 任意日期区间的分布 = 区间内格子向量之和，代价与成交条数无关
+"""
+from typing import Dict, List
+
+import numpy as np
+
+
+class LogBins:
+    """[lo, hi) 上每十倍 per_decade 个等比分箱"""
+
+    def __init__(self, lo: float, hi: float, per_decade: int, digits: int = 0):
+        self.lo = lo
+        self.hi = hi
+        self.per_decade = per_decade
+        self.digits = digits
+        self.n = int(round(np.log10(hi / lo) * per_decade))
+
+    @property
+    def size(self) -> int:
+        """计数向量长度（含两端的溢出箱）"""
+        return self.n + 2
+
+    def edges(self) -> List[float]:
+        """n + 1 个分箱边界"""
+        edges = self.lo * 10 ** (np.arange(self.n + 1) / self.per_decade)
+        return [round(float(e), self.digits) if self.digits else int(round(e)) for e in edges]
+
+    def index(self, values) -> np.ndarray:
+        """值 -> 计数向量中的位置（0 为低于下限，n + 1 为不低于上限）"""
+        values = np.asarray(values, dtype=np.float64)
+        index = np.zeros(len(values), dtype=np.int64)
+        positive = values > 0
+        index[positive] = np.floor(np.log10(values[positive] / self.lo) * self.per_decade).astype(np.int64) + 1
+        return np.clip(index, 0, self.n + 1)
+
+    def counts(self, values) -> np.ndarray:
+        return np.bincount(self.index(values), minlength=self.size)
+
+
+# 单价：1 千 ~ 100 万元/㎡，面积：10 ~ 1000 ㎡；每十倍 20 箱（相邻边界约差 12%）
+HISTOGRAM_BINS: Dict[str, LogBins] = {
+    "unit_price_yuan_sqm": LogBins(1_000, 1_000_000, 20),
+    "area_sqm": LogBins(10, 1_000, 20, digits=2),
+}
+
+
+def group_histograms(group_ids, values, bins: LogBins) -> Dict[int, np.ndarray]:
+    """按 group_ids 分组统计分箱计数：{group_id: 计数向量}，一次 np.unique 完成"""
+    group_ids = np.asarray(group_ids, dtype=np.int64)
+    if not len(group_ids):
+        return {}
+    keys, counts = np.unique(group_ids * bins.size + bins.index(values), return_counts=True)
+    groups, positions = np.divmod(keys, bins.size)
+
+    result: Dict[int, np.ndarray] = {}
+    for gid, pos, cnt in zip(groups.tolist(), positions.tolist(), counts.tolist()):
+        vector = result.get(gid)
+        if vector is None:
+            vector = result[gid] = np.zeros(bins.size, dtype=np.int64)
+        vector[pos] = cnt
+    return result
+
+
+def histogram_result(metric: str, counts) -> Dict[str, object]:
+    """计数向量 -> 接口输出：edges 比 counts 多一个，两端溢出单独给出"""
+    bins = HISTOGRAM_BINS[metric]
+    counts = np.zeros(bins.size, dtype=np.int64) if counts is None else np.asarray(counts)
+    return {
+        "metric": metric,
+        "edges": bins.edges(),
+        "counts": counts[1:-1].tolist(),
+        "below": int(counts[0]),
+        "above": int(counts[-1]),
+        "total": int(counts.sum()),
+    }
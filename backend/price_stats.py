@@ -0,0 +1,1330 @@
+"""
+历史均价统计模块
+按城市、区域、商圈统计历史成交：均价、走势、热力图、分位数、价格分布、聚合立方体与分面计数
+"""
+import json
+import time
+from pathlib import Path
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+import metrics
+import request_timing
+import result_cache
+from columnar import CityColumns, calendar_indexes, month_label
+from quantile_sketch import QuantileSketch, paired_group_sketches
+from price_histogram import HISTOGRAM_BINS, group_histograms
+from aggregate_cube import CELL_FIELDS, CubeCells
+from comparables import CompsIndex
+from lazy_module import lazy_import
+
+# 数据库查询只在 MySQL 数据源下用到，SQLAlchemy 延迟到第一次查询时导入
+sa = lazy_import("sqlalchemy")
+
+
+# === 运行指标（见 metrics.py） ===
+STATISTICS_ERRORS = metrics.Counter(
+    "hpqaq_statistics_errors_total", "统计查询失败次数（kind=db / json）", ("kind",),
+)
+JSON_LOAD_SECONDS = metrics.Histogram(
+    "hpqaq_json_load_seconds", "解析城市 JSON 文件的耗时（秒）", (),
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+COLUMNS_BUILD_SECONDS = metrics.Histogram(
+    "hpqaq_columns_build_seconds", "构建 JSON 列式缓存的耗时（秒）", (),
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+
+
+def _log_db_error(e: Exception) -> None:
+    STATISTICS_ERRORS.inc(kind="db")
+    print(f"[price_stats] DB query error: {e}")
+
+
+def _log_json_error(city_code: str, e: Exception) -> None:
+    STATISTICS_ERRORS.inc(kind="json")
+    print(f"[price_stats] JSON parse error for {city_code}: {e}")
+
+
+def _parse_date_any(s):
+    """解析多种日期格式"""
+    if not s:
+        return None
+    if isinstance(s, datetime):
+        return s.date()
+    for fmt in ("%Y-%m-%d", "%Y/%m/%d", "%Y.%m.%d", "%Y-%m-%d %H:%M:%S"):
+        try:
+            return datetime.strptime(str(s), fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def _as_float(x, default=0.0):
+    """安全转换为浮点数"""
+    if x is None or x == "":
+        return default
+    try:
+        return float(x)
+    except Exception:
+        return default
+
+
+def _as_int(x, default=0):
+    """安全转换为整数"""
+    if x is None or x == "":
+        return default
+    try:
+        return int(float(x))
+    except Exception:
+        return default
+
+
+# 历史均价结果的字段顺序（行式 / 列式输出共用）
+HISTORICAL_FIELDS = (
+    "year",
+    "month",
+    "year_month",
+    "avg_unit_price_yuan_sqm",
+    "avg_total_price_wan",
+    "count",
+)
+
+
+def rows_or_columns(
+    fields: Sequence[str],
+    records: Iterable[Sequence[Any]],
+    shape: str = "rows"
+) -> Union[List[Dict[str, Any]], Dict[str, List[Any]]]:
+    """
+    把按 fields 顺序排列的元组序列转换为输出结构
+    - shape="rows": [{"month": ..., "count": ...}, ...]
+    - shape="columns": {"month": [...], "count": [...]}，图表接口使用，不构造逐行 dict
+    """
+    if shape == "columns":
+        columns = {name: [] for name in fields}
+        appenders = [columns[name].append for name in fields]
+        for rec in records:
+            for append, value in zip(appenders, rec):
+                append(value)
+        return columns
+    return [dict(zip(fields, rec)) for rec in records]
+
+
+def month_range(start_month: str, end_month: str) -> Tuple[date, date]:
+    """
+    "YYYY-MM" 月份区间 -> [起始月 1 日, 结束月的下个月 1 日) 的半开日期区间
+    直接用于 deal_date 的范围条件，MySQL 可以走索引范围扫描
+    """
+    start_year, start_month_num = (int(x) for x in start_month.split("-")[:2])
+    end_year, end_month_num = (int(x) for x in end_month.split("-")[:2])
+    if end_month_num == 12:
+        end_year, end_month_num = end_year + 1, 1
+    else:
+        end_month_num += 1
+    return date(start_year, start_month_num, 1), date(end_year, end_month_num, 1)
+
+
+def build_historical_avg_query(
+    db_session,
+    Transaction,
+    city_code: str,
+    bizcircle: Optional[str] = None,
+    start_month: str = "2023-01",
+    end_month: str = "2025-12"
+):
+    """
+    构造月度均价聚合查询（未执行）
+    WHERE 只对 deal_date 做范围比较，不在列上套函数；配合
+    (city_code, bizcircle, deal_date, id, 单价, 总价) 复合索引可以只扫索引。
+    """
+    start_date, end_date = month_range(start_month, end_month)
+
+    query = db_session.query(
+        sa.extract('year', Transaction.deal_date).label('year'),
+        sa.extract('month', Transaction.deal_date).label('month'),
+        sa.func.avg(Transaction.unit_price_yuan_sqm).label('avg_unit'),
+        sa.func.avg(Transaction.total_price_wan).label('avg_total'),
+        sa.func.count(Transaction.id).label('count')
+    ).filter(
+        sa.and_(
+            Transaction.city_code == city_code,
+            Transaction.deal_date >= start_date,
+            Transaction.deal_date < end_date
+        )
+    )
+
+    if bizcircle:
+        query = query.filter(Transaction.bizcircle == bizcircle)
+
+    return query.group_by('year', 'month').order_by('year', 'month')
+
+
+def get_historical_avg_price_from_db(
+    db_session,
+    Transaction,
+    city_code: str,
+    bizcircle: Optional[str] = None,
+    start_month: str = "2023-01",
+    end_month: str = "2025-12",
+    shape: str = "rows"
+) -> List[Dict]:
+    """
+    从 MySQL 数据库统计历史均价（按年度）
+    
+    Args:
+        db_session: SQLAlchemy session
+        Transaction: Transaction 模型类
+        city_code: 城市代码
+        bizcircle: 商圈名称（可选）
+        start_month: 起始月份（格式：YYYY-MM）
+        end_month: 结束月份（格式：YYYY-MM）
+        shape: rows（默认）或 columns，见 rows_or_columns
+    
+    Returns:
+        [{"year": 2023, "avg_unit_price": 50000, "avg_total_price": 300.5, "count": 1234}, ...]
+    """
+    try:
+        query = build_historical_avg_query(
+            db_session, Transaction, city_code, bizcircle, start_month, end_month
+        )
+        
+        rows = query.all()
+        
+        records = [_db_row_to_record(r) for r in rows]
+        return rows_or_columns(HISTORICAL_FIELDS, records, shape)
+    
+    except sa.exc.SQLAlchemyError as e:
+        _log_db_error(e)
+        return rows_or_columns(HISTORICAL_FIELDS, [], shape)
+
+
+def _db_row_to_record(r) -> tuple:
+    """月度聚合查询的一行 -> HISTORICAL_FIELDS 顺序的元组"""
+    year = int(r.year) if r.year else 0
+    month = int(r.month) if r.month else 1
+    return (
+        year,
+        month,
+        f"{year}-{month:02d}",
+        int(r.avg_unit) if r.avg_unit else 0,
+        round(float(r.avg_total), 2) if r.avg_total else 0.0,
+        r.count
+    )
+
+
+def get_historical_avg_price_batch_from_db(
+    db_session,
+    Transaction,
+    city_code: str,
+    bizcircles: Sequence[Optional[str]],
+    start_month: str = "2023-01",
+    end_month: str = "2025-12",
+    shape: str = "rows"
+) -> Dict[Optional[str], Any]:
+    """
+    用一条 GROUP BY bizcircle, year, month 的 SQL 统计多个商圈的月度均价（对比模式）
+    bizcircles 中的 None 表示全城，单独走 get_historical_avg_price_from_db。
+    
+    Returns:
+        {bizcircle: 与 get_historical_avg_price_from_db 相同结构的结果}
+    """
+    wanted = {b or None for b in bizcircles}
+    results = {}
+    
+    if None in wanted:
+        results[None] = get_historical_avg_price_from_db(
+            db_session, Transaction, city_code, None, start_month, end_month, shape
+        )
+    
+    names = sorted(b for b in wanted if b)
+    if not names:
+        return results
+    
+    try:
+        start_date, end_date = month_range(start_month, end_month)
+        
+        rows = db_session.query(
+            Transaction.bizcircle.label('bizcircle'),
+            sa.extract('year', Transaction.deal_date).label('year'),
+            sa.extract('month', Transaction.deal_date).label('month'),
+            sa.func.avg(Transaction.unit_price_yuan_sqm).label('avg_unit'),
+            sa.func.avg(Transaction.total_price_wan).label('avg_total'),
+            sa.func.count(Transaction.id).label('count')
+        ).filter(
+            sa.and_(
+                Transaction.city_code == city_code,
+                Transaction.bizcircle.in_(names),
+                Transaction.deal_date >= start_date,
+                Transaction.deal_date < end_date
+            )
+        ).group_by('bizcircle', 'year', 'month').order_by('bizcircle', 'year', 'month').all()
+        
+        per_biz = {b: [] for b in names}
+        for r in rows:
+            if r.bizcircle in per_biz:
+                per_biz[r.bizcircle].append(_db_row_to_record(r))
+        
+        for b in names:
+            results[b] = rows_or_columns(HISTORICAL_FIELDS, per_biz[b], shape)
+        return results
+    
+    except sa.exc.SQLAlchemyError as e:
+        _log_db_error(e)
+        for b in names:
+            results[b] = rows_or_columns(HISTORICAL_FIELDS, [], shape)
+        return results
+
+
+def get_historical_avg_price_from_json(
+    data_dir: Path,
+    city_json_map: Dict[str, str],
+    city_code: str,
+    bizcircle: Optional[str] = None,
+    start_month: str = "2023-01",
+    end_month: str = "2025-12",
+    shape: str = "rows"
+) -> List[Dict]:
+    """
+    从 JSON 文件统计历史均价（按年度）
+    
+    Args:
+        data_dir: data 目录路径
+        city_json_map: 城市代码到 JSON 文件名的映射
+        city_code: 城市代码
+        bizcircle: 商圈名称（可选）
+        start_month: 起始月份（格式：YYYY-MM）
+        end_month: 结束月份（格式：YYYY-MM）
+        shape: rows（默认）或 columns，见 rows_or_columns
+    
+    Returns:
+        [{"year": 2023, "avg_unit_price": 50000, "avg_total_price": 300.5, "count": 1234}, ...]
+    """
+    bizcircle = bizcircle or None
+    return get_historical_avg_price_batch_from_json(
+        data_dir, city_json_map, city_code, [bizcircle], start_month, end_month, shape
+    )[bizcircle]
+
+
+def _load_city_items(data_dir: Path, city_json_map: Dict[str, str], city_code: str):
+    """读取城市 JSON 记录列表；文件不存在返回 None，解析失败抛异常"""
+    path = _city_json_path(data_dir, city_json_map, city_code)
+    
+    if not path.exists():
+        return None
+    
+    start = time.perf_counter()
+    with request_timing.span("json_load"), path.open("r", encoding="utf-8") as f:
+        obj = json.load(f)
+    JSON_LOAD_SECONDS.observe(time.perf_counter() - start)
+    
+    if isinstance(obj, list):
+        return obj
+    if isinstance(obj, dict):
+        return obj.get("items") or obj.get("data") or []
+    return []
+
+
+def _city_json_path(data_dir: Path, city_json_map: Dict[str, str], city_code: str) -> Path:
+    city_code = (city_code or "").strip().lower()
+    return data_dir / city_json_map.get(city_code, f"crawl_history_{city_code}.json")
+
+
+def _day_index(value) -> int:
+    """deal_date -> date.toordinal()，无法解析返回 -1；"YYYY-MM-DD" 走 fromisoformat 快速路径"""
+    if isinstance(value, str) and len(value) == 10 and value[4] == "-" and value[7] == "-":
+        try:
+            return date.fromisoformat(value).toordinal()
+        except ValueError:
+            pass
+    d_obj = _parse_date_any(value)
+    return d_obj.toordinal() if d_obj else -1
+
+
+def _month_index_of(year_month: str) -> int:
+    """"YYYY-MM" -> 月份序号"""
+    year, month = (int(x) for x in year_month.split("-")[:2])
+    return year * 12 + month - 1
+
+
+# === JSON 列式缓存 ===
+# 每个城市的 JSON 只在文件变化（mtime + 大小）后重新解析一次，转换为 CityColumns，
+# 之后的统计都是对数组做掩码和 bincount，不再逐条解析日期、价格。
+_CITY_COLUMNS_CACHE: Dict[Path, Tuple[str, Optional[CityColumns]]] = {}
+
+
+def load_city_columns(
+    data_dir: Path,
+    city_json_map: Dict[str, str],
+    city_code: str
+) -> Optional[CityColumns]:
+    """城市 JSON -> CityColumns（按文件版本缓存）；文件不存在返回 None，解析失败抛异常"""
+    path = _city_json_path(data_dir, city_json_map, city_code)
+    token = result_cache.file_token(path)
+    cached = _CITY_COLUMNS_CACHE.get(path)
+    if cached and cached[0] == token:
+        return cached[1]
+
+    items = _load_city_items(data_dir, city_json_map, city_code)
+    columns = None
+    if items is not None:
+        start = time.perf_counter()
+        columns = _build_city_columns(items)
+        COLUMNS_BUILD_SECONDS.observe(time.perf_counter() - start)
+    _CITY_COLUMNS_CACHE[path] = (token, columns)
+    return columns
+
+
+@request_timing.timed("columns")
+def _build_city_columns(items: List[Any]) -> CityColumns:
+    """JSON 记录列表 -> CityColumns"""
+    # 非 dict 记录按空记录保留，行号与文件下标（列表的 id）一一对应
+    rows = [raw if isinstance(raw, dict) else {} for raw in items]
+    days = [_day_index(raw.get("deal_date")) for raw in rows]
+    months, weeks = calendar_indexes(days)
+    return CityColumns(
+        months=months,
+        unit_prices=[_as_int(raw.get("unit_price_yuan_sqm"), 0) for raw in rows],
+        total_prices=[_as_float(raw.get("total_price_wan"), 0.0) for raw in rows],
+        regions=[raw.get("region") or raw.get("region_name") for raw in rows],
+        bizcircles=[raw.get("bizcircle") for raw in rows],
+        areas=[_as_float(raw.get("area_sqm"), 0.0) for raw in rows],
+        layouts=[raw.get("layout") for raw in rows],
+        weeks=weeks,
+        communities=[raw.get("community") for raw in rows],
+        days=days,
+    )
+
+
+def _monthly_records(months, sum_units, sum_totals, counts) -> List[tuple]:
+    """按月求和结果 -> HISTORICAL_FIELDS 顺序的元组，取整方式与逐条累加时一致"""
+    records = []
+    for m, sum_unit, sum_total, cnt in zip(months, sum_units, sum_totals, counts):
+        year, month0 = divmod(m, 12)
+        records.append((
+            year,
+            month0 + 1,
+            month_label(m),
+            int(sum_unit / cnt),
+            round(sum_total / cnt, 2),
+            cnt
+        ))
+    return records
+
+
+def get_historical_avg_price_batch_from_json(
+    data_dir: Path,
+    city_json_map: Dict[str, str],
+    city_code: str,
+    bizcircles: Sequence[Optional[str]],
+    start_month: str = "2023-01",
+    end_month: str = "2025-12",
+    shape: str = "rows"
+) -> Dict[Optional[str], Any]:
+    """
+    一次统计多个商圈的月度均价（对比模式）：全城一次按月 bincount，
+    所有商圈一次按 (商圈, 月) bincount
+    
+    Args:
+        bizcircles: 商圈名称列表，None 表示全城
+        其余参数同 get_historical_avg_price_from_json
+    
+    Returns:
+        {bizcircle: 与 get_historical_avg_price_from_json 相同结构的结果}
+    """
+    wanted = {b or None for b in bizcircles}
+    
+    try:
+        columns = load_city_columns(data_dir, city_json_map, city_code)
+        if columns is None:
+            return {b: rows_or_columns(HISTORICAL_FIELDS, [], shape) for b in wanted}
+        
+        in_range = columns.mask(_month_index_of(start_month), _month_index_of(end_month))
+        per_biz = {b: [] for b in wanted}
+        
+        if None in wanted:
+            per_biz[None] = _monthly_records(*columns.monthly(in_range))
+        
+        names = [b for b in wanted if b]
+        if names:
+            selected = in_range & columns.select("bizcircle", names)
+            biz_names = columns.names["bizcircle"]
+            groups, months, sum_units, sum_totals, counts = columns.grouped_monthly("bizcircle", selected)
+            for code, m, sum_unit, sum_total, cnt in zip(groups, months, sum_units, sum_totals, counts):
+                per_biz[biz_names[code]] += _monthly_records([m], [sum_unit], [sum_total], [cnt])
+        
+        return {b: rows_or_columns(HISTORICAL_FIELDS, records, shape) for b, records in per_biz.items()}
+    
+    except Exception as e:
+        _log_json_error(city_code, e)
+        return {b: rows_or_columns(HISTORICAL_FIELDS, [], shape) for b in wanted}
+
+
+# === 走势的时间粒度 ===
+# 周 / 月 / 季度三档；周期序号：周为 (date.toordinal() - 1) // 7，月为 year * 12 + month - 1，
+# 季度为 year * 4 + quarter - 1。输出的标签分别是 "2025-W03" / "2025-01" / "2025-Q1"。
+TREND_RESOLUTIONS = ("week", "month", "quarter")
+
+
+def period_label(resolution: str, index: int) -> str:
+    """周期序号 -> 标签"""
+    if resolution == "month":
+        return month_label(index)
+    if resolution == "quarter":
+        year, quarter0 = divmod(int(index), 4)
+        return f"{year}-Q{quarter0 + 1}"
+    year, week, _ = date.fromordinal(int(index) * 7 + 1).isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def trend_period_counts(first_day: int, last_day: int) -> Dict[str, int]:
+    """
+    成交日期跨度（日序号，date.toordinal()）-> 各粒度从首个周期到末个周期的周期数
+    没有成交的周期不出点，所以这是该粒度走势点数的上限
+    """
+    first, last = date.fromordinal(first_day), date.fromordinal(last_day)
+    first_month, last_month = first.year * 12 + first.month - 1, last.year * 12 + last.month - 1
+    return {
+        "week": (last_day - 1) // 7 - (first_day - 1) // 7 + 1,
+        "month": last_month - first_month + 1,
+        "quarter": last_month // 3 - first_month // 3 + 1,
+    }
+
+
+def rollup_month_sketches(
+    month_sketches: Dict[str, Tuple[QuantileSketch, QuantileSketch]],
+    resolution: str = "month"
+) -> Dict[str, Tuple[QuantileSketch, QuantileSketch]]:
+    """按月草图合并为季度草图（month 原样返回）；周没有对应的草图，不支持"""
+    if resolution == "month":
+        return month_sketches
+    merged = {}
+    for year_month, (unit_sketch, total_sketch) in month_sketches.items():
+        label = period_label("quarter", _month_index_of(year_month) // 3)
+        if label not in merged:
+            merged[label] = (QuantileSketch(), QuantileSketch())
+        merged[label][0].merge(unit_sketch)
+        merged[label][1].merge(total_sketch)
+    return merged
+
+
+def get_price_trend_from_json(
+    data_dir: Path,
+    city_json_map: Dict[str, str],
+    city_code: str,
+    region: Optional[str] = None,
+    bizcircle: Optional[str] = None,
+    resolution: str = "month"
+) -> List[tuple]:
+    """全部周期的走势，返回 [(周期标签, avg_unit, avg_total, count), ...]，与 SQLite 数据源相同"""
+    try:
+        columns = load_city_columns(data_dir, city_json_map, city_code)
+        if columns is None:
+            return []
+        mask = columns.mask(region=region, bizcircle=bizcircle)
+        return [
+            (period_label(resolution, index), int(sum_unit / cnt), round(sum_total / cnt, 2), cnt)
+            for index, sum_unit, sum_total, cnt in zip(*columns.periodic(mask, resolution))
+        ]
+    
+    except Exception as e:
+        _log_json_error(city_code, e)
+        return []
+
+
+def get_trend_span_from_json(
+    data_dir: Path,
+    city_json_map: Dict[str, str],
+    city_code: str,
+    region: Optional[str] = None,
+    bizcircle: Optional[str] = None
+) -> Optional[Tuple[int, int]]:
+    """走势覆盖的 (最早, 最晚) 成交日序号，没有带日期的记录返回 None"""
+    try:
+        columns = load_city_columns(data_dir, city_json_map, city_code)
+        if columns is None:
+            return None
+        return columns.date_span(columns.mask(region=region, bizcircle=bizcircle))
+
+    except Exception as e:
+        _log_json_error(city_code, e)
+        return None
+
+
+# === 全城热力图：维度（商圈 / 区域）× 月份 ===
+# 一次扫描（JSON）或一条 GROUP BY 维度, 年, 月 的 SQL 得到所有格子，
+# 代价只与记录数有关，不再是 商圈数 × 记录数。
+HEATMAP_DIMENSIONS = ("bizcircle", "region")
+
+
+def month_labels(start_month: str, end_month: str) -> List[str]:
+    """"2024-11" ~ "2025-02" -> ["2024-11", "2024-12", "2025-01", "2025-02"]"""
+    start, end = month_range(start_month, end_month)
+    labels = []
+    year, month = start.year, start.month
+    while (year, month) < (end.year, end.month):
+        labels.append(f"{year}-{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return labels
+
+
+def build_heatmap(
+    dimension: str,
+    months: Sequence[str],
+    cells: Dict[Tuple[str, str], Sequence[float]]
+) -> Dict[str, Any]:
+    """
+    {(名称, year_month): (sum_unit, sum_total, count)} -> 稠密矩阵
+    行为维度取值（按名称排序），列为 months 中的每个月；
+    没有成交的格子均价为 None、count 为 0。取整方式与历史均价一致。
+    """
+    names = sorted({name for name, _ in cells})
+    col_index = {m: j for j, m in enumerate(months)}
+
+    avg_unit = [[None] * len(months) for _ in names]
+    avg_total = [[None] * len(months) for _ in names]
+    counts = [[0] * len(months) for _ in names]
+
+    for i, name in enumerate(names):
+        for year_month, j in col_index.items():
+            cell = cells.get((name, year_month))
+            if not cell or not cell[2]:
+                continue
+            sum_unit, sum_total, cnt = cell
+            avg_unit[i][j] = int((sum_unit or 0) / cnt)
+            avg_total[i][j] = round((sum_total or 0.0) / cnt, 2)
+            counts[i][j] = cnt
+
+    return {
+        "dimension": dimension,
+        "months": list(months),
+        "names": names,
+        "avg_unit_price_yuan_sqm": avg_unit,
+        "avg_total_price_wan": avg_total,
+        "count": counts,
+        "row_count": [sum(row) for row in counts],
+    }
+
+
+def build_price_heatmap_query(
+    db_session,
+    Transaction,
+    city_code: str,
+    dimension: str = "bizcircle",
+    start_month: str = "2023-01",
+    end_month: str = "2025-12"
+):
+    """
+    构造全城热力图的 GROUP BY 维度, year, month 查询（未执行）
+    走 (city_code, bizcircle|region_name, deal_date, ...) 复合索引，只扫索引
+    """
+    column = Transaction.bizcircle if dimension == "bizcircle" else Transaction.region_name
+    start_date, end_date = month_range(start_month, end_month)
+
+    return db_session.query(
+        column.label('name'),
+        sa.extract('year', Transaction.deal_date).label('year'),
+        sa.extract('month', Transaction.deal_date).label('month'),
+        sa.func.sum(Transaction.unit_price_yuan_sqm).label('sum_unit'),
+        sa.func.sum(Transaction.total_price_wan).label('sum_total'),
+        sa.func.count(Transaction.id).label('count')
+    ).filter(
+        sa.and_(
+            Transaction.city_code == city_code,
+            column.isnot(None),
+            column != '',
+            Transaction.deal_date >= start_date,
+            Transaction.deal_date < end_date
+        )
+    ).group_by('name', 'year', 'month')
+
+
+def get_price_heatmap_from_db(
+    db_session,
+    Transaction,
+    city_code: str,
+    dimension: str = "bizcircle",
+    start_month: str = "2023-01",
+    end_month: str = "2025-12"
+) -> Dict[str, Any]:
+    """一条 SQL 统计全城热力图，结构见 build_heatmap"""
+    months = month_labels(start_month, end_month)
+    try:
+        rows = build_price_heatmap_query(
+            db_session, Transaction, city_code, dimension, start_month, end_month
+        ).all()
+
+        cells = {}
+        for r in rows:
+            year_month = f"{int(r.year)}-{int(r.month):02d}"
+            cells[(r.name, year_month)] = (float(r.sum_unit or 0), float(r.sum_total or 0), r.count)
+        return build_heatmap(dimension, months, cells)
+
+    except sa.exc.SQLAlchemyError as e:
+        _log_db_error(e)
+        return build_heatmap(dimension, months, {})
+
+
+def get_price_heatmap_from_json(
+    data_dir: Path,
+    city_json_map: Dict[str, str],
+    city_code: str,
+    dimension: str = "bizcircle",
+    start_month: str = "2023-01",
+    end_month: str = "2025-12"
+) -> Dict[str, Any]:
+    """按 (维度编码, 月份) 一次 bincount 统计全城热力图"""
+    months = month_labels(start_month, end_month)
+
+    try:
+        columns = load_city_columns(data_dir, city_json_map, city_code)
+        if columns is None:
+            return build_heatmap(dimension, months, {})
+
+        mask = columns.mask(_month_index_of(start_month), _month_index_of(end_month))
+        names = columns.names[dimension]
+        cells = {}
+        for code, m, sum_unit, sum_total, cnt in zip(*columns.grouped_monthly(dimension, mask)):
+            name = names[code]
+            if name.strip():
+                cells[(name, month_label(m))] = (sum_unit, sum_total, cnt)
+        return build_heatmap(dimension, months, cells)
+
+    except Exception as e:
+        _log_json_error(city_code, e)
+        return build_heatmap(dimension, months, {})
+
+
+# === 分位数：按 (区域, 商圈, 月) 存放的可合并草图 ===
+# 草图与月度聚合一起预先算好（JSON 列式缓存 / SQLite 导入 / MySQL 导入），查询时只合并格子，
+# 全市 = 合并所有格子，按区域 / 商圈 = 合并对应格子，不再读取原始记录。
+QUANTILE_PERCENTILES = (25, 50, 75, 90)
+
+
+def quantile_fields(percentiles: Sequence[int]) -> Tuple[str, ...]:
+    """(50, 90) -> ("p50_unit_price_yuan_sqm", "p50_total_price_wan", "p90_...", ...)"""
+    fields = []
+    for p in percentiles:
+        fields += [f"p{p}_unit_price_yuan_sqm", f"p{p}_total_price_wan"]
+    return tuple(fields)
+
+
+def build_cell_sketches(rows: Iterable[Sequence[Any]]) -> List[tuple]:
+    """
+    [(区域, 商圈, year_month, 单价, 总价), ...] -> [(区域, 商圈, year_month, count, 单价草图, 总价草图), ...]
+    SQLite / MySQL 导入后调用；区域、商圈为空记为 None
+    """
+    keys: Dict[tuple, int] = {}
+    ids, units, totals = [], [], []
+    for region, bizcircle, year_month, unit, total in rows:
+        ids.append(keys.setdefault((region or None, bizcircle or None, year_month), len(keys)))
+        units.append(float(unit or 0))
+        totals.append(float(total or 0))
+
+    sketches = paired_group_sketches(ids, units, totals)
+    cells = []
+    for (region, bizcircle, year_month), gid in keys.items():
+        unit_sketch, total_sketch = sketches[gid]
+        cells.append((region, bizcircle, year_month, unit_sketch.count, unit_sketch, total_sketch))
+    return cells
+
+
+def merge_month_sketches(
+    cells: Iterable[Sequence[Any]],
+    region: Optional[str] = None,
+    bizcircle: Optional[str] = None,
+    start_month: Optional[str] = None,
+    end_month: Optional[str] = None
+) -> Dict[str, Tuple[QuantileSketch, QuantileSketch]]:
+    """
+    合并符合条件的格子：cells 为 [(区域, 商圈, year_month, 单价草图, 总价草图), ...]
+    返回 {year_month: (单价草图, 总价草图)}
+    """
+    merged = {}
+    for cell_region, cell_bizcircle, year_month, unit_sketch, total_sketch in cells:
+        if region and cell_region != region:
+            continue
+        if bizcircle and cell_bizcircle != bizcircle:
+            continue
+        if (start_month and year_month < start_month) or (end_month and year_month > end_month):
+            continue
+        if year_month not in merged:
+            merged[year_month] = (QuantileSketch(), QuantileSketch())
+        merged[year_month][0].merge(unit_sketch)
+        merged[year_month][1].merge(total_sketch)
+    return merged
+
+
+def attach_quantiles(
+    result: Union[List[Dict[str, Any]], Dict[str, List[Any]]],
+    month_sketches: Dict[str, Tuple[QuantileSketch, QuantileSketch]],
+    percentiles: Sequence[int],
+    shape: str = "rows",
+    month_field: str = "year_month"
+):
+    """在按月的均价结果上追加 pXX_unit_price_yuan_sqm / pXX_total_price_wan（原地修改并返回）"""
+    fields = quantile_fields(percentiles)
+
+    def values_for(year_month):
+        sketches = month_sketches.get(year_month)
+        values = []
+        for p in percentiles:
+            if sketches is None:
+                values += [None, None]
+                continue
+            unit = sketches[0].quantile(p / 100)
+            total = sketches[1].quantile(p / 100)
+            values.append(int(round(unit)) if unit is not None else None)
+            values.append(round(total, 2) if total is not None else None)
+        return values
+
+    if shape == "columns":
+        for name in fields:
+            result[name] = []
+        for year_month in result[month_field]:
+            for name, value in zip(fields, values_for(year_month)):
+                result[name].append(value)
+    else:
+        for row in result:
+            row.update(zip(fields, values_for(row[month_field])))
+    return result
+
+
+def get_month_sketches_from_json(
+    data_dir: Path,
+    city_json_map: Dict[str, str],
+    city_code: str,
+    region: Optional[str] = None,
+    bizcircle: Optional[str] = None,
+    start_month: Optional[str] = None,
+    end_month: Optional[str] = None
+) -> Dict[str, Tuple[QuantileSketch, QuantileSketch]]:
+    """JSON 列式缓存中的格子草图（首次使用时一次排序建好）-> 按月合并"""
+    try:
+        columns = load_city_columns(data_dir, city_json_map, city_code)
+        if columns is None:
+            return {}
+        return merge_month_sketches(columns.cell_sketches(), region, bizcircle, start_month, end_month)
+    
+    except Exception as e:
+        _log_json_error(city_code, e)
+        return {}
+
+
+def rebuild_month_sketches_in_db(db_session, Transaction, MonthSketch, city_code: str) -> int:
+    """重建某城市的格子草图（导入数据后调用），返回格子数"""
+    rows = db_session.query(
+        Transaction.region_name,
+        Transaction.bizcircle,
+        Transaction.deal_date,
+        Transaction.unit_price_yuan_sqm,
+        Transaction.total_price_wan
+    ).filter(
+        Transaction.city_code == city_code,
+        Transaction.deal_date.isnot(None)
+    ).yield_per(10000)
+
+    cells = build_cell_sketches(
+        (region, bizcircle, f"{d.year}-{d.month:02d}", unit, total)
+        for region, bizcircle, d, unit, total in rows
+    )
+
+    db_session.query(MonthSketch).filter(MonthSketch.city_code == city_code).delete()
+    db_session.bulk_save_objects([
+        MonthSketch(
+            city_code=city_code,
+            region_name=region,
+            bizcircle=bizcircle,
+            year_month=year_month,
+            count=count,
+            unit_sketch=unit_sketch.to_json(),
+            total_sketch=total_sketch.to_json()
+        )
+        for region, bizcircle, year_month, count, unit_sketch, total_sketch in cells
+    ])
+    db_session.commit()
+    return len(cells)
+
+
+def get_month_sketches_from_db(
+    db_session,
+    MonthSketch,
+    city_code: str,
+    region: Optional[str] = None,
+    bizcircle: Optional[str] = None,
+    start_month: Optional[str] = None,
+    end_month: Optional[str] = None
+) -> Dict[str, Tuple[QuantileSketch, QuantileSketch]]:
+    """从 transaction_month_sketches 读出符合条件的格子并按月合并"""
+    try:
+        query = db_session.query(
+            MonthSketch.region_name,
+            MonthSketch.bizcircle,
+            MonthSketch.year_month,
+            MonthSketch.unit_sketch,
+            MonthSketch.total_sketch
+        ).filter(MonthSketch.city_code == city_code)
+        if region:
+            query = query.filter(MonthSketch.region_name == region)
+        if bizcircle:
+            query = query.filter(MonthSketch.bizcircle == bizcircle)
+        if start_month:
+            query = query.filter(MonthSketch.year_month >= start_month)
+        if end_month:
+            query = query.filter(MonthSketch.year_month <= end_month)
+
+        return merge_month_sketches(
+            (r.region_name, r.bizcircle, r.year_month,
+             QuantileSketch.from_json(r.unit_sketch), QuantileSketch.from_json(r.total_sketch))
+            for r in query
+        )
+    
+    except sa.exc.SQLAlchemyError as e:
+        _log_db_error(e)
+        return {}
+
+
+# === 分布直方图：按 (区域, 商圈, 月) 存放的固定分箱计数 ===
+HISTOGRAM_METRICS = tuple(HISTOGRAM_BINS)
+
+
+def build_cell_histograms(rows: Iterable[Sequence[Any]]) -> List[tuple]:
+    """
+    [(区域, 商圈, year_month, 单价, 面积), ...] -> [(区域, 商圈, year_month, metric, 计数向量), ...]
+    SQLite / MySQL 导入后调用；区域、商圈为空记为 None
+    """
+    keys: Dict[tuple, int] = {}
+    ids, values = [], {metric: [] for metric in HISTOGRAM_METRICS}
+    for region, bizcircle, year_month, unit, area in rows:
+        ids.append(keys.setdefault((region or None, bizcircle or None, year_month), len(keys)))
+        values["unit_price_yuan_sqm"].append(float(unit or 0))
+        values["area_sqm"].append(float(area or 0))
+
+    cells = []
+    for metric in HISTOGRAM_METRICS:
+        histograms = group_histograms(ids, values[metric], HISTOGRAM_BINS[metric])
+        for (region, bizcircle, year_month), gid in keys.items():
+            cells.append((region, bizcircle, year_month, metric, histograms[gid]))
+    return cells
+
+
+def merge_histograms(
+    cells: Iterable[Sequence[Any]],
+    metric: str,
+    region: Optional[str] = None,
+    bizcircle: Optional[str] = None,
+    start_month: Optional[str] = None,
+    end_month: Optional[str] = None
+):
+    """把符合条件的格子计数向量相加：cells 为 [(区域, 商圈, year_month, 计数向量), ...]"""
+    merged = np.zeros(HISTOGRAM_BINS[metric].size, dtype=np.int64)
+    for cell_region, cell_bizcircle, year_month, counts in cells:
+        if region and cell_region != region:
+            continue
+        if bizcircle and cell_bizcircle != bizcircle:
+            continue
+        if (start_month and year_month < start_month) or (end_month and year_month > end_month):
+            continue
+        merged += counts
+    return merged
+
+
+def get_histogram_from_json(
+    data_dir: Path,
+    city_json_map: Dict[str, str],
+    city_code: str,
+    metric: str = "unit_price_yuan_sqm",
+    region: Optional[str] = None,
+    bizcircle: Optional[str] = None,
+    start_month: Optional[str] = None,
+    end_month: Optional[str] = None
+):
+    """JSON 列式缓存中的格子计数（首次使用时建好）-> 区间内求和的计数向量"""
+    try:
+        columns = load_city_columns(data_dir, city_json_map, city_code)
+        if columns is None:
+            return merge_histograms([], metric)
+        return merge_histograms(
+            columns.cell_histograms(metric), metric, region, bizcircle, start_month, end_month
+        )
+    
+    except Exception as e:
+        _log_json_error(city_code, e)
+        return merge_histograms([], metric)
+
+
+def rebuild_month_histograms_in_db(db_session, Transaction, MonthHistogram, city_code: str) -> int:
+    """重建某城市的格子分箱计数（导入数据后调用），返回写入行数"""
+    rows = db_session.query(
+        Transaction.region_name,
+        Transaction.bizcircle,
+        Transaction.deal_date,
+        Transaction.unit_price_yuan_sqm,
+        Transaction.area_sqm
+    ).filter(
+        Transaction.city_code == city_code,
+        Transaction.deal_date.isnot(None)
+    ).yield_per(10000)
+
+    cells = build_cell_histograms(
+        (region, bizcircle, f"{d.year}-{d.month:02d}", unit, area)
+        for region, bizcircle, d, unit, area in rows
+    )
+
+    db_session.query(MonthHistogram).filter(MonthHistogram.city_code == city_code).delete()
+    db_session.bulk_save_objects([
+        MonthHistogram(
+            city_code=city_code,
+            region_name=region,
+            bizcircle=bizcircle,
+            year_month=year_month,
+            metric=metric,
+            counts=json.dumps(counts.tolist(), separators=(",", ":"))
+        )
+        for region, bizcircle, year_month, metric, counts in cells
+    ])
+    db_session.commit()
+    return len(cells)
+
+
+def get_histogram_from_db(
+    db_session,
+    MonthHistogram,
+    city_code: str,
+    metric: str = "unit_price_yuan_sqm",
+    region: Optional[str] = None,
+    bizcircle: Optional[str] = None,
+    start_month: Optional[str] = None,
+    end_month: Optional[str] = None
+):
+    """从 transaction_month_histograms 读出符合条件的格子并求和"""
+    try:
+        query = db_session.query(
+            MonthHistogram.region_name,
+            MonthHistogram.bizcircle,
+            MonthHistogram.year_month,
+            MonthHistogram.counts
+        ).filter(
+            MonthHistogram.city_code == city_code,
+            MonthHistogram.metric == metric
+        )
+        if region:
+            query = query.filter(MonthHistogram.region_name == region)
+        if bizcircle:
+            query = query.filter(MonthHistogram.bizcircle == bizcircle)
+        if start_month:
+            query = query.filter(MonthHistogram.year_month >= start_month)
+        if end_month:
+            query = query.filter(MonthHistogram.year_month <= end_month)
+
+        return merge_histograms(
+            ((r.region_name, r.bizcircle, r.year_month, np.asarray(json.loads(r.counts))) for r in query),
+            metric
+        )
+    
+    except sa.exc.SQLAlchemyError as e:
+        _log_db_error(e)
+        return merge_histograms([], metric)
+
+
+# === 多维聚合立方体：(区域, 商圈, 户型, 月) 格子上的 条数 / 和 / 最小 / 最大 ===
+def get_cube_from_json(
+    data_dir: Path,
+    city_json_map: Dict[str, str],
+    city_code: str
+) -> Optional[CubeCells]:
+    """JSON 列式缓存 -> 立方体格子；文件不存在或解析失败返回 None"""
+    try:
+        columns = load_city_columns(data_dir, city_json_map, city_code)
+        if columns is None:
+            return None
+        return CubeCells.from_codes(columns.names, columns.codes, columns.month, columns.unit, columns.total)
+    
+    except Exception as e:
+        _log_json_error(city_code, e)
+        return None
+
+
+def _cube_columns(MonthCube):
+    """与 CELL_FIELDS 顺序对应的列"""
+    return (
+        MonthCube.region_name,
+        MonthCube.bizcircle,
+        MonthCube.layout,
+        MonthCube.year_month,
+        MonthCube.count,
+        MonthCube.unit_sum,
+        MonthCube.total_sum,
+        MonthCube.unit_min,
+        MonthCube.unit_max,
+        MonthCube.total_min,
+        MonthCube.total_max
+    )
+
+
+def _save_cube_cells(db_session, MonthCube, city_code: str, cube: CubeCells) -> int:
+    """把格子写入 transaction_month_cube（调用方负责先删除旧格子并提交）"""
+    cells = cube.to_cells()
+    db_session.bulk_save_objects([
+        MonthCube(city_code=city_code, region_name=region, **dict(zip(CELL_FIELDS[1:], rest)))
+        for region, *rest in cells
+    ])
+    return len(cells)
+
+
+def rebuild_month_cube_in_db(db_session, Transaction, MonthCube, city_code: str) -> int:
+    """按 transactions 全量重建某城市的立方体格子（补建 / 修复时使用），返回格子数"""
+    rows = db_session.query(
+        Transaction.region_name,
+        Transaction.bizcircle,
+        Transaction.layout,
+        Transaction.deal_date,
+        Transaction.unit_price_yuan_sqm,
+        Transaction.total_price_wan
+    ).filter(
+        Transaction.city_code == city_code,
+        Transaction.deal_date.isnot(None)
+    ).yield_per(10000)
+
+    cube = CubeCells.from_records([
+        (region, bizcircle, layout, f"{d.year}-{d.month:02d}", unit, total)
+        for region, bizcircle, layout, d, unit, total in rows
+    ])
+
+    db_session.query(MonthCube).filter(MonthCube.city_code == city_code).delete()
+    cells = _save_cube_cells(db_session, MonthCube, city_code, cube)
+    db_session.commit()
+    return cells
+
+
+def update_month_cube_in_db(db_session, MonthCube, city_code: str, records: Sequence[Sequence[Any]]) -> int:
+    """
+    增量更新：把新导入的记录 [(区域, 商圈, 户型, year_month, 单价, 总价), ...] 合并进立方体
+    只读出并改写涉及到的月份（条数、和相加，最小 / 最大取最值），返回改写的格子数
+    """
+    months = sorted({rec[3] for rec in records if rec[3]})
+    if not months:
+        return 0
+
+    existing = db_session.query(*_cube_columns(MonthCube)).filter(
+        MonthCube.city_code == city_code,
+        MonthCube.year_month.in_(months)
+    ).all()
+    cube = CubeCells.from_cells([tuple(r) for r in existing] + CubeCells.from_records(records).to_cells())
+
+    db_session.query(MonthCube).filter(
+        MonthCube.city_code == city_code,
+        MonthCube.year_month.in_(months)
+    ).delete(synchronize_session=False)
+    cells = _save_cube_cells(db_session, MonthCube, city_code, cube)
+    db_session.commit()
+    return cells
+
+
+def get_cube_from_db(db_session, MonthCube, city_code: str) -> Optional[CubeCells]:
+    """读出某城市的全部格子；查询失败返回 None"""
+    try:
+        rows = db_session.query(*_cube_columns(MonthCube)).filter(MonthCube.city_code == city_code).all()
+        return CubeCells.from_cells([tuple(r) for r in rows])
+    
+    except sa.exc.SQLAlchemyError as e:
+        _log_db_error(e)
+        return None
+
+
+# === 筛选项计数（facets）：列表筛选条件下，区域 / 商圈 / 户型各取值的记录数 ===
+# 每个维度的计数套用“其他维度”的筛选条件（不含自身），下拉框里可以直接看到换一个取值后的记录数。
+FACET_DIMENSIONS = ("region", "bizcircle", "layout")
+
+
+def build_facets(total: int, counts: Dict[str, Iterable[Tuple[str, int]]]) -> Dict[str, Any]:
+    """{维度: [(取值, 条数), ...]} -> 接口输出；去掉空取值和 0 条的取值，按条数倒序、取值升序"""
+    return {
+        "total": int(total),
+        "facets": {
+            dim: [
+                {"value": value, "count": int(cnt)}
+                for value, cnt in sorted(
+                    ((v, c) for v, c in counts.get(dim, ()) if v and c),
+                    key=lambda vc: (-vc[1], vc[0])
+                )
+            ]
+            for dim in FACET_DIMENSIONS
+        }
+    }
+
+
+def get_facets_from_json(
+    data_dir: Path,
+    city_json_map: Dict[str, str],
+    city_code: str,
+    filters: Dict[str, Optional[str]],
+    community: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    列式缓存上的分组计数（含没有成交日期的记录，与列表一致）：
+    每个维度用位图索引求出其他维度筛选条件的交，再对命中行的编码 bincount
+    """
+    try:
+        columns = load_city_columns(data_dir, city_json_map, city_code)
+        if columns is None:
+            return build_facets(0, {})
+
+        index = columns.bitmap_index()
+        contains = {"community": community}
+
+        counts = {}
+        for dim in FACET_DIMENSIONS:
+            others = {other: value for other, value in filters.items() if other != dim}
+            codes = columns.codes[dim]
+            rows = index.query(others, contains)
+            if rows is not None:
+                codes = codes[rows.to_array()]
+            per_code = np.bincount(codes + 1, minlength=len(columns.names[dim]) + 1)[1:]
+            counts[dim] = zip(columns.names[dim], per_code.tolist())
+
+        rows = index.query(filters, contains)
+        total = len(columns) if rows is None else len(rows)
+        return build_facets(total, counts)
+    
+    except Exception as e:
+        _log_json_error(city_code, e)
+        return build_facets(0, {})
+
+
+def get_facets_from_db(
+    db_session,
+    Transaction,
+    city_code: str,
+    filters: Dict[str, Optional[str]],
+    community: Optional[str] = None
+) -> Dict[str, Any]:
+    """每个维度一条 GROUP BY，走 (city_code, 维度, ...) 复合索引"""
+    column_of = {
+        "region": Transaction.region_name,
+        "bizcircle": Transaction.bizcircle,
+        "layout": Transaction.layout,
+    }
+
+    def filtered(query, skip=None):
+        query = query.filter(Transaction.city_code == city_code)
+        if community:
+            query = query.filter(Transaction.community.contains(community))
+        for dim, value in filters.items():
+            if value and dim != skip:
+                query = query.filter(column_of[dim] == value)
+        return query
+
+    try:
+        counts = {}
+        for dim in FACET_DIMENSIONS:
+            column = column_of[dim]
+            rows = filtered(db_session.query(column, sa.func.count(Transaction.id)), skip=dim).filter(
+                column.isnot(None)
+            ).group_by(column).all()
+            counts[dim] = [(value, cnt) for value, cnt in rows]
+        total = filtered(db_session.query(sa.func.count(Transaction.id))).scalar() or 0
+        return build_facets(total, counts)
+    
+    except sa.exc.SQLAlchemyError as e:
+        _log_db_error(e)
+        return build_facets(0, {})
+
+
+def build_available_bizcircles_query(db_session, Transaction, city_code: str):
+    """商圈去重查询（未执行），走 (city_code, bizcircle, ...) 复合索引"""
+    return db_session.query(Transaction.bizcircle).filter(
+        sa.and_(
+            Transaction.city_code == city_code,
+            Transaction.bizcircle.isnot(None),
+            Transaction.bizcircle != ''
+        )
+    ).distinct().order_by(Transaction.bizcircle)
+
+
+def get_available_bizcircles_from_db(
+    db_session,
+    Transaction,
+    city_code: str
+) -> List[str]:
+    """从数据库获取指定城市的所有商圈列表"""
+    try:
+        rows = build_available_bizcircles_query(db_session, Transaction, city_code).all()
+        
+        return [r.bizcircle for r in rows if r.bizcircle]
+    
+    except sa.exc.SQLAlchemyError as e:
+        _log_db_error(e)
+        return []
+
+
+def get_available_bizcircles_from_json(
+    data_dir: Path,
+    city_json_map: Dict[str, str],
+    city_code: str
+) -> List[str]:
+    """从 JSON 文件获取指定城市的所有商圈列表"""
+    try:
+        columns = load_city_columns(data_dir, city_json_map, city_code)
+        if columns is None:
+            return []
+        
+        return sorted({name.strip() for name in columns.names["bizcircle"] if name.strip()})
+    
+    except Exception as e:
+        _log_json_error(city_code, e)
+        return []
+
+
+# === 可比成交：按商圈分区的 KD 树（见 comparables.py） ===
+def get_comps_index_from_json(
+    data_dir: Path,
+    city_json_map: Dict[str, str],
+    city_code: str
+) -> Optional[CompsIndex]:
+    """JSON 列式缓存 -> 可比成交索引（row_id 为文件下标，与列表 id 一致）；文件不存在或解析失败返回 None"""
+    try:
+        columns = load_city_columns(data_dir, city_json_map, city_code)
+        if columns is None:
+            return None
+        bizcircles = [None] + columns.names["bizcircle"]
+        layouts = [None] + columns.names["layout"]
+        return CompsIndex(
+            row_ids=np.arange(len(columns)),
+            bizcircles=[bizcircles[c + 1] for c in columns.codes["bizcircle"].tolist()],
+            layouts=[layouts[c + 1] for c in columns.codes["layout"].tolist()],
+            areas=columns.area,
+            unit_prices=columns.unit,
+            days=columns.day,
+        )
+    
+    except Exception as e:
+        _log_json_error(city_code, e)
+        return None
+
+
+def get_comps_index_from_db(db_session, Transaction, city_code: str) -> Optional[CompsIndex]:
+    """一次读出城市全部成交的特征列 -> 可比成交索引（row_id 为 transactions.id）"""
+    try:
+        rows = db_session.query(
+            Transaction.id,
+            Transaction.bizcircle,
+            Transaction.layout,
+            Transaction.area_sqm,
+            Transaction.unit_price_yuan_sqm,
+            Transaction.deal_date,
+        ).filter(Transaction.city_code == city_code).all()
+        return CompsIndex(
+            row_ids=[r[0] for r in rows],
+            bizcircles=[r[1] for r in rows],
+            layouts=[r[2] for r in rows],
+            areas=[_as_float(r[3], 0.0) for r in rows],
+            unit_prices=[_as_float(r[4], 0.0) for r in rows],
+            days=[r[5].toordinal() if r[5] else -1 for r in rows],
+        )
+    
+    except sa.exc.SQLAlchemyError as e:
+        _log_db_error(e)
+        return None
@@ -0,0 +1,287 @@
+"""
+按需采样剖析（线上请求的性能分析，不需要重启进程）
+- 默认关闭（HPQAQ_PROFILER=off）：不包装 WSGI 应用、不启动任何线程，没有开销
+- 开启后有两种用法，都只对持有管理令牌的请求开放（访问控制由 app.py 传入的 allowed(environ) 判断，只认 X-Admin-Token）：
+  1. 单个请求：带请求头 X-Profile: 1 或查询参数 _profile=1，该请求照常执行（包括流式响应体），
+     但响应内容换成这次请求的折叠栈（collapsed stack），原状态码放在 X-Profile-Status 响应头
+  2. 全进程：profile_session(seconds) 在 seconds 秒内对所有正在处理请求的线程做统计采样，
+     设置了 directory 时通过目录通知同一部署下的其他 worker 一起采样，最后合并各进程的结果
+- 折叠栈每行为 "根帧;...;叶帧 次数"，帧写作 "函数名 (文件名:函数首行)"，
+  可直接交给 flamegraph.pl 生成火焰图，或拖进 speedscope 查看
+- 采样线程每隔 interval 读一次 sys._current_frames()，只看正在处理请求的线程（空闲的线程池线程不计入）；
+  受 GIL 影响，CPU 密集时实际采样间隔会大于 interval
+"""
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional, Set
+
+from werkzeug.wsgi import ClosingIterator
+
+# 单个请求 / 全进程采样的默认间隔（秒）
+REQUEST_INTERVAL = 0.001
+SESSION_INTERVAL = 0.005
+
+# 全进程采样的最长秒数
+MAX_SESSION_SECONDS = 60
+
+ENABLED = False
+
+# 正在处理请求的线程（只在开启时由中间件维护）
+_ACTIVE_THREADS: Set[int] = set()
+
+_directory: Optional[Path] = None
+_watcher_pid = 0
+_session_lock = threading.Lock()
+
+# code 对象 -> 帧名
+_LABELS: Dict[object, str] = {}
+
+
+def _label(code) -> str:
+    label = _LABELS.get(code)
+    if label is None:
+        label = _LABELS[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    return label
+
+
+def _stack(frame) -> str:
+    labels = []
+    while frame is not None:
+        labels.append(_label(frame.f_code))
+        frame = frame.f_back
+    labels.reverse()
+    return ";".join(labels)
+
+
+class Sampler:
+    """
+    统计采样：后台线程每隔 interval 秒记录目标线程的调用栈
+    thread_ids 为 None 时采样所有正在处理请求的线程（exclude 中的除外）
+    """
+
+    def __init__(self, interval: float, thread_ids: Optional[Set[int]] = None, exclude: Iterable[int] = ()):
+        self.interval = interval
+        self.thread_ids = thread_ids
+        self.exclude = set(exclude)
+        self.counts: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="hpqaq-profiler", daemon=True)
+
+    def start(self) -> "Sampler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.counts
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            targets = self.thread_ids if self.thread_ids is not None else set(_ACTIVE_THREADS)
+            if not targets:
+                continue
+            frames = sys._current_frames()
+            self.samples += 1
+            for tid in targets:
+                frame = frames.get(tid)
+                if frame is not None and tid not in self.exclude:
+                    self.counts[_stack(frame)] += 1
+            del frames
+
+
+def collapsed(counts: Counter) -> str:
+    """Counter -> 折叠栈文本（按次数从多到少）"""
+    return "".join(f"{stack} {n}\n" for stack, n in counts.most_common())
+
+
+def parse_collapsed(text: str) -> Counter:
+    counts = Counter()
+    for line in text.splitlines():
+        stack, _, n = line.rpartition(" ")
+        if stack:
+            counts[stack] += int(n)
+    return counts
+
+
+# === 单个请求 ===
+def _wants_profile(environ) -> bool:
+    return environ.get("HTTP_X_PROFILE") == "1" or "_profile=1" in environ.get("QUERY_STRING", "").split("&")
+
+
+class ProfilerMiddleware:
+    """WSGI 中间件：记录正在处理请求的线程；带剖析标记的请求改为返回折叠栈"""
+
+    def __init__(self, wsgi_app: Callable, allowed: Callable[[dict], bool]):
+        self.wsgi_app = wsgi_app
+        self.allowed = allowed
+
+    def __call__(self, environ, start_response):
+        ensure_watcher()
+        tid = threading.get_ident()
+        if _wants_profile(environ):
+            if not self._allowed(environ):
+                start_response("403 FORBIDDEN", [("Content-Type", "application/json")])
+                return [b'{"error": "forbidden"}']
+            return self._profile_request(environ, start_response, tid)
+
+        _ACTIVE_THREADS.add(tid)
+        try:
+            body = self.wsgi_app(environ, start_response)
+        except BaseException:
+            _ACTIVE_THREADS.discard(tid)
+            raise
+        # 流式响应体在返回之后才被服务器迭代，迭代结束（close）时再移出
+        return ClosingIterator(body, lambda: _ACTIVE_THREADS.discard(tid))
+
+    def _allowed(self, environ) -> bool:
+        """访问控制判断不能抛异常：中间件在 Flask 的错误处理之外，异常会直接抛给 WSGI 服务器；出错一律按拒绝处理"""
+        try:
+            return bool(self.allowed(environ))
+        except Exception as e:
+            print(f"[profiler] access check failed: {e!r}")
+            return False
+
+    def _profile_request(self, environ, start_response, tid: int):
+        captured = {}
+
+        def capture(status, headers, exc_info=None):
+            captured["status"] = status
+            return lambda data: None
+
+        start = time.perf_counter()
+        sampler = Sampler(REQUEST_INTERVAL, thread_ids={tid}).start()
+        size = 0
+        try:
+            body = self.wsgi_app(environ, capture)
+            try:
+                for chunk in body:
+                    size += len(chunk)
+            finally:
+                if hasattr(body, "close"):
+                    body.close()
+        finally:
+            counts = sampler.stop()
+        elapsed = (time.perf_counter() - start) * 1000.0
+
+        start_response("200 OK", [
+            ("Content-Type", "text/plain; charset=utf-8"),
+            ("X-Profile-Status", captured.get("status", "")),
+            ("X-Profile-Samples", str(sampler.samples)),
+            ("X-Profile-Elapsed-Ms", f"{elapsed:.1f}"),
+            ("X-Profile-Response-Bytes", str(size)),
+        ])
+        return [collapsed(counts).encode("utf-8")]
+
+
+# === 全进程采样（多 worker 经目录协调） ===
+def _request_file() -> Path:
+    return _directory / "request.json"
+
+
+def ensure_watcher() -> None:
+    """本进程的监视线程：发现其他 worker 发起的采样时一起采样（每个进程首次调用时启动）"""
+    global _watcher_pid
+    if _directory is None or _watcher_pid == os.getpid():
+        return
+    _watcher_pid = os.getpid()
+    threading.Thread(target=_watch_loop, name="hpqaq-profile-watch", daemon=True).start()
+
+
+def _watch_loop(poll: float = 0.5) -> None:
+    pid = os.getpid()
+    seen = ""
+    mtime = 0.0
+    while _watcher_pid == pid:
+        time.sleep(poll)
+        try:
+            current = _request_file().stat().st_mtime
+            if current == mtime:
+                continue
+            mtime = current
+            req = json.loads(_request_file().read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            continue
+        remaining = req["start"] + req["seconds"] - time.time()
+        if req["session"] == seen or remaining <= 0 or req.get("origin") == pid:
+            continue
+        seen = req["session"]
+        sampler = Sampler(req["interval"]).start()
+        time.sleep(remaining)
+        _write_result(req["session"], sampler.stop())
+
+
+def _write_result(session: str, counts: Counter) -> None:
+    out = _directory / session
+    try:
+        out.mkdir(parents=True, exist_ok=True)
+        tmp = out / f"{os.getpid()}.tmp"
+        tmp.write_text(collapsed(counts), encoding="utf-8")
+        os.replace(tmp, out / f"{os.getpid()}.txt")
+    except OSError as e:
+        print(f"[profiler] write result failed: {e}")
+
+
+def profile_session(seconds: float, interval: float = SESSION_INTERVAL) -> Optional[Dict[str, object]]:
+    """
+    采样 seconds 秒，返回 {"processes": 参与的进程数, "collapsed": 合并后的折叠栈}；
+    已有采样在进行时返回 None。调用线程会阻塞 seconds 秒（多进程时再多等约 2 秒收集结果）
+    """
+    if not _session_lock.acquire(blocking=False):
+        return None
+    try:
+        session = uuid.uuid4().hex
+        if _directory is not None:
+            # 其他 worker 发起的采样还没结束
+            try:
+                req = json.loads(_request_file().read_text(encoding="utf-8"))
+                if req["start"] + req["seconds"] > time.time():
+                    return None
+            except (OSError, ValueError, KeyError):
+                pass
+            tmp = _request_file().with_suffix(".tmp")
+            tmp.write_text(json.dumps({
+                "session": session, "start": time.time(), "seconds": seconds,
+                "interval": interval, "origin": os.getpid(),
+            }), encoding="utf-8")
+            os.replace(tmp, _request_file())
+
+        sampler = Sampler(interval, exclude={threading.get_ident()}).start()
+        time.sleep(seconds)
+        counts = sampler.stop()
+        processes = 1
+        if _directory is not None:
+            # 其他 worker 的监视线程最多晚 0.5 秒开始，也就晚 0.5 秒写出结果
+            time.sleep(2.0)
+            out = _directory / session
+            for path in out.glob("*.txt") if out.exists() else ():
+                counts.update(parse_collapsed(path.read_text(encoding="utf-8")))
+                processes += 1
+            shutil.rmtree(out, ignore_errors=True)
+        return {"processes": processes, "collapsed": collapsed(counts)}
+    finally:
+        _session_lock.release()
+
+
+def init_app(app, enabled: bool = False, allowed: Callable[[dict], bool] = None,
+             directory: Optional[str] = None) -> None:
+    """
+    开启剖析：包装 app.wsgi_app；enabled=False 时什么也不做
+    directory 为多进程共享目录（gunicorn 下所有 worker 相同），为空时全进程采样只覆盖本进程
+    """
+    global ENABLED, _directory
+    if not enabled:
+        return
+    ENABLED = True
+    if directory:
+        _directory = Path(directory)
+        _directory.mkdir(parents=True, exist_ok=True)
+    app.wsgi_app = ProfilerMiddleware(app.wsgi_app, allowed or (lambda environ: False))
@@ -0,0 +1,110 @@
+"""
+可合并的分位数草图（DDSketch 思路：对数分桶，相对误差有界）
+- 正数 x 落在桶 i = ceil(log_γ(x))，γ = (1 + α) / (1 - α)；桶的估计值 2γ^i / (γ + 1)，相对误差不超过 α
+- 草图只有桶计数，合并 = 计数相加：商圈、区域、月份之间任意合并，不需要原始记录
+- x <= 0（缺失价格按 0 计入均价）单独计数，分位数落在这部分时返回 0
+"""
+import json
+import math
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(GAMMA)
+
+
+class QuantileSketch:
+    """连续桶区间 [offset, offset + len(counts)) 上的计数，外加 <= 0 的计数"""
+
+    __slots__ = ("offset", "counts", "zero_count")
+
+    def __init__(self, offset: int = 0, counts: Optional[np.ndarray] = None, zero_count: int = 0):
+        self.offset = offset
+        self.counts = np.zeros(0, dtype=np.int64) if counts is None else counts
+        self.zero_count = zero_count
+
+    @classmethod
+    def from_values(cls, values) -> "QuantileSketch":
+        values = np.asarray(values, dtype=np.float64)
+        positive = values[values > 0]
+        zero_count = int(len(values) - len(positive))
+        if not len(positive):
+            return cls(zero_count=zero_count)
+        index = np.ceil(np.log(positive) / _LOG_GAMMA).astype(np.int64)
+        offset = int(index.min())
+        return cls(offset, np.bincount(index - offset), zero_count)
+
+    @property
+    def count(self) -> int:
+        return int(self.counts.sum()) + self.zero_count
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        """把 other 合并进来（原地修改），返回 self"""
+        self.zero_count += other.zero_count
+        if not len(other.counts):
+            return self
+        if not len(self.counts):
+            self.offset, self.counts = other.offset, other.counts.copy()
+            return self
+        lo = min(self.offset, other.offset)
+        hi = max(self.offset + len(self.counts), other.offset + len(other.counts))
+        merged = np.zeros(hi - lo, dtype=np.int64)
+        merged[self.offset - lo:self.offset - lo + len(self.counts)] += self.counts
+        merged[other.offset - lo:other.offset - lo + len(other.counts)] += other.counts
+        self.offset, self.counts = lo, merged
+        return self
+
+    @classmethod
+    def merged(cls, sketches: Iterable["QuantileSketch"]) -> "QuantileSketch":
+        result = cls()
+        for sketch in sketches:
+            result.merge(sketch)
+        return result
+
+    def quantile(self, q: float) -> Optional[float]:
+        """q 分位数的估计值（0 <= q <= 1）；空草图返回 None"""
+        total = self.count
+        if not total:
+            return None
+        rank = q * (total - 1)
+        if rank < self.zero_count:
+            return 0.0
+        cumulative = np.cumsum(self.counts) + self.zero_count
+        i = int(np.searchsorted(cumulative, rank, side="right"))
+        return 2 * GAMMA ** (self.offset + i) / (GAMMA + 1)
+
+    def to_json(self) -> str:
+        """紧凑的文本形式，存入 SQLite / MySQL"""
+        return json.dumps([self.zero_count, self.offset, self.counts.tolist()], separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, text: str) -> "QuantileSketch":
+        zero_count, offset, counts = json.loads(text)
+        return cls(offset, np.asarray(counts, dtype=np.int64), zero_count)
+
+
+def group_sketches(group_ids, values) -> Dict[int, QuantileSketch]:
+    """按 group_ids 分组（一次稳定排序后切片），每组一个草图：{group_id: QuantileSketch}"""
+    group_ids = np.asarray(group_ids, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    if not len(group_ids):
+        return {}
+    order = np.argsort(group_ids, kind="stable")
+    ids = group_ids[order]
+    values = values[order]
+    bounds = np.flatnonzero(np.diff(ids)) + 1
+    starts = np.concatenate(([0], bounds))
+    ends = np.concatenate((bounds, [len(ids)]))
+    return {
+        int(ids[s]): QuantileSketch.from_values(values[s:e])
+        for s, e in zip(starts.tolist(), ends.tolist())
+    }
+
+
+def paired_group_sketches(group_ids, units, totals) -> Dict[int, Tuple[QuantileSketch, QuantileSketch]]:
+    """单价、总价两套草图：{group_id: (单价草图, 总价草图)}"""
+    unit_sketches = group_sketches(group_ids, units)
+    total_sketches = group_sketches(group_ids, totals)
+    return {gid: (unit_sketches[gid], total_sketches[gid]) for gid in unit_sketches}
@@ -0,0 +1,207 @@
+"""
+请求耗时埋点
+- span("名称") 计一段代码的耗时，同一请求内同名的多段累加；timed("名称") 是对应的函数装饰器
+- 响应带 Server-Timing 响应头（各 span + total），浏览器开发者工具的 Timing 面板可以直接查看
+- 每个接口保留最近 WINDOW 个请求的总耗时与各 span 耗时，每隔 log_interval 秒输出一行 JSON 日志：
+  [timing] {"endpoint": "/api/listings", "count": 本周期请求数, "p50": ..., "p95": ..., "p99": ..., "spans": {...}}
+- 关闭时不注册请求钩子，span() 直接返回共享的空上下文管理器，开销只有一次全局变量判断
+- 不在请求上下文中（预热线程、导入脚本）时 span 同样什么也不做
+- 开启时 SQLAlchemy 执行的每条 SQL、MiniSQL（SQLite 数据源）的每次查询自动计入 sql 段
+"""
+import functools
+import json
+import math
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, Optional
+
+from flask import Flask, g, has_request_context, request
+
+# 每个接口保留的最近样本数（分位数按这个窗口计算）
+WINDOW = 1024
+
+ENABLED = False
+_NULL_SPAN = nullcontext()
+
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self) -> "_Span":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc: Any) -> bool:
+        record(self.name, (time.perf_counter() - self.start) * 1000.0)
+        return False
+
+
+def span(name: str):
+    """with span("query"): ... —— 关闭或不在请求中时为空操作"""
+    if not ENABLED or not has_request_context():
+        return _NULL_SPAN
+    return _Span(name)
+
+
+def timed(name: str) -> Callable:
+    """把整个函数计为一个 span（调用时才判断是否开启，模块导入早于 init_app 也没关系）"""
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record(name: str, ms: float) -> None:
+    """把 ms 毫秒记到当前请求的 span name 上"""
+    if not ENABLED or not has_request_context():
+        return
+    spans = g.get("timing_spans")
+    if spans is None:
+        spans = g.timing_spans = {}
+    spans[name] = spans.get(name, 0.0) + ms
+
+
+# 开始时间记在本次执行的 context 上，随语句一起释放；出错的语句不触发 after_cursor_execute，不能记在连接上
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    if context is not None:
+        context._timing_sql_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    start = getattr(context, "_timing_sql_start", None)
+    if start is not None:
+        record("sql", (time.perf_counter() - start) * 1000.0)
+
+
+# === 按接口的分位数统计 ===
+class _EndpointStats:
+    __slots__ = ("totals", "spans", "count")
+
+    def __init__(self):
+        self.totals = deque(maxlen=WINDOW)
+        self.spans: Dict[str, deque] = {}
+        self.count = 0  # 上次输出日志以来的请求数
+
+
+_STATS: Dict[str, _EndpointStats] = {}
+_LOCK = threading.Lock()
+_log_interval = 60.0
+_next_log = 0.0
+
+
+def percentile(sorted_values, p: float) -> float:
+    """最近秩法分位数（sorted_values 已升序且非空）"""
+    idx = max(int(math.ceil(p / 100.0 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(idx, len(sorted_values) - 1)]
+
+
+def _summary(values) -> Dict[str, float]:
+    ordered = sorted(values)
+    return {f"p{p}": round(percentile(ordered, p), 2) for p in (50, 95, 99)}
+
+
+def snapshot() -> Dict[str, Dict[str, Any]]:
+    """各接口最近窗口内的 p50 / p95 / p99（总耗时与各 span），单位毫秒"""
+    with _LOCK:
+        items = [(endpoint, list(s.totals), {k: list(v) for k, v in s.spans.items()}) for endpoint, s in _STATS.items()]
+    return {
+        endpoint: dict(_summary(totals), samples=len(totals), spans={k: _summary(v) for k, v in spans.items()})
+        for endpoint, totals, spans in items if totals
+    }
+
+
+def _flush_log(now: float) -> None:
+    global _next_log
+    with _LOCK:
+        if now < _next_log:
+            return
+        _next_log = now + _log_interval
+        active = [(endpoint, s.count) for endpoint, s in _STATS.items() if s.count]
+        for s in _STATS.values():
+            s.count = 0
+    stats = snapshot()
+    for endpoint, count in active:
+        line = dict(endpoint=endpoint, count=count, **stats[endpoint])
+        print("[timing] " + json.dumps(line, ensure_ascii=False))
+
+
+def _start_timer() -> None:
+    g.timing_start = time.perf_counter()
+
+
+def _finish_timer(response):
+    start = g.get("timing_start")
+    if start is None:
+        return response
+    now = time.perf_counter()
+    total = (now - start) * 1000.0
+    spans = g.get("timing_spans") or {}
+
+    parts = [f"{name};dur={ms:.2f}" for name, ms in spans.items()]
+    parts.append(f"total;dur={total:.2f}")
+    response.headers.add("Server-Timing", ", ".join(parts))
+
+    endpoint = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+    with _LOCK:
+        stats = _STATS.get(endpoint)
+        if stats is None:
+            stats = _STATS[endpoint] = _EndpointStats()
+        stats.totals.append(total)
+        stats.count += 1
+        for name, ms in spans.items():
+            samples = stats.spans.get(name)
+            if samples is None:
+                samples = stats.spans[name] = deque(maxlen=WINDOW)
+            samples.append(ms)
+    if _log_interval > 0 and now >= _next_log:
+        _flush_log(now)
+    return response
+
+
+def init_app(app: Flask, enabled: bool = True, log_interval: Optional[float] = 60.0) -> None:
+    """
+    开启埋点并注册请求钩子；enabled=False 时什么也不注册
+    log_interval 为分位数日志的输出间隔（秒），0 / None 表示不输出日志（Server-Timing 头照常返回）
+    """
+    global ENABLED, _log_interval, _next_log
+    ENABLED = bool(enabled)
+    if not ENABLED:
+        return
+    _log_interval = float(log_interval or 0)
+    _next_log = time.perf_counter() + _log_interval
+    app.before_request(_start_timer)
+    app.after_request(_finish_timer)
+
+
+def listen_sql() -> None:
+    """
+    开启埋点时为 SQLAlchemy 注册 sql 段计时；由 app.init_db 在启用数据库时调用，
+    纯 JSON / SQLite 部署不调用，也就不会为此导入 SQLAlchemy
+    """
+    if not ENABLED:
+        return
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def listen_minisql() -> None:
+    """开启埋点时为 MiniSQL 注册 sql 段计时钩子；minisql 不依赖应用层模块，由 create_app 在这里接上"""
+    if not ENABLED:
+        return
+    import minisql
+
+    minisql.set_query_hook(functools.partial(span, "sql"))
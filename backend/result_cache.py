@@ -0,0 +1,115 @@
+"""
+统计查询结果缓存（进程内 LRU）
+- 键 = 归一化后的查询参数 + 数据版本号；数据一变版本号就变，旧结果自然失效并被 LRU 淘汰
+- 数据版本号：
+  - JSON / SQLite：数据文件的 mtime + 大小
+  - MySQL：data/.mysql_version 文件的 mtime + 大小，由 import_data.py 导入完成后更新
+- 记录 hit / miss / eviction 次数，供 /api/cache_stats 查看；设置 on_event 后每次事件另外回调（如上报 /metrics）
+"""
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class LRUCache:
+    """带容量上限的线程安全 LRU；maxsize <= 0 时不缓存（只计 miss）"""
+
+    def __init__(self, maxsize: int = 512):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # 事件回调 on_event("hit" / "miss" / "eviction")，在锁外调用
+        self.on_event: Optional[Callable[[str], None]] = None
+
+    def lookup(self, key: Hashable) -> Tuple[bool, Any]:
+        """返回 (是否命中, 值)，同时计入 hit / miss"""
+        with self._lock:
+            found = key in self._data
+            if found:
+                self._data.move_to_end(key)
+                self.hits += 1
+                value = self._data[key]
+            else:
+                self.misses += 1
+                value = None
+        if self.on_event is not None:
+            self.on_event("hit" if found else "miss")
+        return found, value
+
+    def store(self, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        evicted = 0
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+                evicted += 1
+        if evicted and self.on_event is not None:
+            for _ in range(evicted):
+                self.on_event("eviction")
+
+    def get_or_compute(
+        self,
+        key: Hashable,
+        compute: Callable[[], Any],
+        cache_if: Optional[Callable[[Any], bool]] = None,
+    ) -> Any:
+        """命中直接返回；否则调用 compute()，cache_if(value) 为 False 时不写入缓存"""
+        found, value = self.lookup(key)
+        if found:
+            return value
+
+        # 计算过程不持锁，慢查询不会阻塞其他键；同一键并发 miss 时各算一次，结果一致
+        value = compute()
+        if cache_if is None or cache_if(value):
+            self.store(key, value)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+def file_token(path: Path) -> str:
+    """文件版本号：mtime_ns + size；文件不存在返回 "missing" """
+    try:
+        st = Path(path).stat()
+    except OSError:
+        return "missing"
+    return f"{st.st_mtime_ns}:{st.st_size}"
+
+
+def bump_version_file(path: Path) -> None:
+    """更新版本文件（导入数据后调用），所有进程的缓存随之失效"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(f"{time.time_ns()}\n", encoding="utf-8")
+
+
+def normalize_month(value: str) -> str:
+    """"2024-3" / "2024-03" -> "2024-03"；格式不对原样返回（交给后续校验）"""
+    try:
+        year, month = value.strip().split("-")[:2]
+        return f"{int(year):04d}-{int(month):02d}"
+    except (AttributeError, ValueError):
+        return value
@@ -0,0 +1,184 @@
+"""
+慢查询日志
+- SQLAlchemy 执行的每条 SQL 计时（before / after_cursor_execute），超过阈值的输出一行日志，带绑定参数（过长截断）：
+  [slow_query] 812.3 ms fp=3f2a9c1e0b7d /api/listings SELECT ... params=('sz', ...)
+- 语句按"形状"归类：空白归一，连续的占位符列表 IN (%s, %s, ...) 折叠为 (...)，取哈希作为指纹；
+  ORM 生成的 SQL 参数都是占位符，同一段查询代码无论参数取值如何都是同一个形状
+- 每种形状第一次变慢时，在另一条连接上用同样的参数执行一次 EXPLAIN（SQLite 为 EXPLAIN QUERY PLAN），
+  执行计划与语句一起保存；同形状之后再变慢不再重复 EXPLAIN
+- 每种形状保留最近 SAMPLES_PER_SHAPE 次慢查询，report() 给出最近 window 秒内按总耗时排序的前 N 种
+- 关闭时不注册事件监听，没有任何开销
+- 统计只在本进程内；gunicorn 多 worker 时每个 worker 各有一份
+"""
+import hashlib
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from flask import has_request_context, request
+
+import metrics
+
+# 每种形状保留的慢查询样本数 / 最多跟踪的形状数（超出时丢掉最久没再出现的形状）
+SAMPLES_PER_SHAPE = 256
+MAX_SHAPES = 500
+
+# 日志与报告中参数 repr 的最大长度
+PARAMS_MAX_CHARS = 500
+
+ENABLED = False
+THRESHOLD_MS = 200.0
+EXPLAIN = True
+
+SLOW_QUERIES = metrics.Counter("hpqaq_slow_queries_total", "超过阈值的 SQL 语句数", ())
+
+_PLACEHOLDER_LIST = re.compile(r"\(\s*(?:%s|\?|:\w+)(?:\s*,\s*(?:%s|\?|:\w+))+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    """SQL 文本 -> 形状：空白归一，占位符列表折叠为 (...)"""
+    shape = _WHITESPACE.sub(" ", statement.strip())
+    return _PLACEHOLDER_LIST.sub("(...)", shape)
+
+
+def fingerprint(shape: str) -> str:
+    return hashlib.sha1(shape.encode("utf-8")).hexdigest()[:12]
+
+
+def _short_repr(value: Any) -> str:
+    text = repr(value)
+    if len(text) > PARAMS_MAX_CHARS:
+        text = text[:PARAMS_MAX_CHARS] + "...(truncated)"
+    return text
+
+
+class _Shape:
+    __slots__ = ("statement", "samples", "endpoints", "last_params", "explain", "explain_error")
+
+    def __init__(self, statement: str):
+        self.statement = statement
+        self.samples = deque(maxlen=SAMPLES_PER_SHAPE)  # (时间戳, 毫秒)
+        self.endpoints = set()
+        self.last_params = ""
+        self.explain: Optional[List[Dict[str, Any]]] = None
+        self.explain_error: Optional[str] = None
+
+
+_SHAPES: Dict[str, _Shape] = {}
+_LOCK = threading.Lock()
+
+
+# 开始时间记在本次执行的 context 上：语句出错时 after_cursor_execute 不会触发，
+# 记在 conn.info（随连接池里的连接一直存在）上的话每次出错都会留下一条
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    if context is not None:
+        context._slow_query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    start = getattr(context, "_slow_query_start", None)
+    if start is None:
+        return
+    ms = (time.perf_counter() - start) * 1000.0
+    # 自己发出的 EXPLAIN 不再计入
+    if ms >= THRESHOLD_MS and not statement.lstrip()[:7].upper() == "EXPLAIN":
+        record(conn.engine, statement, parameters, ms, executemany)
+
+
+def record(engine, statement: str, parameters: Any, ms: float, executemany: bool = False) -> None:
+    """记一条慢查询；该形状第一次出现时顺带 EXPLAIN"""
+    shape = statement_shape(statement)
+    fp = fingerprint(shape)
+    endpoint = request.url_rule.rule if has_request_context() and request.url_rule is not None else "-"
+    params = _short_repr(parameters)
+    SLOW_QUERIES.inc()
+    print(f"[slow_query] {ms:.1f} ms fp={fp} {endpoint} {shape} params={params}")
+
+    with _LOCK:
+        entry = _SHAPES.get(fp)
+        first = entry is None
+        if first:
+            if len(_SHAPES) >= MAX_SHAPES:
+                oldest = min(_SHAPES, key=lambda k: _SHAPES[k].samples[-1][0])
+                del _SHAPES[oldest]
+            entry = _SHAPES[fp] = _Shape(shape)
+        entry.samples.append((time.time(), ms))
+        entry.endpoints.add(endpoint)
+        entry.last_params = params
+
+    # 只有第一次记录该形状的线程执行 EXPLAIN；批量写入（executemany）与非 SELECT 语句不做
+    if first and EXPLAIN and not executemany and shape[:6].upper() == "SELECT":
+        _capture_explain(engine, fp, entry, statement, parameters)
+
+
+def _capture_explain(engine, fp: str, entry: _Shape, statement: str, parameters: Any) -> None:
+    # 用另一条连接：当前连接上可能还有没读完的流式结果（/api/export 的服务端游标）
+    prefix = "EXPLAIN QUERY PLAN " if engine.dialect.name == "sqlite" else "EXPLAIN "
+    try:
+        with engine.connect() as conn:
+            result = conn.exec_driver_sql(prefix + statement, parameters)
+            entry.explain = [dict(row._mapping) for row in result]
+    except Exception as e:
+        entry.explain_error = str(e)
+        print(f"[slow_query] EXPLAIN failed for fp={fp}: {e}")
+
+
+def report(top: int = 20, window: float = 3600.0) -> List[Dict[str, Any]]:
+    """最近 window 秒内按总耗时排序的前 top 种形状（耗时单位毫秒）"""
+    since = time.time() - window
+    rows = []
+    with _LOCK:
+        for fp, entry in _SHAPES.items():
+            recent = [ms for ts, ms in entry.samples if ts >= since]
+            if not recent:
+                continue
+            total = sum(recent)
+            rows.append({
+                "fingerprint": fp,
+                "count": len(recent),
+                "total_ms": round(total, 1),
+                "avg_ms": round(total / len(recent), 1),
+                "max_ms": round(max(recent), 1),
+                "last_seen": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry.samples[-1][0])),
+                "endpoints": sorted(entry.endpoints),
+                "statement": entry.statement,
+                "last_params": entry.last_params,
+                "explain": entry.explain,
+                "explain_error": entry.explain_error,
+            })
+    rows.sort(key=lambda r: r["total_ms"], reverse=True)
+    return rows[:top]
+
+
+def clear() -> None:
+    """清空已记录的形状（下次变慢时会重新 EXPLAIN）"""
+    with _LOCK:
+        _SHAPES.clear()
+
+
+def init_app(threshold_ms: Optional[float] = 200.0, explain: bool = True) -> None:
+    """
+    开启慢查询日志（SQL 监听由 listen_sql 注册）；threshold_ms 为 None 时保持关闭
+    explain=False 时只记日志与统计，不执行 EXPLAIN
+    """
+    global ENABLED, THRESHOLD_MS, EXPLAIN
+    if threshold_ms is None:
+        return
+    ENABLED = True
+    THRESHOLD_MS = float(threshold_ms)
+    EXPLAIN = bool(explain)
+
+
+def listen_sql() -> None:
+    """开启时为 SQLAlchemy 注册计时监听；由 app.init_db 在启用数据库时调用（同 request_timing.listen_sql）"""
+    if not ENABLED:
+        return
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
@@ -0,0 +1,777 @@
+"""
+SQLite 数据源（基于 MiniSQL）
+没有 MySQL 的机器上，用每个城市一个 SQLite 文件代替 JSON 全量扫描：
+- 文件：backend/minisql_<city>.db，表：<简称>_crawl_history（与 minisql_shanghai.db 一致）
+- 列表、走势、历史均价、商圈列表都走带复合索引的 SQL
+- 每条记录保留它在 JSON 数组中的下标（src_index 列）作为列表 id，重复 house_id、非 dict 的记录也都保留，
+  列表 id、游标、可比成交的行号与 JSON 回退一致
+- 生成时一并写入 (区域, 商圈, 月) 的分位数草图表、分布直方图表，以及 (区域, 商圈, 户型, 月) 的聚合立方体表，
+  查询时只合并格子
+- 输出结构与 JSON 回退完全一致，前端无需区分
+
+从 data/crawl_history_*.json 生成 / 重建数据库文件：
+    cd backend
+    python sqlite_source.py              # data/ 下所有城市
+    python sqlite_source.py shenzhen     # 只处理指定城市
+    HPQAQ_DATA_DIR=/tmp/hpqaq-data python sqlite_source.py syn1m   # 读取其他目录（与服务的 HPQAQ_DATA_DIR 相同）
+"""
+import json
+import os
+import re
+import sqlite3
+import sys
+from datetime import date
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from aggregate_cube import CELL_FIELDS, CubeCells
+from comparables import CompsIndex
+from minisql import MiniSQL
+from quantile_sketch import QuantileSketch
+import price_stats
+
+BACKEND_DIR = Path(__file__).resolve().parent
+SQLITE_DIR = Path(os.environ.get("HPQAQ_SQLITE_DIR", BACKEND_DIR))
+# 城市 JSON 所在目录，与 app.py 一致（HPQAQ_DATA_DIR 可指向 synthetic_data.py 生成的目录）
+DATA_DIR = Path(os.environ.get("HPQAQ_DATA_DIR") or BACKEND_DIR.parent / "data")
+
+# 与 import_data.py 的城市简称保持一致，其余城市直接用城市代码
+CITY_SHORT_CODES = {
+    "beijing": "bj",
+    "shanghai": "sh",
+    "guangzhou": "gz",
+    "shenzhen": "sz",
+    "tianjin": "tj",
+}
+
+LISTING_COLUMNS = (
+    "house_id",
+    "region",
+    "bizcircle",
+    "community",
+    "layout",
+    "area_sqm",
+    "total_price_wan",
+    "unit_price_yuan_sqm",
+    "deal_date",
+    "detail_url",
+    "orientation",
+    "building_year",
+    "floor",
+)
+
+
+def city_db_path(city_code: str) -> Path:
+    return SQLITE_DIR / f"minisql_{city_code}.db"
+
+
+def city_table_name(city_code: str) -> str:
+    return f"{CITY_SHORT_CODES.get(city_code, city_code)}_crawl_history"
+
+
+def sketch_table_name(table: str) -> str:
+    """(区域, 商圈, 月) 分位数草图表，与成交表放在同一个文件里"""
+    return f"{table}_month_sketch"
+
+
+def histogram_table_name(table: str) -> str:
+    """(区域, 商圈, 月) 分布直方图计数表"""
+    return f"{table}_month_hist"
+
+
+def cube_table_name(table: str) -> str:
+    """(区域, 商圈, 户型, 月) 聚合立方体格子表"""
+    return f"{table}_month_cube"
+
+
+def _schema_sql(table: str) -> List[str]:
+    """
+    建表 + 索引语句。deal_date 统一存 YYYY-MM-DD（解析失败存 NULL），字符串比较即日期比较
+    src_index 为记录在 JSON 数组中的下标（INTEGER PRIMARY KEY，即 rowid），也就是对外的列表 id，
+    与 JSON 回退、列式缓存的行号一致；house_id 不设唯一约束，重复或缺失的记录照样保留
+    """
+    return [
+        f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+          src_index INTEGER PRIMARY KEY,
+          house_id TEXT,
+          region TEXT,
+          bizcircle TEXT,
+          community TEXT,
+          detail_url TEXT,
+          total_price_wan REAL,
+          unit_price_yuan_sqm INTEGER,
+          layout TEXT,
+          room_count INTEGER,
+          hall_count INTEGER,
+          area_sqm REAL,
+          orientation TEXT,
+          building_year INTEGER,
+          floor TEXT,
+          deal_date TEXT,
+          crawl_time TEXT,
+          raw_json TEXT
+        )
+        """,
+        # 列表：等值过滤 + deal_date 倒序（索引隐含 rowid 即 src_index，正好是 (deal_date, id) 的顺序）
+        f"CREATE INDEX IF NOT EXISTS idx_{table}_deal_date ON {table}(deal_date)",
+        f"CREATE INDEX IF NOT EXISTS idx_{table}_region_date ON {table}(region, deal_date)",
+        f"CREATE INDEX IF NOT EXISTS idx_{table}_bizcircle_date ON {table}(bizcircle, deal_date)",
+        f"CREATE INDEX IF NOT EXISTS idx_{table}_community ON {table}(community)",
+        f"CREATE INDEX IF NOT EXISTS idx_{table}_layout ON {table}(layout)",
+        # 聚合：带上单价 / 总价，只扫索引
+        f"CREATE INDEX IF NOT EXISTS idx_{table}_agg_date "
+        f"ON {table}(deal_date, unit_price_yuan_sqm, total_price_wan)",
+        f"CREATE INDEX IF NOT EXISTS idx_{table}_agg_region "
+        f"ON {table}(region, deal_date, unit_price_yuan_sqm, total_price_wan)",
+        f"CREATE INDEX IF NOT EXISTS idx_{table}_agg_bizcircle "
+        f"ON {table}(bizcircle, deal_date, unit_price_yuan_sqm, total_price_wan)",
+        f"""
+        CREATE TABLE IF NOT EXISTS {sketch_table_name(table)} (
+          region TEXT,
+          bizcircle TEXT,
+          year_month TEXT,
+          count INTEGER,
+          unit_sketch TEXT,
+          total_sketch TEXT
+        )
+        """,
+        f"CREATE INDEX IF NOT EXISTS idx_{sketch_table_name(table)}_month "
+        f"ON {sketch_table_name(table)}(year_month)",
+        f"""
+        CREATE TABLE IF NOT EXISTS {histogram_table_name(table)} (
+          region TEXT,
+          bizcircle TEXT,
+          year_month TEXT,
+          metric TEXT,
+          counts TEXT
+        )
+        """,
+        f"CREATE INDEX IF NOT EXISTS idx_{histogram_table_name(table)}_metric_month "
+        f"ON {histogram_table_name(table)}(metric, year_month)",
+        f"""
+        CREATE TABLE IF NOT EXISTS {cube_table_name(table)} (
+          region TEXT,
+          bizcircle TEXT,
+          layout TEXT,
+          year_month TEXT,
+          count INTEGER,
+          unit_sum REAL,
+          total_sum REAL,
+          unit_min REAL,
+          unit_max REAL,
+          total_min REAL,
+          total_max REAL
+        )
+        """,
+    ]
+
+
+# 走势的周期表达式（deal_date 为 YYYY-MM-DD）；周 / 季度为与 price_stats.period_label 对应的序号，
+# julianday('0001-01-01') = 1721425.5，与 date.toordinal() 的起点一致
+_PERIOD_SQL = {
+    "week": "CAST((julianday(deal_date) - 1721425.5) / 7 AS INTEGER)",
+    "month": "substr(deal_date, 1, 7)",
+    "quarter": "CAST(substr(deal_date, 1, 4) AS INTEGER) * 4 + (CAST(substr(deal_date, 6, 2) AS INTEGER) - 1) / 3",
+}
+
+
+def _listing_where(
+    region: Optional[str] = None,
+    bizcircle: Optional[str] = None,
+    community: Optional[str] = None,
+    layout: Optional[str] = None,
+    date_lo: Optional[date] = None,
+    date_hi: Optional[date] = None,
+) -> Tuple[List[str], List]:
+    """列表 / 导出的筛选条件 -> (WHERE 子句列表, 参数)；date_lo <= deal_date < date_hi"""
+    where, params = ["1 = 1"], []
+    if region:
+        where.append("region = ?")
+        params.append(region)
+    if bizcircle:
+        where.append("bizcircle = ?")
+        params.append(bizcircle)
+    if community:
+        where.append("instr(community, ?) > 0")
+        params.append(community)
+    if layout:
+        where.append("layout = ?")
+        params.append(layout)
+    if date_lo:
+        where.append("deal_date >= ?")
+        params.append(date_lo.isoformat())
+    if date_hi:
+        where.append("deal_date < ?")
+        params.append(date_hi.isoformat())
+    return where, params
+
+
+class SQLiteCitySource:
+    """单个城市的 SQLite 数据源"""
+
+    def __init__(self, city_code: str, db_path: Path, table: str):
+        self.city_code = city_code
+        self.db_path = db_path
+        self.table = table
+        self.sql = MiniSQL(str(db_path))
+        self.sketch_table = sketch_table_name(table)
+        self.histogram_table = histogram_table_name(table)
+        self.cube_table = cube_table_name(table)
+
+    # --- 列表 ---
+    def listings(
+        self,
+        region: Optional[str] = None,
+        bizcircle: Optional[str] = None,
+        community: Optional[str] = None,
+        layout: Optional[str] = None,
+        date_lo: Optional[date] = None,
+        date_hi: Optional[date] = None,
+        page: int = 1,
+        page_size: int = 20,
+        cursor: Optional[Tuple] = None,
+        with_total: bool = True,
+    ) -> Tuple[List[Dict], Optional[int], bool, Optional[Tuple]]:
+        """
+        返回 (items, total, has_more, last_key)
+        last_key 为本页最后一条的 (deal_date, id)，用于生成 next_cursor
+        """
+        where, params = _listing_where(region, bizcircle, community, layout, date_lo, date_hi)
+
+        total = None
+        if with_total:
+            row = self.sql.query_one(
+                f"SELECT COUNT(*) AS n FROM {self.table} WHERE {' AND '.join(where)}", params
+            )
+            total = row["n"] if row else 0
+
+        # 对外的 id 为 src_index，与 JSON 回退的记录下标一致，两种数据源的游标可以互用
+        offset = 0
+        if cursor:
+            d_obj, row_id = cursor
+            if d_obj is None:
+                where.append("deal_date IS NULL AND src_index < ?")
+                params.append(row_id)
+            else:
+                d = d_obj.isoformat()
+                where.append("(deal_date < ? OR (deal_date = ? AND src_index < ?) OR deal_date IS NULL)")
+                params += [d, d, row_id]
+        else:
+            offset = (page - 1) * page_size
+
+        rows = self.sql.query_all(
+            f"SELECT src_index AS _row_id, {', '.join(LISTING_COLUMNS)} FROM {self.table} "
+            f"WHERE {' AND '.join(where)} "
+            f"ORDER BY deal_date DESC, src_index DESC LIMIT ? OFFSET ?",
+            params + [page_size + 1, offset],
+        )
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+
+        last_key = None
+        if has_more:
+            last = rows[-1]
+            d = last["deal_date"]
+            last_key = (price_stats._parse_date_any(d) if d else None, last["_row_id"])
+
+        for r in rows:
+            r.pop("_row_id", None)
+        return rows, total, has_more, last_key
+
+    # --- 导出 ---
+    def iter_listings(self, **filters) -> Iterator[Dict]:
+        """按 src_index（文件顺序）逐批读出满足筛选条件的全部记录，筛选参数同 listings"""
+        where, params = _listing_where(**filters)
+        return self.sql.iter_query(
+            f"SELECT {', '.join(LISTING_COLUMNS)} FROM {self.table} "
+            f"WHERE {' AND '.join(where)} ORDER BY src_index",
+            params,
+        )
+
+    # --- 月度走势 ---
+    @staticmethod
+    def _trend_where(region: Optional[str], bizcircle: Optional[str]) -> Tuple[List[str], List]:
+        """走势的筛选条件：只统计有成交日期的记录"""
+        where, params = ["deal_date IS NOT NULL"], []
+        if region:
+            where.append("region = ?")
+            params.append(region)
+        if bizcircle:
+            where.append("bizcircle = ?")
+            params.append(bizcircle)
+        return where, params
+
+    def trend_span(
+        self,
+        region: Optional[str] = None,
+        bizcircle: Optional[str] = None,
+    ) -> Optional[Tuple[int, int]]:
+        """走势覆盖的 (最早, 最晚) 成交日序号，没有带日期的记录返回 None"""
+        where, params = self._trend_where(region, bizcircle)
+        row = self.sql.query_one(
+            f"SELECT MIN(deal_date) AS first, MAX(deal_date) AS last FROM {self.table} "
+            f"WHERE {' AND '.join(where)}",
+            params,
+        )
+        if row is None or row["first"] is None:
+            return None
+        return date.fromisoformat(row["first"]).toordinal(), date.fromisoformat(row["last"]).toordinal()
+
+    def price_trend(
+        self,
+        region: Optional[str] = None,
+        bizcircle: Optional[str] = None,
+        resolution: str = "month",
+    ):
+        """返回 [(周期标签, avg_unit, avg_total, count), ...]，与 JSON 回退的取整方式一致"""
+        where, params = self._trend_where(region, bizcircle)
+        rows = self.sql.query_all(
+            f"SELECT {_PERIOD_SQL[resolution]} AS period, "
+            f"SUM(unit_price_yuan_sqm) AS sum_unit, SUM(total_price_wan) AS sum_total, "
+            f"COUNT(*) AS count FROM {self.table} "
+            f"WHERE {' AND '.join(where)} GROUP BY period ORDER BY period",
+            params,
+        )
+        return [
+            (
+                r["period"] if resolution == "month" else price_stats.period_label(resolution, r["period"]),
+                int((r["sum_unit"] or 0) / r["count"]),
+                round((r["sum_total"] or 0.0) / r["count"], 2),
+                r["count"],
+            )
+            for r in rows
+        ]
+
+    # --- 历史均价 ---
+    def historical_avg_price(
+        self,
+        bizcircle: Optional[str] = None,
+        start_month: str = "2023-01",
+        end_month: str = "2025-12",
+        shape: str = "rows",
+    ):
+        bizcircle = bizcircle or None
+        return self.historical_avg_price_batch([bizcircle], start_month, end_month, shape)[bizcircle]
+
+    def historical_avg_price_batch(
+        self,
+        bizcircles,
+        start_month: str = "2023-01",
+        end_month: str = "2025-12",
+        shape: str = "rows",
+    ) -> Dict[Optional[str], object]:
+        """
+        多个商圈的月度均价：一条 GROUP BY bizcircle, year_month 的 SQL
+        bizcircles 中的 None 表示全城（单独一条按月分组的 SQL）
+        """
+        wanted = {b or None for b in bizcircles}
+        start_date, end_date = price_stats.month_range(start_month, end_month)
+        date_params = [start_date.isoformat(), end_date.isoformat()]
+        per_biz: Dict[Optional[str], List[tuple]] = {b: [] for b in wanted}
+
+        queries = []
+        if None in wanted:
+            queries.append(("NULL", "", []))
+        names = sorted(b for b in wanted if b)
+        if names:
+            queries.append((
+                "bizcircle",
+                f"AND bizcircle IN ({', '.join('?' * len(names))})",
+                names,
+            ))
+
+        for biz_expr, biz_where, biz_params in queries:
+            rows = self.sql.query_all(
+                f"SELECT {biz_expr} AS biz, substr(deal_date, 1, 7) AS year_month, "
+                f"SUM(unit_price_yuan_sqm) AS sum_unit, SUM(total_price_wan) AS sum_total, "
+                f"COUNT(*) AS count FROM {self.table} "
+                f"WHERE deal_date >= ? AND deal_date < ? {biz_where} "
+                f"GROUP BY biz, year_month ORDER BY biz, year_month",
+                date_params + biz_params,
+            )
+            for r in rows:
+                year, month = (int(x) for x in r["year_month"].split("-"))
+                per_biz[r["biz"]].append((
+                    year,
+                    month,
+                    r["year_month"],
+                    int((r["sum_unit"] or 0) / r["count"]),
+                    round((r["sum_total"] or 0.0) / r["count"], 2),
+                    r["count"],
+                ))
+
+        return {
+            b: price_stats.rows_or_columns(price_stats.HISTORICAL_FIELDS, records, shape)
+            for b, records in per_biz.items()
+        }
+
+    # --- 分位数草图 ---
+    def month_sketches(
+        self,
+        region: Optional[str] = None,
+        bizcircle: Optional[str] = None,
+        start_month: Optional[str] = None,
+        end_month: Optional[str] = None,
+    ):
+        """读出符合条件的格子草图并按月合并；旧版本生成的文件没有草图表时返回 {}"""
+        where, params = ["1 = 1"], []
+        if region:
+            where.append("region = ?")
+            params.append(region)
+        if bizcircle:
+            where.append("bizcircle = ?")
+            params.append(bizcircle)
+        if start_month:
+            where.append("year_month >= ?")
+            params.append(start_month)
+        if end_month:
+            where.append("year_month <= ?")
+            params.append(end_month)
+
+        try:
+            rows = self.sql.query_all(
+                f"SELECT region, bizcircle, year_month, unit_sketch, total_sketch "
+                f"FROM {self.sketch_table} WHERE {' AND '.join(where)}",
+                params,
+            )
+        except sqlite3.OperationalError as e:
+            print(f"[sqlite_source] {self.db_path.name}: {e} (rebuild with sqlite_source.py)")
+            return {}
+        return price_stats.merge_month_sketches(
+            (r["region"], r["bizcircle"], r["year_month"],
+             QuantileSketch.from_json(r["unit_sketch"]), QuantileSketch.from_json(r["total_sketch"]))
+            for r in rows
+        )
+
+    # --- 分布直方图 ---
+    def price_histogram(
+        self,
+        metric: str = "unit_price_yuan_sqm",
+        region: Optional[str] = None,
+        bizcircle: Optional[str] = None,
+        start_month: Optional[str] = None,
+        end_month: Optional[str] = None,
+    ):
+        """区间内格子分箱计数之和；旧版本生成的文件没有直方图表时返回全 0 向量"""
+        where, params = ["metric = ?"], [metric]
+        if region:
+            where.append("region = ?")
+            params.append(region)
+        if bizcircle:
+            where.append("bizcircle = ?")
+            params.append(bizcircle)
+        if start_month:
+            where.append("year_month >= ?")
+            params.append(start_month)
+        if end_month:
+            where.append("year_month <= ?")
+            params.append(end_month)
+
+        try:
+            rows = self.sql.query_all(
+                f"SELECT region, bizcircle, year_month, counts "
+                f"FROM {self.histogram_table} WHERE {' AND '.join(where)}",
+                params,
+            )
+        except sqlite3.OperationalError as e:
+            print(f"[sqlite_source] {self.db_path.name}: {e} (rebuild with sqlite_source.py)")
+            rows = []
+        return price_stats.merge_histograms(
+            ((r["region"], r["bizcircle"], r["year_month"], np.asarray(json.loads(r["counts"])))
+             for r in rows),
+            metric,
+        )
+
+    # --- 筛选项计数 ---
+    def facets(self, filters: Dict[str, Optional[str]], community: Optional[str] = None):
+        """每个维度一条 GROUP BY（套用其他维度的筛选条件），走 (维度, deal_date) 索引"""
+        def where_of(skip=None):
+            where, params = ["1 = 1"], []
+            if community:
+                where.append("instr(community, ?) > 0")
+                params.append(community)
+            for dim, value in filters.items():
+                if value and dim != skip:
+                    where.append(f"{dim} = ?")
+                    params.append(value)
+            return where, params
+
+        counts = {}
+        for dim in price_stats.FACET_DIMENSIONS:
+            where, params = where_of(skip=dim)
+            rows = self.sql.query_all(
+                f"SELECT {dim} AS value, COUNT(*) AS count FROM {self.table} "
+                f"WHERE {' AND '.join(where)} AND {dim} IS NOT NULL GROUP BY {dim}",
+                params,
+            )
+            counts[dim] = [(r["value"], r["count"]) for r in rows]
+
+        where, params = where_of()
+        total = self.sql.query_one(
+            f"SELECT COUNT(*) AS count FROM {self.table} WHERE {' AND '.join(where)}", params
+        )
+        return price_stats.build_facets(total["count"] if total else 0, counts)
+
+    # --- 聚合立方体 ---
+    def cube_cells(self) -> Optional[CubeCells]:
+        """读出全部立方体格子；旧版本生成的文件没有格子表时返回 None"""
+        try:
+            rows = self.sql.query_all(f"SELECT {', '.join(CELL_FIELDS)} FROM {self.cube_table}")
+        except sqlite3.OperationalError as e:
+            print(f"[sqlite_source] {self.db_path.name}: {e} (rebuild with sqlite_source.py)")
+            return None
+        return CubeCells.from_cells([tuple(r[name] for name in CELL_FIELDS) for r in rows])
+
+    # --- 可比成交 ---
+    def comps_index(self) -> CompsIndex:
+        """读出全部成交的特征列 -> 可比成交索引（row_id 为 src_index，与列表 id 一致）"""
+        rows = self.sql.query_all(
+            f"SELECT src_index AS id, bizcircle, layout, area_sqm, unit_price_yuan_sqm, deal_date "
+            f"FROM {self.table}"
+        )
+        return CompsIndex(
+            row_ids=[r["id"] for r in rows],
+            bizcircles=[r["bizcircle"] for r in rows],
+            layouts=[r["layout"] for r in rows],
+            areas=[r["area_sqm"] or 0.0 for r in rows],
+            unit_prices=[r["unit_price_yuan_sqm"] or 0 for r in rows],
+            days=[date.fromisoformat(r["deal_date"]).toordinal() if r["deal_date"] else -1 for r in rows],
+        )
+
+    def listings_by_ids(self, row_ids: List[int]) -> Dict[int, Dict]:
+        """按列表 id 取记录 {id: item}，走 src_index 主键"""
+        if not row_ids:
+            return {}
+        rows = self.sql.query_all(
+            f"SELECT src_index AS _row_id, {', '.join(LISTING_COLUMNS)} FROM {self.table} "
+            f"WHERE src_index IN ({', '.join('?' * len(row_ids))})",
+            list(row_ids),
+        )
+        return {r.pop("_row_id"): r for r in rows}
+
+    # --- 全城热力图 ---
+    def price_heatmap(
+        self,
+        dimension: str = "bizcircle",
+        start_month: str = "2023-01",
+        end_month: str = "2025-12",
+    ) -> Dict[str, object]:
+        """一条 GROUP BY 维度, year_month 的 SQL，结构同 price_stats.build_heatmap"""
+        column = "bizcircle" if dimension == "bizcircle" else "region"
+        start_date, end_date = price_stats.month_range(start_month, end_month)
+        rows = self.sql.query_all(
+            f"SELECT {column} AS name, substr(deal_date, 1, 7) AS year_month, "
+            f"SUM(unit_price_yuan_sqm) AS sum_unit, SUM(total_price_wan) AS sum_total, "
+            f"COUNT(*) AS count FROM {self.table} "
+            f"WHERE deal_date >= ? AND deal_date < ? AND trim({column}) != '' "
+            f"GROUP BY {column}, year_month",
+            [start_date.isoformat(), end_date.isoformat()],
+        )
+        cells = {(r["name"], r["year_month"]): (r["sum_unit"], r["sum_total"], r["count"]) for r in rows}
+        return price_stats.build_heatmap(
+            dimension, price_stats.month_labels(start_month, end_month), cells
+        )
+
+    # --- 商圈列表 ---
+    def bizcircles(self) -> List[str]:
+        rows = self.sql.query_all(
+            f"SELECT DISTINCT bizcircle FROM {self.table} WHERE bizcircle IS NOT NULL"
+        )
+        return sorted({r["bizcircle"].strip() for r in rows if r["bizcircle"] and r["bizcircle"].strip()})
+
+
+_SOURCES: Dict[str, Tuple[int, Optional[SQLiteCitySource]]] = {}  # city_code -> (mtime, source)
+
+
+def get_city_source(city_code: str) -> Optional[SQLiteCitySource]:
+    """城市有非空的 SQLite 文件时返回数据源，否则返回 None（调用方回退 JSON）"""
+    city_code = (city_code or "").strip().lower()
+    path = city_db_path(city_code)
+    try:
+        mtime = path.stat().st_mtime_ns
+    except OSError:
+        return None
+
+    cached = _SOURCES.get(city_code)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    source = None
+    table = city_table_name(city_code)
+    try:
+        sql = MiniSQL(str(path))
+        exists = sql.query_one(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+        )
+        if exists and sql.query_one(f"SELECT 1 AS ok FROM {table} LIMIT 1"):
+            columns = {r["name"] for r in sql.query_all(f"PRAGMA table_info({table})")}
+            if "src_index" in columns:
+                source = SQLiteCitySource(city_code, path, table)
+            else:
+                # 旧版本生成的文件以 rowid 作列表 id，与 JSON 下标可能对不上，回退 JSON，提示重新生成
+                print(f"[sqlite_source] {path.name} has no src_index column, "
+                      f"rebuild it with: python sqlite_source.py {city_code}")
+    except Exception as e:
+        print(f"[sqlite_source] cannot open {path}: {e}")
+
+    _SOURCES[city_code] = (mtime, source)
+    return source
+
+
+def has_any_city(city_codes) -> bool:
+    return any(get_city_source(c) is not None for c in city_codes)
+
+
+# === 从 JSON 生成数据库 ===
+def _iter_rows(items):
+    """JSON 记录 -> 插入行；非 dict 的记录与 JSON 回退、列式缓存一样按空记录保留，src_index 始终等于数组下标"""
+    for src_index, item in enumerate(items):
+        raw = item if isinstance(item, dict) else {}
+        d_obj = price_stats._parse_date_any(raw.get("deal_date"))
+        yield (
+            src_index,
+            str(raw["house_id"]) if raw.get("house_id") is not None else None,
+            raw.get("region") or raw.get("region_name"),
+            raw.get("bizcircle"),
+            raw.get("community"),
+            raw.get("detail_url"),
+            price_stats._as_float(raw.get("total_price_wan"), 0.0),
+            price_stats._as_int(raw.get("unit_price_yuan_sqm"), 0),
+            raw.get("layout"),
+            raw.get("room_count"),
+            raw.get("hall_count"),
+            price_stats._as_float(raw.get("area_sqm"), 0.0),
+            raw.get("orientation"),
+            raw.get("building_year"),
+            raw.get("floor"),
+            d_obj.isoformat() if d_obj else None,
+            raw.get("crawl_time"),
+            json.dumps(item, ensure_ascii=False),
+        )
+
+
+def build_city_db(city_code: str, json_path: Path, db_path: Optional[Path] = None) -> int:
+    """
+    读取城市 JSON，写到临时文件后原子替换 db_path，返回写入行数。
+    每条记录带上它在 JSON 数组中的下标（src_index），列表 id、游标、排序与 JSON 回退一致。
+    """
+    db_path = Path(db_path or city_db_path(city_code))
+    table = city_table_name(city_code)
+
+    with json_path.open("r", encoding="utf-8") as f:
+        obj = json.load(f)
+    if isinstance(obj, dict):
+        obj = obj.get("items") or obj.get("data") or []
+    if not isinstance(obj, list):
+        raise ValueError(f"unexpected JSON structure in {json_path}")
+
+    tmp_path = db_path.with_name(db_path.name + ".tmp")
+    for p in (tmp_path, Path(f"{tmp_path}-wal"), Path(f"{tmp_path}-shm")):
+        if p.exists():
+            p.unlink()
+
+    sql = MiniSQL(str(tmp_path))
+    statements = _schema_sql(table)
+    sql.exec(statements[0])
+    count = sql.exec_many(
+        f"INSERT INTO {table} ("
+        "src_index, house_id, region, bizcircle, community, detail_url, total_price_wan, "
+        "unit_price_yuan_sqm, layout, room_count, hall_count, area_sqm, orientation, "
+        "building_year, floor, deal_date, crawl_time, raw_json"
+        ") VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        _iter_rows(obj),
+    )
+    for stmt in statements[1:]:
+        sql.exec(stmt)
+
+    # 分位数草图：按表内全部记录分格（与 JSON 回退相同，house_id 重复的记录也计入）
+    cells = price_stats.build_cell_sketches(
+        (r["region"], r["bizcircle"], r["year_month"], r["unit_price_yuan_sqm"], r["total_price_wan"])
+        for r in sql.query_all(
+            f"SELECT region, bizcircle, substr(deal_date, 1, 7) AS year_month, "
+            f"unit_price_yuan_sqm, total_price_wan FROM {table} "
+            f"WHERE deal_date IS NOT NULL ORDER BY src_index"
+        )
+    )
+    sql.exec_many(
+        f"INSERT INTO {sketch_table_name(table)} "
+        "(region, bizcircle, year_month, count, unit_sketch, total_sketch) VALUES (?, ?, ?, ?, ?, ?)",
+        (
+            (region, bizcircle, year_month, count, unit_sketch.to_json(), total_sketch.to_json())
+            for region, bizcircle, year_month, count, unit_sketch, total_sketch in cells
+        ),
+    )
+    histograms = price_stats.build_cell_histograms(
+        (r["region"], r["bizcircle"], r["year_month"], r["unit_price_yuan_sqm"], r["area_sqm"])
+        for r in sql.query_all(
+            f"SELECT region, bizcircle, substr(deal_date, 1, 7) AS year_month, "
+            f"unit_price_yuan_sqm, area_sqm FROM {table} "
+            f"WHERE deal_date IS NOT NULL ORDER BY src_index"
+        )
+    )
+    sql.exec_many(
+        f"INSERT INTO {histogram_table_name(table)} "
+        "(region, bizcircle, year_month, metric, counts) VALUES (?, ?, ?, ?, ?)",
+        (
+            (region, bizcircle, year_month, metric, json.dumps(counts.tolist(), separators=(",", ":")))
+            for region, bizcircle, year_month, metric, counts in histograms
+        ),
+    )
+    cube = CubeCells.from_records([
+        (r["region"], r["bizcircle"], r["layout"], r["year_month"],
+         r["unit_price_yuan_sqm"], r["total_price_wan"])
+        for r in sql.query_all(
+            f"SELECT region, bizcircle, layout, substr(deal_date, 1, 7) AS year_month, "
+            f"unit_price_yuan_sqm, total_price_wan FROM {table} "
+            f"WHERE deal_date IS NOT NULL ORDER BY src_index"
+        )
+    ])
+    sql.exec_many(
+        f"INSERT INTO {cube_table_name(table)} ({', '.join(CELL_FIELDS)}) "
+        f"VALUES ({', '.join('?' * len(CELL_FIELDS))})",
+        cube.to_cells(),
+    )
+    sql.exec("ANALYZE")
+
+    # 合并 WAL 并切回单文件模式，再原子替换正式文件
+    conn = sql.connect()
+    try:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+        conn.execute("PRAGMA journal_mode=DELETE").fetchall()
+    finally:
+        conn.close()
+    for p in (Path(f"{db_path}-wal"), Path(f"{db_path}-shm")):
+        if p.exists():
+            p.unlink()
+    os.replace(tmp_path, db_path)
+    _SOURCES.pop(city_code, None)
+    return count
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    data_dir = DATA_DIR
+    wanted = {c.strip().lower() for c in argv if c.strip()}
+
+    built = 0
+    for fn in sorted(os.listdir(data_dir)):
+        m = re.match(r"crawl_history_([A-Za-z0-9]+)\.json$", fn)
+        if not m:
+            continue
+        city_code = m.group(1).lower()
+        if wanted and city_code not in wanted:
+            continue
+        db_path = city_db_path(city_code)
+        n = build_city_db(city_code, data_dir / fn, db_path)
+        print(f"Built {db_path.name} ({city_table_name(city_code)}): {n} rows")
+        built += 1
+
+    if not built:
+        print("No matching crawl_history_*.json found.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""
+合成成交数据生成器（基准测试用）
+仓库里只有一份约 5 千条的真实数据（data/crawl_history_shenzhen.json），看不出各函数在 10 万、100 万、
+1000 万条时的表现。这里按同样的字段与文件格式（JSON 数组，indent=2，中文不转义）生成任意规模的城市文件：
+- 区域 / 商圈 / 小区三级结构：区域 10 个，每个区域 6–18 个商圈，小区数随规模增长（约每 60 条一个，300–40000），
+  成交量按类 Zipf 分布集中在少数热门商圈 / 小区
+- 成交日期 2018-01 ~ 2025-12，近年成交多、每年 2 月偏少
+- 单价 = 城市基准 × 区域 / 商圈 / 小区系数 × 按月的价格走势 × 单笔噪声（对数正态）；
+  面积随户型变化，总价（万元，取整）与单价的换算方式和真实数据一致（单价 = 总价 × 10000 / 面积）
+- 脏数据（比例由 messy 控制）：日期写成 2024/05/06、2024.05.06、带时间或无法解析，数字写成字符串或缺失，
+  户型缺失，区域字段写成 region_name —— 都是 normalize_item / 列式缓存需要兼容的情况
+- 同一个 seed 生成的文件逐字节相同（按固定大小分块，每块的随机数种子由 seed 与块号决定）
+
+用法：
+    cd backend
+    python synthetic_data.py --rows 1000000                      # 写到 ../data/crawl_history_syn1m.json
+    python synthetic_data.py --rows 100000 --city syn --seed 7 --out /tmp/hpqaq-data
+"""
+import argparse
+import json
+import os
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+DEFAULT_SEED = 20240501
+DEFAULT_MESSY = 0.02
+
+# 每块生成的记录数（影响随机数序列，改动后同一 seed 的输出会变）
+CHUNK_ROWS = 50_000
+
+START_MONTH = 2018 * 12 + 0   # 2018-01
+END_MONTH = 2025 * 12 + 11    # 2025-12
+
+CITY_BASE_UNIT_PRICE = 52000  # 元/平米
+
+_NAME_CHARS = "龙华坪山光明大鹏宝安福田南罗湖盐田前海蛇口科技园西丽桃源梅林景田香蜜湖车公庙华强北园岭布吉横岗平湖观澜民治坂田石岩沙井松岗新安西乡福永公明凤凰翠竹东门笋岗清水河莲塘沙头角"
+_COMMUNITY_SUFFIXES = ("花园", "苑", "府", "小区", "名苑", "华庭", "公馆", "新村", "家园", "城", "山庄", "雅居")
+_ORIENTATIONS = ("南", "东南", None, "西南", "北", "东北", "西北", "东", "西", "南 北")
+_ORIENTATION_P = (0.33, 0.27, 0.13, 0.10, 0.04, 0.04, 0.035, 0.03, 0.015, 0.01)
+_ROOMS = (1, 2, 3, 4, 5, 6)
+_ROOMS_P = (0.09, 0.22, 0.40, 0.20, 0.07, 0.02)
+
+
+def parse_rows(text: str) -> int:
+    """"100k" / "1m" / "10M" / "250000" -> 条数"""
+    text = text.strip().lower().replace("_", "")
+    for suffix, factor in (("k", 1_000), ("m", 1_000_000)):
+        if text.endswith(suffix):
+            return int(float(text[:-1]) * factor)
+    return int(text)
+
+
+def rows_label(rows: int) -> str:
+    """条数 -> 100k / 1m 这样的短标签（用于城市代码）"""
+    if rows % 1_000_000 == 0:
+        return f"{rows // 1_000_000}m"
+    if rows % 1_000 == 0:
+        return f"{rows // 1_000}k"
+    return str(rows)
+
+
+def _zipf_weights(rng: np.random.Generator, n: int, s: float = 0.8) -> np.ndarray:
+    w = 1.0 / np.arange(1, n + 1) ** s
+    rng.shuffle(w)
+    return w / w.sum()
+
+
+def _unique_names(rng: np.random.Generator, count: int, length: int, suffixes=("",), taken=None) -> List[str]:
+    taken = set() if taken is None else taken
+    names = []
+    while len(names) < count:
+        chars = rng.choice(list(_NAME_CHARS), size=length)
+        name = "".join(chars) + suffixes[int(rng.integers(len(suffixes)))]
+        if name not in taken:
+            taken.add(name)
+            names.append(name)
+    return names
+
+
+class CityModel:
+    """一座合成城市：区域 / 商圈 / 小区及其价格系数、成交量权重、按月价格走势"""
+
+    def __init__(self, rows: int, seed: int = DEFAULT_SEED):
+        rng = np.random.default_rng([seed, 0])
+        self.regions = [name + "区" for name in _unique_names(rng, 10, 2)]
+        region_factor = rng.lognormal(0.0, 0.35, len(self.regions))
+
+        self.biz_names: List[str] = []
+        self.biz_region: List[int] = []
+        biz_factor = []
+        taken = set()
+        for r, factor in enumerate(region_factor):
+            n = int(rng.integers(6, 19))
+            self.biz_names += _unique_names(rng, n, int(rng.integers(2, 4)), taken=taken)
+            self.biz_region += [r] * n
+            biz_factor += list(factor * rng.lognormal(0.0, 0.2, n))
+        self.biz_region = np.array(self.biz_region)
+
+        n_comm = int(min(max(rows // 60, 300), 40_000))
+        self.comm_names = _unique_names(rng, n_comm, int(rng.integers(2, 5)), _COMMUNITY_SUFFIXES)
+        # 小区按权重分到商圈，热门商圈小区也多
+        self.biz_weights = _zipf_weights(rng, len(self.biz_names), 0.7)
+        self.comm_biz = rng.choice(len(self.biz_names), size=n_comm, p=self.biz_weights)
+        self.comm_weights = _zipf_weights(rng, n_comm, 0.8)
+        self.comm_factor = np.array(biz_factor)[self.comm_biz] * rng.lognormal(0.0, 0.15, n_comm)
+
+        # 按月：成交量权重（逐年增长、2 月偏少）与价格指数（2021 年见顶后回落）
+        months = np.arange(START_MONTH, END_MONTH + 1)
+        years = months // 12 + (months % 12) / 12.0
+        volume = 0.6 + 0.08 * (years - 2018)
+        volume[months % 12 == 1] *= 0.55
+        self.months = months
+        self.month_weights = volume / volume.sum()
+        self.price_index = np.where(years < 2021.5, 0.85 + 0.1 * (years - 2018), 1.2 - 0.08 * (years - 2021.5))
+
+    def chunk(self, index: int, start: int, count: int, seed: int, messy: float) -> List[Dict]:
+        """第 index 块（全局序号从 start 开始的 count 条记录）"""
+        rng = np.random.default_rng([seed, index + 1])
+        comm = rng.choice(len(self.comm_names), size=count, p=self.comm_weights)
+        biz = self.comm_biz[comm]
+        region = self.biz_region[biz]
+
+        month_idx = rng.choice(len(self.months), size=count, p=self.month_weights)
+        month = self.months[month_idx]
+        day = (rng.random(count) * 28).astype(int) + 1
+
+        rooms = rng.choice(_ROOMS, size=count, p=_ROOMS_P)
+        halls = np.where(rooms >= 3, 2, 1) - (rng.random(count) < 0.25).astype(int) + (rng.random(count) < 0.05)
+        halls = np.maximum(halls, 0)
+        area = np.round(rng.lognormal(np.log(22.0 + 27.0 * rooms), 0.22), 2)
+
+        unit = CITY_BASE_UNIT_PRICE * self.comm_factor[comm] * self.price_index[month_idx] * rng.lognormal(0.0, 0.08, count)
+        total = np.maximum(np.round(unit * area / 10000.0), 1.0)
+        unit = np.round(total * 10000.0 / area).astype(int)
+
+        orientation = rng.choice(len(_ORIENTATIONS), size=count, p=_ORIENTATION_P)
+        messy_kind = np.where(rng.random(count) < messy, rng.integers(1, 9, count), 0)
+
+        crawl_base = datetime(2025, 12, 17)
+        items = []
+        for i in range(count):
+            gid = start + i
+            house_id = str(3_000_000 + gid * 7 % 9_000_000 + gid // 9_000_000 * 10_000_000)
+            m = int(month[i])
+            deal = date(m // 12, m % 12 + 1, int(day[i]))
+            item = {
+                "region": self.regions[region[i]],
+                "bizcircle": self.biz_names[biz[i]],
+                "community": self.comm_names[comm[i]],
+                "house_id": house_id,
+                "detail_url": f"/chengjiao/{house_id}_1_2.htm",
+                "total_price_wan": float(total[i]),
+                "unit_price_yuan_sqm": int(unit[i]),
+                "layout": f"{rooms[i]}室{halls[i]}厅",
+                "room_count": int(rooms[i]),
+                "hall_count": int(halls[i]),
+                "area_sqm": float(area[i]),
+                "orientation": _ORIENTATIONS[orientation[i]],
+                "building_year": None,
+                "floor": None,
+                "deal_date": deal.isoformat(),
+                "crawl_time": (crawl_base + timedelta(seconds=gid // 3)).isoformat(),
+            }
+            kind = messy_kind[i]
+            if kind:
+                _make_messy(item, int(kind), deal)
+            items.append(item)
+        return items
+
+
+def _make_messy(item: Dict, kind: int, deal: date) -> None:
+    if kind == 1:
+        item["deal_date"] = deal.strftime("%Y/%m/%d")
+    elif kind == 2:
+        item["deal_date"] = deal.strftime("%Y.%m.%d")
+    elif kind == 3:
+        item["deal_date"] = deal.strftime("%Y-%m-%d") + " 00:00:00"
+    elif kind == 4:
+        item["deal_date"] = ["", None, f"{deal.year}年{deal.month}月"][deal.day % 3]
+    elif kind == 5:
+        item["total_price_wan"] = str(item["total_price_wan"])
+        item["unit_price_yuan_sqm"] = str(item["unit_price_yuan_sqm"])
+    elif kind == 6:
+        item["area_sqm"] = None if deal.day % 2 else ""
+        item["unit_price_yuan_sqm"] = None
+    elif kind == 7:
+        item["layout"] = None
+        item["room_count"] = None
+        item["hall_count"] = None
+    else:
+        item["region_name"] = item.pop("region")
+
+
+def generate_items(rows: int, seed: int = DEFAULT_SEED, messy: float = DEFAULT_MESSY) -> Iterator[List[Dict]]:
+    """按块产出记录列表（每块最多 CHUNK_ROWS 条）"""
+    model = CityModel(rows, seed)
+    for index, start in enumerate(range(0, rows, CHUNK_ROWS)):
+        yield model.chunk(index, start, min(CHUNK_ROWS, rows - start), seed, messy)
+
+
+def write_city_file(path: Path, rows: int, seed: int = DEFAULT_SEED, messy: float = DEFAULT_MESSY) -> Path:
+    """流式写出城市 JSON 文件（先写临时文件再改名，不会留下半个文件）"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".json.tmp")
+    first = True
+    with tmp.open("w", encoding="utf-8") as f:
+        f.write("[")
+        for items in generate_items(rows, seed, messy):
+            for item in items:
+                f.write("\n" if first else ",\n")
+                first = False
+                f.write("  " + json.dumps(item, ensure_ascii=False, indent=2).replace("\n", "\n  "))
+        f.write("\n]" if not first else "]")
+    os.replace(tmp, path)
+    return path
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Generate a synthetic city transaction file")
+    parser.add_argument("--rows", default="100k", help="条数，支持 100k / 1m 写法")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--messy", type=float, default=DEFAULT_MESSY, help="脏数据比例（0–1）")
+    parser.add_argument("--city", help="城市代码，默认 syn<规模>，文件名为 crawl_history_<city>.json")
+    parser.add_argument("--out", default=str(Path(__file__).resolve().parent.parent / "data"), help="输出目录")
+    args = parser.parse_args(argv)
+
+    rows = parse_rows(args.rows)
+    city = args.city or f"syn{rows_label(rows)}"
+    path = write_city_file(Path(args.out) / f"crawl_history_{city}.json", rows, args.seed, args.messy)
+    print(f"[synthetic] {rows} rows -> {path} ({path.stat().st_size / 1e6:.1f} MB)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -25,6 +25,9 @@
     fBizcircle: $("f-bizcircle"),
     fCommunity: $("f-community"),
     fLayout: $("f-layout"),
+    dlRegion: $("dl-region"),
+    dlBizcircle: $("dl-bizcircle"),
+    dlLayout: $("dl-layout"),
     btnSearch: $("btn-search"),
     btnReset: $("btn-reset"),
 
@@ -75,6 +78,7 @@
     // request controllers
     ctrlList: null,
     ctrlTrend: null,
+    ctrlFacets: null,
     ctrlNews: null,
 
     // modal / nav
@@ -1000,6 +1004,25 @@
     }
   }
 
+  // ===== 筛选项候选（/api/facets：当前筛选条件下每个取值的记录数，0 条的不显示） =====
+  async function loadFacets(q) {
+    if (state.ctrlFacets) state.ctrlFacets.abort();
+    state.ctrlFacets = new AbortController();
+
+    const data = await apiGet(
+      "/api/facets",
+      { city: q.city, region: q.region, bizcircle: q.bizcircle, community: q.community, layout: q.layout },
+      { signal: state.ctrlFacets.signal }
+    );
+    const lists = { region: els.dlRegion, bizcircle: els.dlBizcircle, layout: els.dlLayout };
+    for (const [dim, el] of Object.entries(lists)) {
+      if (!el) continue;
+      el.innerHTML = (data.facets?.[dim] || [])
+        .map((f) => `<option value="${escapeHtml(f.value)}" label="${escapeHtml(`${f.value} (${f.count})`)}"></option>`)
+        .join("");
+    }
+  }
+
   async function loadListingsAndTrend() {
     const q = getQuery();
     if (!q.city) {
@@ -1080,6 +1103,9 @@
       renderTrendList([], q.city);
     }
 
+    // facets（失败不影响列表）
+    loadFacets(q).catch(() => void 0);
+
     // news (节流在 loadNews 内)
     loadNews(q.city).catch(() => void 0);
   }
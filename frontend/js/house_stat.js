@@ -52,6 +52,10 @@
     btnViewLine: $("btn-view-line"),
     btnViewBox: $("btn-view-box"),
     btnViewTable: $("btn-view-table"),
+    btnViewHistogram: $("btn-view-histogram"),
+    btnViewHeatmap: $("btn-view-heatmap"),
+    heatmapDimension: $("heatmap-dimension"),
+    statHeatmapWrap: $("stat-heatmap-wrap"),
 
     // ui
     toast: $("toast"),
@@ -105,6 +109,16 @@
     return res.json();
   }
 
+  async function apiPost(path, body = {}) {
+    const res = await fetch(path, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify(body),
+    });
+    if (!res.ok) throw new Error(`HTTP ${res.status}`);
+    return res.json();
+  }
+
   // ===== 数字格式化 =====
   function fmtNum0(n) {
     if (n == null || n === "") return "-";
@@ -318,16 +332,17 @@
     setMeta("加载对比数据中...");
 
     try {
-      const requests = targets.map(target => {
-        const params = { city: target.city, start_month: startMonthStr, end_month: endMonthStr };
-        if (target.bizcircle) params.bizcircle = target.bizcircle;
-        return apiGet("/api/historical_avg_price", params).then(res => ({
-          ...target,
-          data: res.ok ? res.data : []
-        }));
+      // 一次批量请求：后端对同一城市只扫描一次数据
+      const res = await apiPost("/api/historical_avg_price/batch", {
+        series: targets.map(target => ({ city: target.city, bizcircle: target.bizcircle })),
+        start_month: startMonthStr,
+        end_month: endMonthStr,
       });
-
-      const results = await Promise.all(requests);
+      const series = (res.ok && res.series) || [];
+      const results = targets.map((target, i) => ({
+        ...target,
+        data: (series[i] && series[i].data) || []
+      }));
       renderCompareData(results, compareType, startMonthStr, endMonthStr);
       setMeta(`对比完成：共 ${results.length} 个地区`);
     } catch (e) {
@@ -1067,11 +1082,27 @@
     const { data, city, bizcircle } = state.currentData;
 
     // 更新按钮状态
-    [els.btnViewBar, els.btnViewLine, els.btnViewBox, els.btnViewTable].forEach(btn => {
+    [els.btnViewBar, els.btnViewLine, els.btnViewBox, els.btnViewTable, els.btnViewHistogram, els.btnViewHeatmap].forEach(btn => {
       if (btn) btn.classList.remove('primary');
     });
+    if (els.statHeatmapWrap) els.statHeatmapWrap.style.display = 'none';
+    if (els.heatmapDimension) els.heatmapDimension.style.display = 'none';
 
-    if (viewType === 'table') {
+    if (viewType === 'heatmap') {
+      // 显示全城热力图
+      if (els.chartContainer) els.chartContainer.style.display = 'none';
+      if (els.statTableWrap) els.statTableWrap.style.display = 'none';
+      if (els.statHeatmapWrap) els.statHeatmapWrap.style.display = 'block';
+      if (els.heatmapDimension) els.heatmapDimension.style.display = 'inline-block';
+      if (els.btnViewHeatmap) els.btnViewHeatmap.classList.add('primary');
+      renderHeatmap();
+    } else if (viewType === 'histogram') {
+      // 显示价格分布（单价直方图）
+      if (els.chartContainer) els.chartContainer.style.display = 'block';
+      if (els.statTableWrap) els.statTableWrap.style.display = 'none';
+      if (els.btnViewHistogram) els.btnViewHistogram.classList.add('primary');
+      renderHistogram();
+    } else if (viewType === 'table') {
       // 显示表格
       if (els.chartContainer) els.chartContainer.style.display = 'none';
       if (els.statTableWrap) els.statTableWrap.style.display = 'block';
@@ -1089,6 +1120,148 @@
     }
   }
 
+  // ===== 价格分布（单价直方图） =====
+  async function renderHistogram() {
+    if (!state.currentData || !els.statChart) return;
+    const { city, bizcircle, startMonth, endMonth } = state.currentData;
+    const scope = bizcircle ? `${cityName(city)} - ${bizcircle}` : cityName(city);
+
+    setMeta("查询价格分布...");
+    try {
+      const params = { city, start_month: startMonth, end_month: endMonth };
+      if (bizcircle) params.bizcircle = bizcircle;
+      const result = await apiGet("/api/price_histogram", params);
+      if (state.currentView !== 'histogram') return;
+      if (!result.ok || !result.total) {
+        setMeta("价格分布无数据");
+        return;
+      }
+
+      // 去掉两端的空箱，低于下限 / 超出上限的条数放在标题里
+      const nonEmpty = result.counts.map((c, i) => (c > 0 ? i : -1)).filter(i => i >= 0);
+      const from = nonEmpty.length ? nonEmpty[0] : 0;
+      const to = nonEmpty.length ? nonEmpty[nonEmpty.length - 1] : -1;
+      const labels = [];
+      for (let i = from; i <= to; i++) {
+        labels.push(`${fmtNum0(result.edges[i])}-${fmtNum0(result.edges[i + 1])}`);
+      }
+      const outside = result.below + result.above;
+
+      if (state.chartInstance) {
+        state.chartInstance.destroy();
+      }
+      state.chartInstance = new Chart(els.statChart.getContext('2d'), {
+        type: 'bar',
+        data: {
+          labels,
+          datasets: [{
+            label: '成交套数',
+            data: result.counts.slice(from, to + 1),
+            backgroundColor: 'rgba(121, 97, 255, 0.7)',
+            borderColor: 'rgba(121, 97, 255, 1)',
+            borderWidth: 1,
+            barPercentage: 1.0,
+            categoryPercentage: 1.0,
+          }]
+        },
+        options: {
+          responsive: true,
+          maintainAspectRatio: false,
+          plugins: {
+            title: {
+              display: true,
+              text: `${scope} 单价分布（元/㎡，共 ${result.total} 套${outside ? `，区间外 ${outside} 套` : ''}）`,
+              color: 'rgba(234, 240, 255, 0.9)',
+              font: { size: 16 }
+            },
+            legend: {
+              labels: { color: 'rgba(234, 240, 255, 0.8)' }
+            }
+          },
+          scales: {
+            x: {
+              ticks: { color: 'rgba(234, 240, 255, 0.7)' },
+              grid: { color: 'rgba(255, 255, 255, 0.1)' }
+            },
+            y: {
+              beginAtZero: true,
+              ticks: { color: 'rgba(234, 240, 255, 0.7)' },
+              grid: { color: 'rgba(255, 255, 255, 0.1)' }
+            }
+          }
+        }
+      });
+      setMeta(`价格分布：${result.total} 套`);
+    } catch (e) {
+      toast(e.message || "加载价格分布失败");
+      setMeta("查询失败");
+      console.error("Failed to load price histogram:", e);
+    }
+  }
+
+  // ===== 全城热力图（商圈/区域 × 月份） =====
+  function heatColor(value, min, max) {
+    // 低价偏蓝、高价偏红
+    const t = max > min ? (value - min) / (max - min) : 0.5;
+    const hue = Math.round(210 - 210 * t);
+    return `hsla(${hue}, 70%, 45%, 0.75)`;
+  }
+
+  async function renderHeatmap() {
+    if (!state.currentData || !els.statHeatmapWrap) return;
+    const { city, startMonth, endMonth } = state.currentData;
+    const dimension = els.heatmapDimension?.value || "bizcircle";
+
+    els.statHeatmapWrap.innerHTML = '<div style="padding: 1rem; color: rgba(234,240,255,.6);">加载中...</div>';
+    setMeta("查询热力图...");
+
+    try {
+      const result = await apiGet("/api/price_heatmap", {
+        city, dimension, start_month: startMonth, end_month: endMonth,
+      });
+      if (!result.ok || !result.names.length) {
+        els.statHeatmapWrap.innerHTML = '<div style="padding: 1rem; color: rgba(234,240,255,.6);">暂无统计数据</div>';
+        setMeta("热力图无数据");
+        return;
+      }
+
+      const values = result.avg_unit_price_yuan_sqm.flat().filter(v => v != null);
+      const min = Math.min(...values);
+      const max = Math.max(...values);
+      const dimLabel = dimension === "region" ? "区域" : "商圈";
+
+      const head = result.months
+        .map(m => `<th class="num" style="white-space: nowrap;">${m}</th>`)
+        .join("");
+      const body = result.names
+        .map((name, i) => {
+          const cells = result.months
+            .map((m, j) => {
+              const v = result.avg_unit_price_yuan_sqm[i][j];
+              if (v == null) return '<td class="num" style="color: rgba(234,240,255,.25);">-</td>';
+              const tip = `${name} ${m}\n平均单价 ${fmtNum0(v)} 元/㎡\n平均总价 ${fmtPrice(result.avg_total_price_wan[i][j])} 万元\n样本 ${result.count[i][j]}`;
+              return `<td class="num" title="${tip}" style="background: ${heatColor(v, min, max)};">${fmtNum0(v)}</td>`;
+            })
+            .join("");
+          return `<tr><td style="white-space: nowrap;"><strong>${name}</strong> <span style="color: rgba(234,240,255,.45);">(${result.row_count[i]})</span></td>${cells}</tr>`;
+        })
+        .join("");
+
+      els.statHeatmapWrap.innerHTML = `
+        <table class="table">
+          <thead><tr><th>${dimLabel}</th>${head}</tr></thead>
+          <tbody>${body}</tbody>
+        </table>
+      `;
+      setMeta(`热力图：${result.names.length} 个${dimLabel} × ${result.months.length} 个月`);
+    } catch (e) {
+      els.statHeatmapWrap.innerHTML = "";
+      toast(e.message || "加载热力图失败");
+      setMeta("查询失败");
+      console.error("Failed to load price heatmap:", e);
+    }
+  }
+
   // ===== 切换对比视图 =====
   function switchCompareView(viewType) {
     if (!state.compareData) return;
@@ -1097,9 +1270,11 @@
     const { results } = state.compareData;
 
     // 更新按钮状态
-    [els.btnViewBar, els.btnViewLine, els.btnViewCombo, els.btnViewTable].forEach(btn => {
+    [els.btnViewBar, els.btnViewLine, els.btnViewCombo, els.btnViewTable, els.btnViewHistogram, els.btnViewHeatmap].forEach(btn => {
       if (btn) btn.classList.remove('primary');
     });
+    if (els.statHeatmapWrap) els.statHeatmapWrap.style.display = 'none';
+    if (els.heatmapDimension) els.heatmapDimension.style.display = 'none';
 
     if (viewType === 'table') {
       // 显示表格
@@ -1291,6 +1466,25 @@
     }
   });
 
+  els.btnViewHistogram?.addEventListener("click", () => {
+    if (state.compareData) {
+      toast("价格分布仅支持单地区模式");
+    } else {
+      switchView('histogram');
+    }
+  });
+
+  els.btnViewHeatmap?.addEventListener("click", () => {
+    if (state.compareData) {
+      toast("热力图仅支持单地区模式");
+    } else {
+      switchView('heatmap');
+    }
+  });
+  els.heatmapDimension?.addEventListener("change", () => {
+    if (state.currentView === 'heatmap') renderHeatmap();
+  });
+
   // ===== 初始化 =====
   (async function init() {
     try {